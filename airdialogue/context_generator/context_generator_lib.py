@@ -17,21 +17,68 @@
 
 
 import copy
-import json
+import multiprocessing
+import queue
 import random
+import shutil
+import threading
 import numpy as np
-from tensorflow.compat.v1 import gfile
+from airdialogue import file_io
+from airdialogue import profiling
+from airdialogue import record_writer
 from airdialogue.context_generator.src import customer
 from airdialogue.context_generator.src import facts
 from airdialogue.context_generator.src import kb as knowledgebase
+from airdialogue.context_generator.src import target_status
 from airdialogue.context_generator.src import utils
 
 
+def _get_shard_seeds(seed, num_shards):
+  """derives an independent seed for each shard from the global seed."""
+  seed_sequences = np.random.SeedSequence(seed).spawn(num_shards)
+  return [int(s.generate_state(1)[0]) for s in seed_sequences]
+
+
+def _generate_shard(args):
+  """generates one shard of contexts. this runs inside a worker process."""
+  context_generator, seed, kwargs = args
+  random.seed(seed)
+  np.random.seed(seed)
+  return context_generator._generate_context(**kwargs)  # pylint: disable=protected-access
+
+
+def _get_shard_path(path, index):
+  """inserts the shard index before the compression suffix of path."""
+  suffix = ""
+  for compression_suffix in record_writer.COMPRESSION_SUFFIXES:
+    if path.endswith(compression_suffix):
+      path, suffix = path[:-len(compression_suffix)], compression_suffix
+  return "{0}.shard-{1:05d}{2}".format(path, index, suffix)
+
+
+def _merge_shards(shard_files, output_file):
+  # gzip members and zstd frames can be concatenated, so shards are copied as
+  # they are even if they are compressed.
+  with file_io.Open(output_file, "wb") as f_out:
+    for shard_file in shard_files:
+      with file_io.Open(shard_file, "rb") as f_in:
+        shutil.copyfileobj(f_in, f_out)
+      file_io.Remove(shard_file)
+
+
 class ContextGenerator(object):
   """context generator."""
 
-  def __init__(self, num_candidate_airports, book_window, num_db_record,
-               firstname_file, lastname_file, airportcode_file):
+  def __init__(self,
+               num_candidate_airports,
+               book_window,
+               num_db_record,
+               firstname_file,
+               lastname_file,
+               airportcode_file,
+               vectorized_kb=False,
+               kb_batch_size=1000,
+               seed=None):
     self.fact_obj = facts.Facts(firstname_file, lastname_file, airportcode_file)
     # number of airports to be considered when generating database.
     self.num_candidate_airports = num_candidate_airports
@@ -39,87 +86,311 @@ class ContextGenerator(object):
     self.book_window = book_window
     # number of database records
     self.num_db_record = num_db_record
+    # if true, knowledge bases are drawn kb_batch_size at a time with numpy.
+    self.vectorized_kb = vectorized_kb
+    self.kb_batch_size = kb_batch_size
+    # if seed is not none, every sample draws from its own generator derived
+    # from (seed, sample index), so any sample can be generated on demand.
+    self.seed = seed
 
-  def _generate_user_action(self, expected_action):
+  def _generate_user_action(self, expected_action, rng=None):
     user_action = copy.deepcopy(expected_action)
     if len(user_action["flight"]) != 0:
-      idx = random.randint(0, len(user_action["flight"]) - 1)
+      idx = utils.randint(0, len(user_action["flight"]) - 1, rng=rng)
       single_flight = user_action["flight"][idx]
       user_action["flight"] = [single_flight]
     return user_action
 
+  def _generate_customer(self, rng=None):
+    rand = np.random if rng is None else rng
+    airport_candidate = list(
+        rand.choice(
+            self.fact_obj.airport_list,
+            self.num_candidate_airports,
+            replace=False))
+    cus = customer.Customer(self.fact_obj, self.book_window, airport_candidate,
+                            rng)
+    return cus, airport_candidate
+
+  def get_sample_rng(self, index):
+    """returns the random generator of the sample at index."""
+    return np.random.default_rng([self.seed, index])
+
+  def _generate_customer_and_kb(self, num_context, start=0):
+    """yields (customer, knowledgebase, rng) triples.
+
+    rng is the generator of the sample if the generator is seed addressable and
+    None if the samples draw from the global random states.
+    """
+    if self.seed is not None:
+      for index in range(start, start + num_context):
+        rng = self.get_sample_rng(index)
+        with profiling.phase("customer"):
+          cus, airport_candidate = self._generate_customer(rng)
+        with profiling.phase("kb"):
+          if self.vectorized_kb:
+            kb = knowledgebase.generate_knowledgebases(
+                self.fact_obj, self.num_db_record, [airport_candidate],
+                [cus.departure_date], [cus.return_date], rng)[0]
+          else:
+            kb = knowledgebase.Knowledgebase(self.fact_obj, self.num_db_record,
+                                             airport_candidate,
+                                             cus.departure_date,
+                                             cus.return_date, rng)
+        yield cus, kb, rng
+      return
+    if start != 0:
+      raise ValueError("start requires a seed addressable context generator.")
+    if not self.vectorized_kb:
+      for _ in range(num_context):
+        with profiling.phase("customer"):
+          cus, airport_candidate = self._generate_customer()
+        with profiling.phase("kb"):
+          kb = knowledgebase.Knowledgebase(self.fact_obj, self.num_db_record,
+                                           airport_candidate,
+                                           cus.departure_date, cus.return_date)
+        yield cus, kb, None
+      return
+    for start in range(0, num_context, self.kb_batch_size):
+      batch_size = min(self.kb_batch_size, num_context - start)
+      with profiling.phase("customer"):
+        all_cus, all_airports = list(
+            zip(*[self._generate_customer() for _ in range(batch_size)]))
+      with profiling.phase("kb"):
+        all_kb = knowledgebase.generate_knowledgebases(
+            self.fact_obj, self.num_db_record, all_airports,
+            [cus.departure_date for cus in all_cus],
+            [cus.return_date for cus in all_cus])
+      for cus, kb in zip(all_cus, all_kb):
+        yield cus, kb, None
+
   def generate_context(self,
                        num_context,
                        output_data=None,
                        output_kb=None,
                        display_freq=None,
                        output_object=False,
-                       verbose=False):
-    """generate context. if output_file is not none then we write to file."""
-    if output_data and output_kb:
-      fp_data = gfile.Open(output_data, "w")
-      fp_kb = gfile.Open(output_kb, "w")
+                       verbose=False,
+                       num_workers=1,
+                       seed=None,
+                       start=0,
+                       status_distribution=None,
+                       json_encoder="json"):
+    """generate context. if output_file is not none then we write to file.
+
+    If num_workers is larger than one, num_context is split into num_workers
+    shards that are generated in a process pool. Every shard draws from its own
+    seed derived from seed, so the output is reproducible for a given seed and
+    number of workers. If the generator itself is seed addressable, seed is not
+    used, the output does not depend on the number of workers and generation
+    can begin at any sample index start. See iter_contexts for
+    status_distribution.
+
+    Files are written by a record_writer.RecordWriter with the given
+    json_encoder, and are compressed if their names end with .gz or .zst.
+    """
+    if num_workers <= 1:
+      if seed is not None:
+        shard_seed = _get_shard_seeds(seed, 1)[0]
+        random.seed(shard_seed)
+        np.random.seed(shard_seed)
+      all_context, status_stats = self._generate_context(
+          num_context, output_data, output_kb, display_freq, output_object,
+          verbose, start, status_distribution, json_encoder)
     else:
-      fp_data = None
-      fp_kb = None
-    all_context = []
-    status_stats = {}
-    for n in range(num_context):
-      airport_candidate = list(
-          np.random.choice(
-              self.fact_obj.airport_list,
-              self.num_candidate_airports,
-              replace=False))
+      if seed is None:
+        seed = np.random.randint(0, 2**31 - 1)
+      shard_sizes = [len(a) for a in np.array_split(range(num_context),
+                                                    num_workers)]
+      shard_starts = (start + np.cumsum([0] + shard_sizes[:-1])).tolist()
+      all_args = []
+      for i, shard_seed in enumerate(_get_shard_seeds(seed, num_workers)):
+        kwargs = {
+            "num_context": shard_sizes[i],
+            "start": shard_starts[i] if self.seed is not None else start,
+            "output_data": None,
+            "output_kb": None,
+            "display_freq": display_freq,
+            "output_object": output_object,
+            # only the first shard reports its progress
+            "verbose": verbose and i == 0,
+            "status_distribution": status_distribution,
+            "json_encoder": json_encoder
+        }
+        if output_data and output_kb:
+          kwargs["output_data"] = _get_shard_path(output_data, i)
+          kwargs["output_kb"] = _get_shard_path(output_kb, i)
+        all_args.append((self, shard_seed, kwargs))
+      pool = multiprocessing.Pool(num_workers)
+      try:
+        all_results = pool.map(_generate_shard, all_args)
+      finally:
+        pool.close()
+        pool.join()
+      all_context = []
+      status_stats = {}
+      for shard_context, shard_stats in all_results:
+        all_context.extend(shard_context)
+        for status in shard_stats:
+          status_stats[status] = status_stats.get(status,
+                                                  0) + shard_stats[status]
+      if output_data and output_kb:
+        _merge_shards([a[2]["output_data"] for a in all_args], output_data)
+        _merge_shards([a[2]["output_kb"] for a in all_args], output_kb)
+    # status stats
+    for key in status_stats:
+      status_stats[key] /= 1.0 * num_context
+
+    return all_context, status_stats
+
+  def iter_contexts(self,
+                    num_context,
+                    output_object=False,
+                    status_stats=None,
+                    display_freq=None,
+                    verbose=False,
+                    start=0,
+                    status_distribution=None):
+    """yields contexts one at a time instead of keeping them in memory.
+
+    A context is a (customer, knowledgebase, expected_action) tuple if
+    output_object is true, otherwise the json used by generate_context. If
+    status_stats is a dictionary, the raw counts of the expected statuses are
+    accumulated into it. Seed addressable generators can start at any sample
+    index, which allows to resume partial runs.
+
+    status_distribution is an optional dictionary from expected statuses to
+    their probabilities. If it is given, every context draws a target status
+    and the customer and knowledge base are adjusted to lead to it, instead of
+    following the natural distribution of the goal and reservation priors.
+    """
+    if status_distribution:
+      status_sampler = utils.CategoricalSampler(
+          list(status_distribution.keys()),
+          list(status_distribution.values()))
+    all_cus_and_kb = self._generate_customer_and_kb(num_context, start)
+    for n, (cus, kb, rng) in enumerate(all_cus_and_kb):
       if display_freq:
         if verbose and n % display_freq == 0:
           print((n, "/", num_context))
-      cus = customer.Customer(self.fact_obj, self.book_window,
-                              airport_candidate)
-      ref_departure_date, ref_return_date = cus.departure_date, cus.return_date
-      kb = knowledgebase.Knowledgebase(self.fact_obj, self.num_db_record,
-                                       airport_candidate, ref_departure_date,
-                                       ref_return_date)
+      if status_distribution:
+        target_status.apply_target_status(self.fact_obj, cus, kb,
+                                          status_sampler.sample(rng=rng), rng)
       intent_json = utils.standardize_intent(cus.get_json())
       kb_and_res_json = kb.get_json()
       kb_json = kb_and_res_json["kb"]
       res_json = kb_and_res_json["reservation"]
-      expected_action = utils.generate_expected_action(
-          self.fact_obj, intent_json, kb_json, res_json)
-      status = expected_action["status"]
-      if status not in status_stats:
-        status_stats[status] = 0
-      status_stats[status] += 1
+      with profiling.phase("expected_action"):
+        expected_action = utils.generate_expected_action(
+            self.fact_obj, intent_json,
+            utils.ColumnarKnowledgebase(self.fact_obj, kb_json), res_json)
+      if status_stats is not None:
+        status = expected_action["status"]
+        status_stats[status] = status_stats.get(status, 0) + 1
 
-      if fp_data and fp_kb:
-        context_data = {
+      if output_object:  # output pythoh object instead of json
+        yield cus, kb, expected_action
+      else:  # output json
+        yield {
             "intent": intent_json,
-            "action": self._generate_user_action(expected_action),
+            "kb": kb_json,
+            "reservation": res_json,
+            "action": self._generate_user_action(expected_action, rng),
             "expected_action": expected_action
         }
-        context_kb = {"kb": kb_json, "reservation": res_json}
 
-        fp_data.write(json.dumps(context_data) + "\n")
-        fp_kb.write(json.dumps(context_kb) + "\n")
+  def get_context(self, index, output_object=False):
+    """regenerates the sample at index of a seed addressable generator."""
+    if self.seed is None:
+      raise ValueError("get_context requires a seed addressable generator.")
+    return next(self.iter_contexts(1, output_object=output_object, start=index))
+
+  def iter_contexts_buffered(self, num_context, buffer_size=1000, **kwargs):
+    """same as iter_contexts but generates ahead on a background thread.
+
+    At most buffer_size contexts are kept in memory. The remaining keyword
+    arguments are passed to iter_contexts.
+    """
+    buf = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+    end_of_contexts = object()
+
+    def put(item):
+      while not stop.is_set():
+        try:
+          buf.put(item, timeout=0.1)
+          return
+        except queue.Full:
+          pass
+
+    def produce():
+      try:
+        for context in self.iter_contexts(num_context, **kwargs):
+          put(context)
+          if stop.is_set():
+            return
+        put(end_of_contexts)
+      except Exception as e:  # pylint: disable=broad-except
+        put(e)
+
+    producer = threading.Thread(target=produce)
+    producer.daemon = True
+    producer.start()
+    try:
+      while True:
+        item = buf.get()
+        if item is end_of_contexts:
+          break
+        if isinstance(item, Exception):
+          raise item
+        yield item
+    finally:
+      stop.set()
+      producer.join()
+
+  def _generate_context(self,
+                        num_context,
+                        output_data,
+                        output_kb,
+                        display_freq,
+                        output_object,
+                        verbose,
+                        start=0,
+                        status_distribution=None,
+                        json_encoder="json"):
+    """generates contexts and returns them along with raw status counts."""
+    if output_data and output_kb:
+      fp_data = record_writer.RecordWriter(output_data, encoder=json_encoder)
+      fp_kb = record_writer.RecordWriter(output_kb, encoder=json_encoder)
+      output_object = False
+    else:
+      fp_data = None
+      fp_kb = None
+    all_context = []
+    status_stats = {}
+    for context in self.iter_contexts(num_context, output_object, status_stats,
+                                      display_freq, verbose, start,
+                                      status_distribution):
+      if fp_data and fp_kb:
+        context_data = {
+            "intent": context["intent"],
+            "action": context["action"],
+            "expected_action": context["expected_action"]
+        }
+        context_kb = {
+            "kb": context["kb"],
+            "reservation": context["reservation"]
+        }
+        fp_data.write(context_data)
+        fp_kb.write(context_kb)
       else:
-        if output_object:  # output pythoh object instead of json
-          object_structure = (cus, kb, expected_action)
-          all_context.append(object_structure)
-        else:  # output json
-          context_json = {
-              "intent": intent_json,
-              "kb": kb_json,
-              "reservation": res_json,
-              "action": self._generate_user_action(expected_action),
-              "expected_action": expected_action
-          }
-          all_context.append(context_json)
+        if output_object:
+          # keeps the collected objects compact. json is rebuilt on demand.
+          context[1].clear_json()
+        all_context.append(context)
 
     if fp_data:
       fp_data.close()
     if fp_kb:
       fp_kb.close()
-    # status stats
-    for key in status_stats:
-      status_stats[key] /= 1.0 * num_context
-
     return all_context, status_stats
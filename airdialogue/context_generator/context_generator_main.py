@@ -15,9 +15,8 @@
 """This is the main module that generates contexts."""
 
 import argparse
+from airdialogue import record_writer
 from airdialogue.context_generator import context_generator_lib
-import tensorflow.compat.v1 as tf
-import sys
 
 FLAGS= None
 
@@ -68,6 +67,52 @@ def add_arguments(parser):
       type=int,
       default=50000,
       help="display frequency for information.")
+  parser.add_argument(
+      "--vectorized_kb",
+      type="bool",
+      nargs="?",
+      const=True,
+      default=False,
+      help="if enabled, knowledge bases are generated in numpy batches.")
+  parser.add_argument(
+      "--num_workers",
+      type=int,
+      default=1,
+      help="number of processes that generate shards of the samples.")
+  parser.add_argument(
+      "--seed",
+      type=int,
+      default=None,
+      help="random seed. output is reproducible for a given seed and "
+      "num_workers.")
+  parser.add_argument(
+      "--random_access",
+      type="bool",
+      nargs="?",
+      const=True,
+      default=False,
+      help="if enabled, every sample is derived from (seed, sample index) and "
+      "the output does not depend on num_workers.")
+  parser.add_argument(
+      "--start_index",
+      type=int,
+      default=0,
+      help="index of the first sample to generate with --random_access.")
+  parser.add_argument(
+      "--status_distribution",
+      type=str,
+      default=None,
+      help="target distribution of the expected status, for example "
+      "book:0.4,change:0.2,no_flight:0.4. statuses are among "
+      "book|change|cancel|no_flight|no_reservation.")
+  parser.add_argument(
+      "--json_encoder",
+      type=str,
+      default="json",
+      choices=record_writer.ENCODERS,
+      help="json encoder of the output files. orjson is faster but its output "
+      "has no whitespace. output files ending with .gz or .zst are "
+      "compressed.")
   parser.add_argument(
       "--verbose",
       type="bool",
@@ -77,30 +122,50 @@ def add_arguments(parser):
       help="if enabled, debug info will be printed out.")
 
 
+def parse_status_distribution(distribution_str):
+  """parses a status:probability,... string into a dictionary."""
+  if not distribution_str:
+    return None
+  distribution = {}
+  for element in distribution_str.split(","):
+    status, prob = element.split(":")
+    distribution[status.strip()] = float(prob)
+  return distribution
+
+
 def main(FLAGS):
+  if FLAGS.random_access and FLAGS.seed is None:
+    raise ValueError("--random_access requires --seed.")
+  if FLAGS.start_index and not FLAGS.random_access:
+    raise ValueError("--start_index requires --random_access.")
   cg = context_generator_lib.ContextGenerator(
       num_candidate_airports=FLAGS.num_candidate_airports,
       book_window=FLAGS.book_window,
       num_db_record=FLAGS.num_db_record,
       firstname_file=FLAGS.firstname_file,
       lastname_file=FLAGS.lastname_file,
-      airportcode_file=FLAGS.airportcode_file)
+      airportcode_file=FLAGS.airportcode_file,
+      vectorized_kb=FLAGS.vectorized_kb,
+      seed=FLAGS.seed if FLAGS.random_access else None)
 
   _, stats = cg.generate_context(FLAGS.num_samples,
                                  output_data=FLAGS.output_data,
                                  output_kb=FLAGS.output_kb,
                                  display_freq=FLAGS.display_freq,
-                                 verbose=FLAGS.verbose)
+                                 verbose=FLAGS.verbose,
+                                 num_workers=FLAGS.num_workers,
+                                 seed=FLAGS.seed,
+                                 start=FLAGS.start_index,
+                                 status_distribution=parse_status_distribution(
+                                     FLAGS.status_distribution),
+                                 json_encoder=FLAGS.json_encoder)
   if FLAGS.verbose: print(stats)
 
 
-def run_main(unused):
-  main(FLAGS)
-
 if __name__ == "__main__":
   this_parser = argparse.ArgumentParser()
   add_arguments(this_parser)
   FLAGS, unparsed = this_parser.parse_known_args()
-  tf.app.run(main=run_main, argv=[sys.argv[0]] + unparsed)
+  main(FLAGS)
 
 
@@ -14,17 +14,23 @@
 
 """This file contains the structure to model customers."""
 # import ast
-import random
 from . import utils
 
 
 class Customer(object):
   """This class contains information of a customer."""
 
-  def __init__(self, facts_obj, book_window, airport_list):
+  __slots__ = ('origin', 'dest', 'departure_date', 'return_date', 'passengers',
+               'departure_time', 'return_time', 'class_limit', 'price_limit',
+               'max_connection', 'airline', 'departure_month', 'departure_day',
+               'return_month', 'return_day', 'goal')
+
+  def __init__(self, facts_obj, book_window, airport_list, rng=None):
+    # rng is an optional np.random.Generator. By default the global random and
+    # np.random states are used.
     # 1. origin and destination, airport_list guarantees to have unique locations
-    self.origin = random.randint(0, len(airport_list) - 1)
-    self.dest = random.randint(0, len(airport_list) - 1)
+    self.origin = utils.randint(0, len(airport_list) - 1, rng=rng)
+    self.dest = utils.randint(0, len(airport_list) - 1, rng=rng)
     if self.dest == self.origin:
       self.dest = (self.dest + 1) % len(airport_list)
     self.dest = airport_list[self.dest]
@@ -33,7 +39,7 @@ class Customer(object):
     base_time = facts_obj.base_departure_time_epoch
     a_year_from_now = base_time + 3600 * 24 * 365
     # randomly pick a date between base_time and a_year_from_now
-    self.departure_date = random.randint(base_time, a_year_from_now)
+    self.departure_date = utils.randint(base_time, a_year_from_now, rng=rng)
     # return adte is book_window away from the departure date
     self.return_date = self.departure_date + 3600 * 24 * book_window
     # 4. passenger information
@@ -43,48 +49,46 @@ class Customer(object):
     len_last_name = len(facts_obj.last_name_list)
     # '_' will later be replaced in intent standalization
     for _ in range(num_passengers):
-      self.passengers.append(
-          facts_obj.first_name_list[random.randint(0, len_first_name - 1)] +
-          '_' + facts_obj.last_name_list[random.randint(0, len_last_name - 1)])
+      first_name_ind = utils.randint(0, len_first_name - 1, rng=rng)
+      last_name_ind = utils.randint(0, len_last_name - 1, rng=rng)
+      self.passengers.append(facts_obj.first_name_list[first_name_ind] + '_' +
+                             facts_obj.last_name_list[last_name_ind])
     # non-required fields during initial query
     # 3. time
-    self.departure_time = utils.choice(
-        facts_obj.time_list, 1, p=facts_obj.time_prior)[0]
-    self.return_time = utils.choice(
-        facts_obj.time_list, 1, p=facts_obj.time_prior)[0]
+    self.departure_time = facts_obj.time_sampler.sample(rng=rng)
+    self.return_time = facts_obj.time_sampler.sample(rng=rng)
 
     # 5. class limit and price limit
-    self.class_limit = utils.choice(
-        facts_obj.class_list, 1, p=facts_obj.class_list_prior)[0]
+    self.class_limit = facts_obj.class_list_sampler.sample(rng=rng)
 
     # 6. price limist
     if self.class_limit == 'all':
-      self.price_limit = facts_obj.price_limit_list[random.randint(
+      self.price_limit = facts_obj.price_limit_list[utils.randint(
           0,
-          len(facts_obj.price_limit_list) - 1)]
+          len(facts_obj.price_limit_list) - 1,
+          rng=rng)]
     elif self.class_limit == 'economy':
-      self.price_limit = facts_obj.price_limit_list[random.randint(
+      self.price_limit = facts_obj.price_limit_list[utils.randint(
           0,
-          len(facts_obj.price_limit_list) - 2)]
+          len(facts_obj.price_limit_list) - 2,
+          rng=rng)]
     elif self.class_limit == 'business':
-      self.price_limit = facts_obj.price_limit_list[random.randint(
+      self.price_limit = facts_obj.price_limit_list[utils.randint(
           1,
-          len(facts_obj.price_limit_list) - 1)]
+          len(facts_obj.price_limit_list) - 1,
+          rng=rng)]
     # 7. num of connections
-    self.max_connection = utils.choice(
-        facts_obj.connection_member, 1, p=facts_obj.connection_prior)[0]
+    self.max_connection = facts_obj.connection_sampler.sample(rng=rng)
 
     # 8. airline preference
-    self.airline = utils.choice(
-        facts_obj.airline_preference, 1,
-        p=facts_obj.airline_preference_prior)[0]
+    self.airline = facts_obj.airline_preference_sampler.sample(rng=rng)
     # 10 post process
-    self.departure_month, self.departure_day = utils.get_month_and_day(
-        facts_obj, self.departure_date)
-    self.return_month, self.return_day = utils.get_month_and_day(
-        facts_obj, self.return_date)
+    self.departure_month, self.departure_day = (
+        facts_obj.calendar.get_month_and_day(self.departure_date))
+    self.return_month, self.return_day = facts_obj.calendar.get_month_and_day(
+        self.return_date)
     # 11 change reservation
-    self.goal = utils.choice([0, 1, 2], p=facts_obj.goal_probaility)
+    self.goal = facts_obj.goal_sampler.sample(rng=rng)
 
   def get_departure_and_return_date(self):
     return self.departure_date, self.return_date
@@ -0,0 +1,103 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""This file converts unix epochs into calendar fields."""
+import numpy as np
+
+SECONDS_PER_HOUR = 3600
+
+# day segment of every hour, see utils.get_day_segment_by_hour.
+DAY_SEGMENT_BY_HOUR = ['evening'] * 3 + ['morning'] * 9 + ['afternoon'] * 8 + [
+    'evening'
+] * 4
+
+
+def _to_seconds(epochs):
+  # datetime.utcfromtimestamp rounds to microseconds before truncating.
+  return np.floor(np.round(np.asarray(epochs, dtype=float), 6)).astype(np.int64)
+
+
+def _decode_seconds(seconds):
+  """Arithmetic decoder from integer epochs to (month index, day, hour)."""
+  times = np.asarray(seconds, dtype=np.int64).astype('datetime64[s]')
+  days = times.astype('datetime64[D]')
+  month_start = days.astype('datetime64[M]')
+  month_index = month_start.astype(np.int64) % 12
+  day = (days - month_start).astype(np.int64) + 1
+  hour = (times - days).astype('timedelta64[h]').astype(np.int64)
+  return month_index, day, hour
+
+
+class EpochCalendar(object):
+  """Converts unix epochs into month, day and hour.
+
+  Conversions look up an hour-resolution table that covers the window of dates
+  drawn by the context generator. Epochs outside of the window are decoded
+  arithmetically, so results always agree with datetime.utcfromtimestamp.
+  """
+
+  def __init__(self, months, start_epoch, end_epoch):
+    self.months = np.asarray(months)
+    self.start = start_epoch - start_epoch % SECONDS_PER_HOUR
+    self.num_hours = (end_epoch - self.start) // SECONDS_PER_HOUR + 1
+    hours = self.start + SECONDS_PER_HOUR * np.arange(self.num_hours)
+    self.month_table, self.day_table, self.hour_table = _decode_seconds(hours)
+    # python lists make scalar lookups cheaper than indexing numpy arrays.
+    self._month_list = self.months[self.month_table].tolist()
+    self._day_list = self.day_table.astype(str).tolist()
+    self._hour_list = self.hour_table.tolist()
+
+  def decode(self, epochs):
+    """Returns month indices, days and hours of an array of epochs."""
+    seconds = _to_seconds(epochs)
+    ind = (seconds - self.start) // SECONDS_PER_HOUR
+    inside = (ind >= 0) & (ind < self.num_hours)
+    if inside.all():
+      return self.month_table[ind], self.day_table[ind], self.hour_table[ind]
+    month_index, day, hour = _decode_seconds(seconds)
+    ind = ind[inside]
+    month_index[inside] = self.month_table[ind]
+    day[inside] = self.day_table[ind]
+    hour[inside] = self.hour_table[ind]
+    return month_index, day, hour
+
+  def month_day_hour(self, epochs):
+    """Returns month names, day strings and hours of an array of epochs."""
+    month_index, day, hour = self.decode(epochs)
+    return self.months[month_index], day.astype(str), hour
+
+  def _index(self, unix_epoch):
+    seconds = int(np.floor(round(unix_epoch, 6)))
+    ind = (seconds - self.start) // SECONDS_PER_HOUR
+    if 0 <= ind < self.num_hours:
+      return ind
+    return None
+
+  def get_month_and_day(self, unix_epoch):
+    ind = self._index(unix_epoch)
+    if ind is None:
+      month, day, _ = self.month_day_hour([unix_epoch])
+      return str(month[0]), str(day[0])
+    return self._month_list[ind], self._day_list[ind]
+
+  def get_hour(self, unix_epoch):
+    ind = self._index(unix_epoch)
+    if ind is None:
+      return int(self.decode([unix_epoch])[2][0])
+    return self._hour_list[ind]
+
+
+def get_day_segments(hours):
+  """Returns the day segment of every hour in an array."""
+  return np.asarray(DAY_SEGMENT_BY_HOUR)[np.asarray(hours)]
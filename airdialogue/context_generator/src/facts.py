@@ -14,7 +14,9 @@
 
 """This file contains content related parameters."""
 
-from tensorflow.compat.v1 import gfile
+from airdialogue import file_io
+from . import epoch_calendar
+from . import utils
 
 
 class Facts(object):
@@ -68,6 +70,11 @@ class Facts(object):
     # departure_time
     self.base_departure_time_epoch = 1300000000
     self.time_deviation = 3600 * 12
+    # customer dates are at most a year after the base time and flights deviate
+    # from them by time_deviation, so two years are enough for the table.
+    self.calendar = epoch_calendar.EpochCalendar(
+        self.months, self.base_departure_time_epoch - 3600 * 24 * 30,
+        self.base_departure_time_epoch + 3600 * 24 * 365 * 2)
 
     self.airport_to_full_name = self._get_airline_list()
 
@@ -75,6 +82,20 @@ class Facts(object):
         'no_flight', 'book', 'no_reservation', 'cancel', 'change'
     ]
 
+    # samplers are built once so that draws skip validation of the priors.
+    self.time_sampler = utils.CategoricalSampler(self.time_list,
+                                                 self.time_prior)
+    self.class_list_sampler = utils.CategoricalSampler(self.class_list,
+                                                       self.class_list_prior)
+    self.class_sampler = utils.CategoricalSampler(self.class_member,
+                                                  self.class_prior)
+    self.connection_sampler = utils.CategoricalSampler(self.connection_member,
+                                                       self.connection_prior)
+    self.airline_preference_sampler = utils.CategoricalSampler(
+        self.airline_preference, self.airline_preference_prior)
+    self.goal_sampler = utils.CategoricalSampler([0, 1, 2],
+                                                 self.goal_probaility)
+
   def _get_airline_list(self):
     """generates a list of airline and their cost attributes."""
     airline_list = {
@@ -90,7 +111,7 @@ class Facts(object):
     return airline_list
 
   def _read_file(self, filename):
-    original_content = gfile.Open(filename).read().strip().split('\n')
+    original_content = file_io.Open(filename).read().strip().split('\n')
     # make sure that no empty items are added.
     content = []
     for element in original_content:
@@ -13,26 +13,45 @@
 # limitations under the License.
 
 """This file defines the behavior of agents."""
-import random
+import json
 import numpy as np
 from . import utils
 
 
 class AirFare(object):
-  """This class contains the information for flights."""
+  """This class contains the information for flights.
 
-  def __init__(self, fact_obj, airport_list, flight_number, ref_departure_date,
-               ref_return_date):
+  Flights are slotted to keep large collections of knowledge bases compact.
+  get_json_view builds a read-only json on first use and caches it, so that the
+  simulator can share it. get_json returns a copy of it that can be modified.
+  Call clear_json after modifying a flight.
+  """
+
+  __slots__ = ('origin', 'dest', 'departure_date', 'return_date',
+               'flight_class', 'connection', 'price', 'flight_number',
+               'airline', 'departure_month', 'departure_day', 'return_month',
+               'return_day', 'departure_time_num', 'return_time_num', '_json')
+
+  def __init__(self,
+               fact_obj,
+               airport_list,
+               flight_number,
+               ref_departure_date,
+               ref_return_date,
+               rng=None):
+    # rng is an optional np.random.Generator. By default the global random and
+    # np.random states are used.
+    rand = np.random if rng is None else rng
     # 1. origin and destination
-    self.origin = random.randint(0, len(airport_list) - 1)
-    self.dest = random.randint(0, len(airport_list) - 1)
+    self.origin = utils.randint(0, len(airport_list) - 1, rng=rng)
+    self.dest = utils.randint(0, len(airport_list) - 1, rng=rng)
     if self.dest == self.origin:
       self.dest = (self.dest + 1) % len(airport_list)
     self.dest = airport_list[self.dest]
     self.origin = airport_list[self.origin]
     # 2. date and time
-    d1 = np.random.normal(ref_departure_date, fact_obj.time_deviation, 1)[0]
-    d2 = np.random.normal(ref_return_date, fact_obj.time_deviation, 1)[0]
+    d1 = rand.normal(ref_departure_date, fact_obj.time_deviation, 1)[0]
+    d2 = rand.normal(ref_return_date, fact_obj.time_deviation, 1)[0]
 
     # makes ure that departure date comes first
     if d1 < d2:
@@ -46,19 +65,17 @@ class AirFare(object):
     # assert self.return_date - self.departure_date <= 3600*24*365/2
 
     # 3. class
-    self.flight_class = utils.choice(
-        fact_obj.class_member, 1, p=fact_obj.class_prior)[0]
+    self.flight_class = fact_obj.class_sampler.sample(rng=rng)
 
     # 4. connections
-    self.connection = utils.choice(
-        fact_obj.connection_member, 1, p=fact_obj.connection_prior)[0]
+    self.connection = fact_obj.connection_sampler.sample(rng=rng)
 
     # 5. price
     mean_base_price = fact_obj.flight_price_mean[self.flight_class]
     base = mean_base_price * fact_obj.low_cost_mean_fraction[self.flight_class]
     self.price = int(
-        np.random.normal(
-            base, base * fact_obj.flight_price_norm_std[self.connection]))
+        rand.normal(base,
+                    base * fact_obj.flight_price_norm_std[self.connection]))
     self.price = utils.discrete_price(self.price)
 
     # 6. flight number
@@ -66,20 +83,41 @@ class AirFare(object):
     self.flight_number = flight_number
 
     # 7. airline
-    airline_ind = random.randint(0, len(fact_obj.airline_list) - 1)
+    airline_ind = utils.randint(0, len(fact_obj.airline_list) - 1, rng=rng)
     self.airline = list(fact_obj.airline_list.keys())[airline_ind]
 
     # post process
-    self.departure_month, self.departure_day = utils.get_month_and_day(
-        fact_obj, self.departure_date)
-    self.return_month, self.return_day = utils.get_month_and_day(
-        fact_obj, self.return_date)
-    self.departure_time_num = utils.get_hour(self.departure_date)
-    self.return_time_num = utils.get_hour(self.return_date)
+    calendar = fact_obj.calendar
+    self.departure_month, self.departure_day = calendar.get_month_and_day(
+        self.departure_date)
+    self.return_month, self.return_day = calendar.get_month_and_day(
+        self.return_date)
+    self.departure_time_num = calendar.get_hour(self.departure_date)
+    self.return_time_num = calendar.get_hour(self.return_date)
+    self._json = None
+
+  @classmethod
+  def from_values(cls, values):
+    """Builds a flight from pre-generated attributes without drawing any."""
+    flight = cls.__new__(cls)
+    for key in values:
+      setattr(flight, key, values[key])
+    flight._json = None  # pylint: disable=protected-access
+    return flight
+
+  def clear_json(self):
+    self._json = None
 
+  def get_json_view(self):
+    if self._json is None:
+      self._json = self._build_json()
+    return self._json
 
   def get_json(self):
-    return {
+    return dict(self.get_json_view())
+
+  def _build_json(self):
+    return utils.ReadOnlyDict({
         'departure_airport': self.origin,
         'return_airport': self.dest,
         'departure_month': self.departure_month,
@@ -93,32 +131,198 @@ class AirFare(object):
         'price': self.price,
         'flight_number': self.flight_number,
         'airline': self.airline
-    }
+    })
 
 
 class Knowledgebase(object):
-  """This class contains a collection of flights."""
+  """This class contains a collection of flights.
 
-  def __init__(self, fact_obj, num_flights, airport_list, departure_date,
-               return_date):
+  get_json_view is cached like AirFare.get_json_view, its flights are a tuple.
+  get_json returns a copy of it with a list of flights. get_json_str memoizes
+  the serialized json as well. Call clear_json after
+  modifying the reservation or any of the flights.
+  """
+
+  __slots__ = ('knowledgebase', 'has_reservation', 'reservation', '_json',
+               '_json_str', '_json_encoder')
+
+  def __init__(self,
+               fact_obj,
+               num_flights,
+               airport_list,
+               departure_date,
+               return_date,
+               rng=None):
+    rand = np.random if rng is None else rng
     self.knowledgebase = []
     base_flight_num = 1000
     for i in range(num_flights):
       self.knowledgebase.append(
           AirFare(fact_obj, airport_list, base_flight_num + i, departure_date,
-                  return_date))
-    has_reserv = np.random.random() < fact_obj.has_reservation_probability
+                  return_date, rng))
+    has_reserv = rand.random() < fact_obj.has_reservation_probability
     self.has_reservation = has_reserv
     if self.has_reservation:
-      ind = np.random.randint(0, len(
-          self.knowledgebase))  # note the numpy random above behavior
+      ind = utils.np_randint(0, len(
+          self.knowledgebase), rng=rng)  # note the numpy random above behavior
       self.reservation = self.knowledgebase[ind].flight_number
     else:
       self.reservation = 0  # 0 serves as the null number
+    self.clear_json()
 
-  def get_json(self):
-    knowledge_base_json = []
+  @classmethod
+  def from_flights(cls, flights, reservation):
+    """Builds a knowledge base from a list of pre-generated flights."""
+    knowledge_base = cls.__new__(cls)
+    knowledge_base.knowledgebase = flights
+    knowledge_base.has_reservation = reservation != 0
+    knowledge_base.reservation = reservation
+    knowledge_base.clear_json()
+    return knowledge_base
+
+  def clear_json(self):
+    """drops the cached json of the knowledge base and of its flights."""
+    self._json = None
+    self._json_str = None
+    self._json_encoder = None
     for flight in self.knowledgebase:
-      knowledge_base_json.append(flight.get_json())
-    wrapper_json = {'kb': knowledge_base_json, 'reservation': self.reservation}
-    return wrapper_json
+      flight.clear_json()
+
+  def get_json_view(self):
+    if self._json is None:
+      knowledge_base_json = tuple(
+          [flight.get_json_view() for flight in self.knowledgebase])
+      self._json = utils.ReadOnlyDict({
+          'kb': knowledge_base_json,
+          'reservation': self.reservation
+      })
+    return self._json
+
+  def get_json(self):
+    view = self.get_json_view()
+    return {
+        'kb': [dict(flight) for flight in view['kb']],
+        'reservation': view['reservation']
+    }
+
+  def get_json_str(self, encode=json.dumps):
+    """returns get_json serialized by encode. the last result is memoized."""
+    if self._json_str is None or self._json_encoder is not encode:
+      self._json_str = encode(self.get_json_view())
+      self._json_encoder = encode
+    return self._json_str
+
+
+def generate_airfare_columns(fact_obj,
+                             num_flights,
+                             airport_lists,
+                             ref_departure_dates,
+                             ref_return_dates,
+                             rng=None):
+  """Draws the flights of many knowledge bases in a single shot.
+
+  Each of airport_lists, ref_departure_dates and ref_return_dates has one entry
+  per knowledge base. The flights follow the same distributions as AirFare.
+  Returns a dictionary from AirFare attribute names to arrays of shape
+  [num_kb, num_flights].
+  """
+  rand = np.random if rng is None else rng
+  airports = np.asarray(airport_lists)
+  num_kb, num_airports = airports.shape
+  shape = (num_kb, num_flights)
+  rows = np.arange(num_kb)[:, None]
+  # 1. origin and destination
+  origin = utils.np_randint(0, num_airports, shape, rng)
+  dest = utils.np_randint(0, num_airports, shape, rng)
+  dest = np.where(dest == origin, (dest + 1) % num_airports, dest)
+  # 2. date and time, departure date comes first
+  d1 = rand.normal(
+      np.asarray(ref_departure_dates, dtype=float)[:, None],
+      fact_obj.time_deviation, shape)
+  d2 = rand.normal(
+      np.asarray(ref_return_dates, dtype=float)[:, None],
+      fact_obj.time_deviation, shape)
+  departure_date = np.minimum(d1, d2)
+  return_date = np.maximum(d1, d2)
+  # 3. class
+  class_ind = fact_obj.class_sampler.sample_index(shape, rng)
+  # 4. connections
+  connection_ind = fact_obj.connection_sampler.sample_index(shape, rng)
+  connection = np.asarray(fact_obj.connection_member)[connection_ind]
+  # 5. price
+  base = np.asarray([
+      fact_obj.flight_price_mean[c] * fact_obj.low_cost_mean_fraction[c]
+      for c in fact_obj.class_member
+  ])[class_ind]
+  norm_std = np.asarray([
+      fact_obj.flight_price_norm_std[c] for c in fact_obj.connection_member
+  ])[connection_ind]
+  price = np.trunc(rand.normal(base, base * norm_std))
+  price = np.maximum(100, np.trunc(price / 100) * 100).astype(int)
+  # 6. flight number
+  flight_number = np.broadcast_to(1000 + np.arange(num_flights), shape)
+  # 7. airline
+  airline_names = np.asarray(list(fact_obj.airline_list.keys()))
+  airline = airline_names[utils.np_randint(0, len(airline_names), shape, rng)]
+  # post process
+  departure_month, departure_day, departure_time_num = (
+      fact_obj.calendar.month_day_hour(departure_date))
+  return_month, return_day, return_time_num = fact_obj.calendar.month_day_hour(
+      return_date)
+  return {
+      'origin': airports[rows, origin],
+      'dest': airports[rows, dest],
+      'departure_date': departure_date,
+      'return_date': return_date,
+      'flight_class': np.asarray(fact_obj.class_member)[class_ind],
+      'connection': connection,
+      'price': price,
+      'flight_number': flight_number,
+      'airline': airline,
+      'departure_month': departure_month,
+      'departure_day': departure_day,
+      'return_month': return_month,
+      'return_day': return_day,
+      'departure_time_num': departure_time_num,
+      'return_time_num': return_time_num
+  }
+
+
+def _column_to_list(column):
+  """converts a column to nested python lists.
+
+  Strings are shared between the cells that hold the same value, instead of
+  allocating a new string for every cell.
+  """
+  if column.dtype.kind != 'U':
+    return column.tolist()
+  values, inverse = np.unique(column, return_inverse=True)
+  values = np.asarray(values.tolist(), dtype=object)
+  return values[inverse.reshape(column.shape)].tolist()
+
+
+def generate_knowledgebases(fact_obj,
+                            num_flights,
+                            airport_lists,
+                            ref_departure_dates,
+                            ref_return_dates,
+                            rng=None):
+  """Generates one Knowledgebase per entry of airport_lists in a batch."""
+  rand = np.random if rng is None else rng
+  columns = generate_airfare_columns(fact_obj, num_flights, airport_lists,
+                                     ref_departure_dates, ref_return_dates, rng)
+  num_kb = len(airport_lists)
+  has_reservation = (
+      rand.random(num_kb) < fact_obj.has_reservation_probability)
+  reservation_ind = utils.np_randint(0, num_flights, num_kb, rng)
+  reservation = np.where(has_reservation, 1000 + reservation_ind, 0).tolist()
+  keys = list(columns.keys())
+  # converts numpy scalars into native python types for json.
+  rows = zip(*[_column_to_list(columns[key]) for key in keys])
+  all_kb = []
+  for k, row in enumerate(rows):
+    flights = [
+        AirFare.from_values(dict(zip(keys, values))) for values in zip(*row)
+    ]
+    all_kb.append(Knowledgebase.from_flights(flights, reservation[k]))
+  return all_kb
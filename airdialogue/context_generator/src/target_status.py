@@ -0,0 +1,135 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""This file adjusts contexts so that they lead to a given expected status."""
+import numpy as np
+from . import epoch_calendar
+from . import utils
+
+# hours that belong to every value of departure_time and return_time.
+hours_by_time = {
+    'all': list(range(24)),
+    'morning': [],
+    'afternoon': [],
+    'evening': []
+}
+for _hour, _segment in enumerate(epoch_calendar.DAY_SEGMENT_BY_HOUR):
+  hours_by_time[_segment].append(_hour)
+
+
+def _set_reservation(kb, has_reservation, rng=None):
+  if not has_reservation:
+    kb.has_reservation = False
+    kb.reservation = 0
+  elif not kb.has_reservation:
+    ind = utils.randint(0, len(kb.knowledgebase) - 1, rng=rng)
+    kb.has_reservation = True
+    kb.reservation = kb.knowledgebase[ind].flight_number
+  kb.clear_json()
+
+
+def _draw_date(reference_date, time_pref, rng=None):
+  """draws a date on the same day as reference_date within time_pref."""
+  day_start = reference_date - reference_date % (3600 * 24)
+  hours = hours_by_time[time_pref]
+  hour = hours[utils.randint(0, len(hours) - 1, rng=rng)]
+  return day_start + 3600 * hour + utils.randint(0, 3599, rng=rng)
+
+
+def _update_dates(fact_obj, flight, departure_date, return_date):
+  calendar = fact_obj.calendar
+  flight.departure_date = departure_date
+  flight.return_date = return_date
+  flight.departure_month, flight.departure_day = calendar.get_month_and_day(
+      departure_date)
+  flight.return_month, flight.return_day = calendar.get_month_and_day(
+      return_date)
+  flight.departure_time_num = calendar.get_hour(departure_date)
+  flight.return_time_num = calendar.get_hour(return_date)
+
+
+def plant_flight(fact_obj, cus, flight, rng=None):
+  """modifies a flight in place so that it satisfies the customer."""
+  flight.origin = cus.origin
+  flight.dest = cus.dest
+  _update_dates(
+      fact_obj, flight,
+      _draw_date(cus.departure_date, cus.departure_time, rng),
+      _draw_date(cus.return_date, cus.return_time, rng))
+  if cus.class_limit != 'all':
+    flight.flight_class = cus.class_limit
+  if flight.connection > cus.max_connection:
+    flight.connection = utils.randint(0, cus.max_connection, rng=rng)
+  if flight.price > cus.price_limit:
+    flight.price = 100 * utils.randint(1, cus.price_limit // 100, rng=rng)
+  airline_list = fact_obj.airline_list
+  if cus.airline != 'all' and airline_list[flight.airline] != cus.airline:
+    candidates = [a for a in airline_list if airline_list[a] == cus.airline]
+    flight.airline = candidates[utils.randint(0, len(candidates) - 1, rng=rng)]
+  flight.clear_json()
+
+
+def break_flight(flight, cus):
+  """modifies a flight in place so that it no longer satisfies the customer.
+
+  The flight is turned into one in the opposite direction.
+  """
+  flight.origin = cus.dest
+  flight.dest = cus.origin
+  flight.clear_json()
+
+
+def apply_target_status(fact_obj, cus, kb, status, rng=None):
+  """modifies a customer and a knowledge base to lead to the given status.
+
+  status is one of the final statuses of an expected action except for abort.
+  The goal of the customer and the reservation are set to the ones the status
+  requires. A satisfying flight is planted for book and change, and all the
+  satisfying flights are broken for no_flight.
+  """
+  goal_str_arr = fact_obj.goal_str_arr
+  if status in ['book', 'change', 'cancel']:
+    cus.goal = goal_str_arr.index(status)
+    if status != 'book':
+      _set_reservation(kb, True, rng)
+  elif status == 'no_reservation':
+    cus.goal = utils.randint(
+        goal_str_arr.index('change'), goal_str_arr.index('cancel'), rng=rng)
+    _set_reservation(kb, False)
+  elif status == 'no_flight':
+    book, change = goal_str_arr.index('book'), goal_str_arr.index('change')
+    cus.goal = book
+    if kb.has_reservation:
+      # changes can also run out of flights. keep their ratio to bookings.
+      book_prob = fact_obj.goal_probaility[book]
+      change_prob = fact_obj.goal_probaility[change]
+      rand = np.random if rng is None else rng
+      if rand.random() < change_prob / (change_prob + book_prob):
+        cus.goal = change
+  else:
+    raise ValueError('unsupported target status: ' + str(status))
+
+  if status in ['book', 'change', 'no_flight']:
+    condition = utils.standardize_intent(cus.get_json())
+    satisfied = [
+        flight for flight in kb.knowledgebase if utils.check_condition(
+            fact_obj, flight.get_json_view(), condition) == 'satisfied'
+    ]
+    if status == 'no_flight':
+      for flight in satisfied:
+        break_flight(flight, cus)
+    elif not satisfied:
+      ind = utils.randint(0, len(kb.knowledgebase) - 1, rng=rng)
+      plant_flight(fact_obj, cus, kb.knowledgebase[ind], rng)
+    kb.clear_json()
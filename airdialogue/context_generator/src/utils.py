@@ -13,9 +13,12 @@
 # limitations under the License.
 
 """this file contains a list of utility functions."""
+import bisect
 import calendar
 from datetime import datetime
+import random
 import numpy as np
+from airdialogue import profiling
 
 
 def continue_booking(facts, ag_cond, kb, goal_str):
@@ -29,6 +32,8 @@ def continue_booking(facts, ag_cond, kb, goal_str):
 
 def airflight_selector(facts, condition, airfare_database):
   """This function selects a flight based on the condition."""
+  if isinstance(airfare_database, ColumnarKnowledgebase):
+    return airfare_database.select(condition)
   candidates = []
   for i, flight in enumerate(airfare_database):
     cond = check_condition(facts, flight, condition, get_full_diff=False)
@@ -56,7 +61,11 @@ def airflight_selector(facts, condition, airfare_database):
 
 def generate_expected_action(facts, agent_condition, airfare_database,
                              reservation):
-  """this function generates the expected action based context."""
+  """this function generates the expected action based context.
+
+  airfare_database is either a list of flight jsons or a
+  ColumnarKnowledgebase.
+  """
   goal_str = agent_condition['goal']
 
   if goal_str == 'book' or (goal_str == 'change' and reservation != 0):
@@ -108,7 +117,11 @@ def check_condition(facts, flight, condition, get_full_diff=False):
   # all the keys here have been confirmed to appear in step2 of data release.
   diff = []
   do_not_consider = set(['name', 'goal', 'departure_date', 'return_date'])
-  for key in set(condition.keys()) - do_not_consider:
+  # keys are visited in the order of condition, not in the order of a set that
+  # varies with the hash seed, so that seeded simulations are reproducible.
+  for key in condition:
+    if key in do_not_consider:
+      continue
     if key == 'departure_time':
       day_segment = get_day_segment_by_hour(flight['departure_time_num'])
       if day_segment != condition[key]:
@@ -140,6 +153,139 @@ def check_condition(facts, flight, condition, get_full_diff=False):
     return diff
 
 
+def _encode(values):
+  """maps values to integer codes in the order of their first appearance."""
+  value_to_code = {}
+  codes = [value_to_code.setdefault(v, len(value_to_code)) for v in values]
+  return np.asarray(codes, dtype=np.int64), value_to_code
+
+
+class ColumnarKnowledgebase(object):
+  """Struct-of-arrays view of the flights in a knowledge base.
+
+  Categorical fields such as airports, months, days, classes and airlines are
+  integer coded, so that a condition is evaluated against all flights with
+  boolean masks. Columns are built lazily the first time a condition refers to
+  them. The semantics are the same as check_condition and airflight_selector on
+  the list of flight jsons.
+  """
+
+  _do_not_consider = set(['name', 'goal', 'departure_date', 'return_date'])
+
+  def __init__(self, facts, flights):
+    self.facts = facts
+    self.flights = flights
+    self.size = len(flights)
+    self.price = np.asarray([f['price'] for f in flights])
+    self._columns = {}
+    profiling.count('kb_fields_read', self.size)
+
+  def _get_column(self, key):
+    """returns the integer codes of a column and the map from values to codes.
+
+    Numeric columns are returned as they are with a None map.
+    """
+    if key not in self._columns:
+      flights = self.flights
+      if key == 'max_connections':
+        column = np.asarray([f['num_connections'] for f in flights]), None
+      elif key == 'departure_time':
+        column = _encode(
+            [get_day_segment_by_hour(f['departure_time_num']) for f in flights])
+      elif key == 'return_time':
+        column = _encode(
+            [get_day_segment_by_hour(f['return_time_num']) for f in flights])
+      elif key == 'airline_preference':
+        airline_list = self.facts.airline_list
+        column = _encode([airline_list[f['airline']] for f in flights])
+      else:
+        # this includes, class, departure_airport/return_airport
+        # departure_month/return_month, departure_day/return_day
+        column = _encode([f[key] for f in flights])
+      self._columns[key] = column
+      profiling.count('kb_fields_read', self.size)
+    return self._columns[key]
+
+  def condition_mask(self, key, value):
+    """Returns which flights satisfy a single key of a condition."""
+    if key in self._do_not_consider:
+      return np.ones(self.size, dtype=bool)
+    if key == 'max_price':
+      return self.price <= value
+    codes, value_to_code = self._get_column(key)
+    if value_to_code is None:
+      return codes <= value
+    code = value_to_code.get(value)
+    if code is None:
+      return np.zeros(self.size, dtype=bool)
+    return codes == code
+
+  def mask(self, condition):
+    """Returns which flights satisfy all keys of the condition."""
+    mask = np.ones(self.size, dtype=bool)
+    for key in condition:
+      mask &= self.condition_mask(key, condition[key])
+    return mask
+
+  def cheapest(self, mask):
+    """Returns the indices of all the cheapest flights within a mask."""
+    candidates = np.flatnonzero(mask)
+    if not candidates.size:
+      return candidates
+    prices = self.price[candidates]
+    return candidates[prices == prices.min()]
+
+  def select(self, condition):
+    """Same as airflight_selector: the cheapest satisfying flights or None."""
+    cheapest = self.cheapest(self.mask(condition))
+    if not cheapest.size:
+      return None
+    return [self.flights[i] for i in cheapest]
+
+
+class CandidateFlights(object):
+  """Flights of a ColumnarKnowledgebase that satisfy a growing condition.
+
+  During a negotiation the agent condition only gains keys, so candidates are
+  narrowed with the masks of the new keys instead of checking every flight
+  against the full condition again. Flights are kept in stable price order and
+  the position of the cheapest candidate only moves forward, so all lookups of
+  a dialogue take a single pass over the flights.
+  """
+
+  def __init__(self, columnar_kb):
+    self.kb = columnar_kb
+    self.order = np.argsort(columnar_kb.price, kind='stable').tolist()
+    self.reset()
+
+  def reset(self):
+    self.live = np.ones(self.kb.size, dtype=bool)
+    self.applied = {}
+    self.position = 0
+
+  def update(self, condition):
+    """narrows the candidates down to the flights that satisfy condition."""
+    for key in self.applied:
+      if key not in condition or condition[key] != self.applied[key]:
+        # a key was removed or changed. start over.
+        self.reset()
+        break
+    for key in condition:
+      if key not in self.applied:
+        self.live &= self.kb.condition_mask(key, condition[key])
+        self.applied[key] = condition[key]
+
+  def cheapest(self):
+    """Same as airflight_selector in interaction: the first cheapest flight."""
+    order = self.order
+    live = self.live
+    while self.position < len(order) and not live[order[self.position]]:
+      self.position += 1
+    if self.position == len(order):
+      return None
+    return self.kb.flights[order[self.position]]
+
+
 def generate_action(flights, name, status):
   """generate dialogue action."""
   action_json = {}
@@ -222,10 +368,7 @@ def get_datetime(unix_epoch):
 
 
 def get_month_and_day(fact_obj, unix_epoch):
-  m = get_datetime(unix_epoch).month
-  d = get_datetime(unix_epoch).day
-  month = fact_obj.months[m - 1]
-  return month, str(d)
+  return fact_obj.calendar.get_month_and_day(unix_epoch)
 
 
 def get_hour(unix_epoch):
@@ -249,11 +392,17 @@ def get_connection(con):
     return '2 connections'
 
 
-def discrete_sample_(probabilities):
+# format_time of every hour and get_connection of every number of connections,
+# for code that renders many flights.
+TIME_PHRASES = tuple(format_time(hour) for hour in range(24))
+CONNECTION_PHRASES = tuple(get_connection(con) for con in range(3))
+
+
+def discrete_sample_(probabilities, rng=None):
   if abs(sum(probabilities) - 1) > 1e-3:
     raise ValueError('sum of probability not equal to 1')
   sm = 0.0
-  random_number = np.random.random()
+  random_number = (np.random if rng is None else rng).random()
   for i in range(len(probabilities)):
     sm += probabilities[i]
     if sm >= random_number:
@@ -261,12 +410,88 @@ def discrete_sample_(probabilities):
   assert False, 'invalid path'
 
 
-def choice(values, cnt=-1, p=None):
+def randint(low, high, rng=None):
+  """random.randint, or the same draw from a np.random.Generator if given."""
+  if rng is None:
+    return random.randint(low, high)
+  return int(rng.integers(low, high + 1))
+
+
+def np_randint(low, high, size=None, rng=None):
+  """np.random.randint, or the same draw from a np.random.Generator if given."""
+  if rng is None:
+    return np.random.randint(low, high, size)
+  return rng.integers(low, high, size)
+
+
+class ReadOnlyDict(dict):
+  """A dict that raises on modification.
+
+  Cached json views are shared between all their users, so they are handed
+  out read-only. json.dumps serializes it like a dict.
+  """
+
+  def _read_only(self, *args, **kwargs):
+    raise TypeError('this json view is read-only, copy it to modify it.')
+
+  __setitem__ = _read_only
+  __delitem__ = _read_only
+  __ior__ = _read_only
+  clear = _read_only
+  pop = _read_only
+  popitem = _read_only
+  setdefault = _read_only
+  update = _read_only
+
+  def __reduce__(self):
+    return self.__class__, (dict(self),)
+
+
+class CategoricalSampler(object):
+  """Draws values from a fixed categorical distribution.
+
+  The probabilities are validated and accumulated once at construction. Every
+  draw consumes one random() number, from rng if it is given and from the
+  global numpy state otherwise, and maps it with a binary search. A sampler
+  reproduces the draws of choice() for the same random state. The alias method
+  would map random numbers to values differently and change every seeded
+  context, so the cumulative sums are searched instead.
+  """
+
+  def __init__(self, values, p=None):
+    if p is None:
+      p = [float(1) / float(len(values))] * len(values)
+    if len(values) != len(p):
+      raise ValueError('values and probabilities have different lengths')
+    if abs(sum(p) - 1) > 1e-3:
+      raise ValueError('sum of probability not equal to 1')
+    self.values = list(values)
+    self.cumulative = np.cumsum(p)
+    self._cumulative_list = self.cumulative.tolist()
+    self._last = len(self.values) - 1
+
+  def sample_index(self, size=None, rng=None):
+    """Draws a single index, or an array of indices of the given shape."""
+    rand = np.random if rng is None else rng
+    if size is None:
+      ind = bisect.bisect_left(self._cumulative_list, rand.random())
+      return min(ind, self._last)
+    ind = np.searchsorted(self.cumulative, rand.random(size))
+    return np.minimum(ind, self._last)
+
+  def sample(self, size=None, rng=None):
+    """Draws a single value, or an array of values of the given shape."""
+    if size is None:
+      return self.values[self.sample_index(rng=rng)]
+    return np.asarray(self.values)[self.sample_index(size, rng)]
+
+
+def choice(values, cnt=-1, p=None, rng=None):
   if p is None:
     p = [float(1) / float(len(values))] * len(values)
   arr = []
   for _ in range(abs(cnt)):
-    ind = discrete_sample_(p)
+    ind = discrete_sample_(p, rng)
     arr.append(values[ind])
   if cnt == -1:
     return arr[0]
@@ -15,13 +15,14 @@
 
 import argparse
 from os.path import expanduser
-from tensorflow.compat.v1 import gfile
 from collections import Counter
 import nltk
 import numpy as np
 import json
 import sys
 
+from airdialogue import file_io
+from airdialogue.prepro import tokenizer_backend
 from airdialogue.prepro.tokenize_lib import tokenize_kb
 
 from airdialogue.evaluator.metrics.f1 import f1_score
@@ -30,7 +31,6 @@ from airdialogue.evaluator.infer_utils import evaluate as evaluate_infer
 from airdialogue.evaluator.selfplay_utils import compute_reward
 
 from tqdm import tqdm
-import tensorflow.compat.v1 as tf
 
 FLAGS = None
 
@@ -59,14 +59,20 @@ def add_arguments(parser):
       type=str,
       default='score.json',
       help='output path for score json.')
+  parser.add_argument(
+      '--tokenizer',
+      type=str,
+      default='nltk',
+      choices=tokenizer_backend.BACKENDS,
+      help='tokenizer backend of the selfplay bleu, one of |nltk|fast|verify|')
 
 def score_human_data(flags):
   assert flags.true_data and flags.true_kb
   scores = []
   expanded_kb = expanduser(flags.true_kb)
   expanded_data = expanduser(flags.true_data)
-  f2 = gfile.Open(expanded_kb)
-  with gfile.Open(expanded_data) as f:
+  f2 = file_io.Open(expanded_kb)
+  with file_io.Open(expanded_data) as f:
     for line in tqdm(f):
       a = json.loads(line)
       kb_line = f2.readline()
@@ -110,11 +116,14 @@ def action_obj_to_str(o):
     o['status'] = 'unk'
   return o['name'], "_".join(['<fl_' + f + '>' for f in fl]), '<st_' + o['status'] + '>'
 
-def json_obj_to_tokens(o):
+def json_obj_to_tokens(o, tokenizer=None):
   d = o['dialogue']
   decapped = [' '.join(s.split(':')[1:]).strip() for s in d]
   one_string = ' '.join(decapped)
-  tokenized = nltk.word_tokenize(one_string)
+  if tokenizer is None:
+    tokenized = nltk.word_tokenize(one_string)
+  else:
+    tokenized = tokenizer.word_tokenize(one_string)
   return tokenized
 
 
@@ -124,9 +133,10 @@ def score_selfplay(flags):
 
   all_score = []
   bleu_scores = []
-  with tf.gfile.GFile(flags.pred_data) as f:
-    with tf.gfile.GFile(flags.true_data) as t:
-      with tf.gfile.GFile(flags.true_kb) as kb:
+  tokenizer = tokenizer_backend.get_backend(flags.tokenizer)
+  with file_io.GFile(flags.pred_data) as f:
+    with file_io.GFile(flags.true_data) as t:
+      with file_io.GFile(flags.true_kb) as kb:
         for pred_line, true_line, kb_line in tqdm(list(zip(f, t, kb))):
           pred_json_obj = json.loads(pred_line)
           true_json_obj = json.loads(true_line)
@@ -140,8 +150,8 @@ def score_selfplay(flags):
           score = compute_reward(pred_action, true_action, kb)
           all_score.append(score)
 
-          pred_raw_text = json_obj_to_tokens(pred_json_obj)
-          true_raw_text = json_obj_to_tokens(true_json_obj)
+          pred_raw_text = json_obj_to_tokens(pred_json_obj, tokenizer)
+          true_raw_text = json_obj_to_tokens(true_json_obj, tokenizer)
 
           b = compute_bleu([[true_raw_text]], [pred_raw_text])
           bleu_scores.append(b[0] * 100)
@@ -150,6 +160,8 @@ def score_selfplay(flags):
   avg_bleu = np.mean(bleu_scores)
   print('score=', avg_score)
   print('bleu=', avg_bleu)
+  if flags.tokenizer == 'verify':
+    print(tokenizer.report())
 
   return {'score': avg_score, 'bleu': avg_bleu}
 
@@ -162,16 +174,12 @@ def main(flags):
   else:
     score = score_selfplay(flags)
 
-  with tf.gfile.GFile(flags.output, 'w') as f:
+  with file_io.GFile(flags.output, 'w') as f:
     f.write(json.dumps(score))
 
 
-def run_main(unused):
-  main(FLAGS)
-
-
 if __name__ == '__main__':
   this_parser = argparse.ArgumentParser()
   add_arguments(this_parser)
   FLAGS, unparsed = this_parser.parse_known_args()
-  tf.app.run(main=run_main, argv=[sys.argv[0]] + unparsed)
+  main(FLAGS)
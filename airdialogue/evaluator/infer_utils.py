@@ -14,8 +14,8 @@
 
 """Utility for evaluating various tasks."""
 import codecs
-import tensorflow.compat.v1 as tf
 
+from airdialogue import file_io
 from airdialogue.evaluator.metrics import bleu
 from airdialogue.evaluator.metrics import rouge
 from airdialogue.evaluator.metrics import kl
@@ -57,8 +57,8 @@ def _kl(ref_file, trans_file, mode="brief"):
   reference_text = []
   role_tokens = []
   for reference_filename in ref_files:
-    with codecs.getreader("utf-8")(tf.gfile.GFile(reference_filename,
-                                                  "rb")) as fh:
+    with codecs.getreader("utf-8")(file_io.GFile(reference_filename,
+                                                 "rb")) as fh:
       for line in fh:
         reference, role = process_dialogue_infer(
             line.rstrip(), get_role_token=True)
@@ -66,7 +66,7 @@ def _kl(ref_file, trans_file, mode="brief"):
         role_tokens.append(role)
 
   translations = []
-  with codecs.getreader("utf-8")(tf.gfile.GFile(trans_file, "rb")) as fh:
+  with codecs.getreader("utf-8")(file_io.GFile(trans_file, "rb")) as fh:
     for line in fh:
       translations.append(line.rstrip().split(" "))
 
@@ -97,8 +97,8 @@ def _bleu(ref_file, trans_file, mode="brief"):
   ref_files = [ref_file]
   reference_text = []
   for reference_filename in ref_files:
-    with codecs.getreader("utf-8")(tf.gfile.GFile(reference_filename,
-                                                  "rb")) as fh:
+    with codecs.getreader("utf-8")(file_io.GFile(reference_filename,
+                                                 "rb")) as fh:
       reference_text.append(fh.readlines())
 
   per_segment_references = []
@@ -113,7 +113,7 @@ def _bleu(ref_file, trans_file, mode="brief"):
     role_tokens.append(role)
 
   translations = []
-  with codecs.getreader("utf-8")(tf.gfile.GFile(trans_file, "rb")) as fh:
+  with codecs.getreader("utf-8")(file_io.GFile(trans_file, "rb")) as fh:
     for line in fh:
       translations.append(line.rstrip().split(" "))
 
@@ -145,15 +145,15 @@ def _rouge(ref_file, summarization_file, mode="brief"):
 
   references = []
   role_tokens = []
-  with codecs.getreader("utf-8")(tf.gfile.GFile(ref_file, "rb")) as fh:
+  with codecs.getreader("utf-8")(file_io.GFile(ref_file, "rb")) as fh:
     for line in fh:
       ref, role = process_dialogue_infer(line.rstrip(), get_role_token=True)
       references.append(ref)
       role_tokens.append(role)
 
   hypotheses = []
-  with codecs.getreader("utf-8")(tf.gfile.GFile(summarization_file,
-                                                "rb")) as fh:
+  with codecs.getreader("utf-8")(file_io.GFile(summarization_file,
+                                               "rb")) as fh:
     for line in fh:
       hypotheses.append(line)
 
@@ -188,8 +188,8 @@ def process_dialogue_infer(file_line, get_role_token=False):
 def _accuracy(label_file, pred_file):
   """Compute accuracy, each line contains a label."""
 
-  with codecs.getreader("utf-8")(tf.gfile.GFile(label_file, "rb")) as label_fh:
-    with codecs.getreader("utf-8")(tf.gfile.GFile(pred_file, "rb")) as pred_fh:
+  with codecs.getreader("utf-8")(file_io.GFile(label_file, "rb")) as label_fh:
+    with codecs.getreader("utf-8")(file_io.GFile(pred_file, "rb")) as pred_fh:
       count = 0.0
       match = 0.0
       for label, pred in zip(label_fh, pred_fh):
@@ -0,0 +1,68 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""File access with the interface of gfile.
+
+Local paths are served by the standard library. Remote paths such as gs:// are
+delegated to tensorflow gfile, which is only imported when it is needed.
+"""
+import io
+import os
+
+
+def is_remote(path):
+  return '://' in str(path)
+
+
+def _gfile():
+  from tensorflow.compat.v1 import gfile  # pylint: disable=g-import-not-at-top
+  return gfile
+
+
+def Open(path, mode='r'):  # pylint: disable=invalid-name
+  """opens a file. text is read and written as utf-8 like gfile does."""
+  if is_remote(path):
+    return _gfile().GFile(path, mode)
+  if 'b' in mode:
+    return io.open(path, mode)
+  return io.open(path, mode, encoding='utf-8')
+
+
+GFile = Open
+
+
+def Exists(path):  # pylint: disable=invalid-name
+  if is_remote(path):
+    return _gfile().Exists(path)
+  return os.path.exists(path)
+
+
+def IsDirectory(path):  # pylint: disable=invalid-name
+  if is_remote(path):
+    return _gfile().IsDirectory(path)
+  return os.path.isdir(path)
+
+
+def MkDir(path):  # pylint: disable=invalid-name
+  if is_remote(path):
+    _gfile().MkDir(path)
+  else:
+    os.mkdir(path)
+
+
+def Remove(path):  # pylint: disable=invalid-name
+  if is_remote(path):
+    _gfile().Remove(path)
+  else:
+    os.remove(path)
@@ -16,9 +16,8 @@
 
 import argparse
 import os
-from tensorflow.compat.v1 import gfile
-import tensorflow.compat.v1 as tf
 
+from airdialogue import file_io
 from airdialogue.prepro.tokenize_lib import list_of_action_tokens_except_name
 from airdialogue.prepro.tokenize_lib import flatten_json
 from airdialogue.prepro.tokenize_lib import process_kb
@@ -61,9 +60,9 @@ def json_dump(o):
 def write_infer_json(data, kb, output_file_src, output_file_tgt
   , output_file_kb):
   """This function write both kb and main data into the files."""
-  f_src = gfile.Open(output_file_src, 'w')
-  f_tgt = gfile.Open(output_file_tgt, 'w')
-  f_kb = gfile.Open(output_file_kb, 'w')
+  f_src = file_io.Open(output_file_src, 'w')
+  f_tgt = file_io.Open(output_file_tgt, 'w')
+  f_kb = file_io.Open(output_file_kb, 'w')
   for entry, entry_kb in zip(data, kb):
     entire_dialogue = entry['dialogue'][:]
 
@@ -86,8 +85,8 @@ def main(FLAGS):
     print('kb_file', FLAGS.kb_file)
     print('output_prefix', FLAGS.output_prefix)
 
-  if not tf.io.gfile.isdir(output_dir):
-    gfile.MkDir(output_dir)
+  if not file_io.IsDirectory(output_dir):
+    file_io.MkDir(output_dir)
 
   input_data_file = FLAGS.data_file
   input_kb_file = FLAGS.kb_file
@@ -113,13 +112,9 @@ def main(FLAGS):
       output_kb_pattern.format(FLAGS.output_prefix+ '_infer_'))
 
 
-def run_main(unused):
-  main(FLAGS)
-
-
 if __name__ == '__main__':
   this_parser = argparse.ArgumentParser()
   add_arguments(this_parser)
   FLAGS, unparsed = this_parser.parse_known_args()
   # print FLAGS
-  tf.app.run(main=run_main, argv=[sys.argv[0]] + unparsed)
+  main(FLAGS)
@@ -0,0 +1,34 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Helpers for the worker pools of the simulator and prepro."""
+
+import collections
+
+
+def ordered_map(pool, func, all_args, window):
+  """same as pool.imap, but at most window results are pending at a time.
+
+  Results that finish early wait for their predecessors, so the window bounds
+  the memory used by results that cannot be written yet. Unlike pool.imap,
+  all_args is only consumed as results are taken, so that a stream of records
+  is not read ahead into memory.
+  """
+  pending = collections.deque()
+  for args in all_args:
+    pending.append(pool.apply_async(func, (args,)))
+    if len(pending) >= window:
+      yield pending.popleft().get()
+  while pending:
+    yield pending.popleft().get()
@@ -14,20 +14,29 @@
 """This file only tokenize one file at a time."""
 
 import argparse
+import collections
 import os
 import nltk
-from tensorflow.compat.v1 import gfile
-import tensorflow.compat.v1 as tf
 from tqdm import tqdm
 
+from airdialogue import file_io
+
+from airdialogue.prepro import tokenizer_backend
+
 from airdialogue.prepro.tokenize_lib import list_of_action_tokens_except_name
+from airdialogue.prepro.tokenize_lib import print_dialogue_stats
 from airdialogue.prepro.tokenize_lib import process_kb
+from airdialogue.prepro.tokenize_lib import iter_processed_records
 from airdialogue.prepro.tokenize_lib import process_main_data
+from airdialogue.prepro.tokenize_lib import TurnCache
 from airdialogue.prepro.tokenize_lib import word_tokenize
 from airdialogue.prepro.tokenize_lib import write_cat
 from airdialogue.prepro.tokenize_lib import write_completion
+from airdialogue.prepro.tokenize_lib import write_completion_entry
 from airdialogue.prepro.tokenize_lib import write_data
+from airdialogue.prepro.tokenize_lib import write_data_entry
 from airdialogue.prepro.tokenize_lib import write_self_play
+from airdialogue.prepro.tokenize_lib import write_self_play_entry
 from airdialogue.prepro.tokenize_lib import write_vocabulary
 # Standardization libs
 from airdialogue.prepro.standardize_data_lib import standardize_and_drop
@@ -134,6 +143,52 @@ def add_arguments(parser):
       default=None,
       help='[agent|customer] whether agent or customer starts empty conversations'
   )
+  parser.add_argument(
+      '--stream',
+      type='bool',
+      nargs='?',
+      const=True,
+      default=False,
+      help="""if enabled, the data and kb files are read once and every record
+                              is written to the outputs of all jobs right
+                              away, so that only the vocabulary is kept in
+                              memory. The outputs are the same.""")
+  parser.add_argument(
+      '--num_workers',
+      type=int,
+      default=1,
+      help="""number of processes that tokenize the records of the data file
+                              in chunks. The outputs are the same for any
+                              number of workers.""")
+  parser.add_argument(
+      '--chunk_size',
+      type=int,
+      default=1000,
+      help='number of records that a worker tokenizes at a time.')
+  parser.add_argument(
+      '--turn_cache_size',
+      type=int,
+      default=100000,
+      help="""number of tokenized turns that are cached by their raw text, so
+                              that repeated turns are tokenized once. 0
+                              disables the cache, which is always disabled
+                              with --tokenizer verify.""")
+  parser.add_argument(
+      '--turn_cache_file',
+      type=str,
+      default=None,
+      help="""file that the turn cache is loaded from if it exists and saved to
+                              at the end, to reuse it across runs with the
+                              same tokenizers.""")
+  parser.add_argument(
+      '--tokenizer',
+      type=str,
+      default='nltk',
+      choices=tokenizer_backend.BACKENDS,
+      help="""tokenizer backend, one of |nltk|fast|verify|. fast has the same
+                              output as nltk on AirDialogue text, and verify
+                              tokenizes with nltk and reports where fast
+                              differs.""")
 
 
 def generate_entry(intents, actions, expected_actions, dialogues, kbs,
@@ -185,10 +240,24 @@ def process_job_type(job_type_str, input_type):
   return all_jobs
 
 
-def load_data_from_jsons(FLAGS, input_data_file, input_kb_file, output_vab,
-                         output_all_vab, gen_cat, cat_files):
+def get_tokenizers(tokenizer):
+  """returns the sentence and word tokenizers of a backend, NLTK if None."""
+  if tokenizer is None:
+    return nltk.sent_tokenize, word_tokenize
+  return tokenizer.sent_tokenize, tokenizer.prepro_word_tokenize
+
+
+def load_data_from_jsons(FLAGS,
+                         input_data_file,
+                         input_kb_file,
+                         output_vab,
+                         output_all_vab,
+                         gen_cat,
+                         cat_files,
+                         cache=None,
+                         tokenizer=None):
   vocal_map = {}
-  sent_tokenize = nltk.sent_tokenize
+  sent_tokenize, word_tok = get_tokenizers(tokenizer)
 
   raw_data, raw_kb = load_and_drop(
       input_data_file,
@@ -206,9 +275,12 @@ def load_data_from_jsons(FLAGS, input_data_file, input_kb_file, output_vab,
   result = process_main_data(
       raw_data,
       sent_tokenize,
-      word_tokenize,
+      word_tok,
       vocal_map,
-      input_type=FLAGS.input_type)
+      input_type=FLAGS.input_type,
+      num_workers=FLAGS.num_workers,
+      chunk_size=FLAGS.chunk_size,
+      cache=cache)
   intents, actions, expected_actions, dialogues, vocal_map, boundaries1, boundaries2, cats = result
   frequency_cutoff = FLAGS.word_cutoff
   # 3 is the number of special tokens
@@ -237,9 +309,11 @@ def load_data_from_jsons_stream(FLAGS,
                                 output_all_vab,
                                 gen_cat,
                                 cat_files,
-                                self_play_start_turn=None):
+                                self_play_start_turn=None,
+                                cache=None,
+                                tokenizer=None):
   vocal_map = {}
-  sent_tokenize = nltk.sent_tokenize
+  sent_tokenize, word_tok = get_tokenizers(tokenizer)
 
   for raw_data, raw_kb in tqdm(
       load_and_drop_stream(
@@ -257,11 +331,12 @@ def load_data_from_jsons_stream(FLAGS,
     # if context, only intents, actions, vocal_map will be there
     result = process_main_data([raw_data],
                                sent_tokenize,
-                               word_tokenize,
+                               word_tok,
                                vocal_map,
                                stream=True,
                                input_type=FLAGS.input_type,
-                               self_play_start_turn=self_play_start_turn)
+                               self_play_start_turn=self_play_start_turn,
+                               cache=cache)
     intents, actions, expected_actions, dialogues, vocal_map, boundaries1, boundaries2, cats = result
     frequency_cutoff = FLAGS.word_cutoff
     # 3 is the number of special tokens
@@ -284,6 +359,153 @@ def load_data_from_jsons_stream(FLAGS,
     yield data
 
 
+def open_job_writers(FLAGS, all_jobs, output_data_pattern, output_kb_pattern,
+                     infer_flag_exists):
+  """opens the outputs of all jobs that are written from the default json.
+
+  Returns a list of (entry writer, open files) pairs.
+  """
+  prefix = FLAGS.output_prefix
+  outputs = []
+  if 'train' in all_jobs:
+    outputs.append((write_data_entry, [
+        output_data_pattern.format(prefix + '.'),
+        output_kb_pattern.format(prefix + '.')
+    ]))
+  if 'eval' in all_jobs:
+    outputs.append((write_data_entry, [
+        output_data_pattern.format(prefix + '.eval.'),
+        output_kb_pattern.format(prefix + '.eval.')
+    ]))
+  if 'infer' in all_jobs and not infer_flag_exists:
+    outputs.append((write_completion_entry, [
+        output_data_pattern.format(prefix + '.infer.src.'),
+        output_data_pattern.format(prefix + '.infer.tar.'),
+        output_kb_pattern.format(prefix + '.infer.')
+    ]))
+  if 'sp-train' in all_jobs:
+    outputs.append((write_self_play_entry, [
+        output_data_pattern.format(prefix + '.selfplay.'),
+        output_kb_pattern.format(prefix + '.selfplay.')
+    ]))
+  if 'sp-eval' in all_jobs:
+    outputs.append((write_self_play_entry, [
+        output_data_pattern.format(prefix + '.selfplay.eval.'),
+        output_kb_pattern.format(prefix + '.selfplay.eval.')
+    ]))
+  return [(writer, [file_io.Open(f, 'w') for f in files])
+          for writer, files in outputs]
+
+
+def process_jsons_stream(FLAGS,
+                         input_data_file,
+                         input_kb_file,
+                         output_vab,
+                         output_all_vab,
+                         gen_cat,
+                         cat_files,
+                         job_writers,
+                         cache=None,
+                         tokenizer=None):
+  """processes the default json in a single pass.
+
+  Every record is written with all job_writers as soon as it is processed, so
+  only the vocabulary and the categories are kept in memory. The outputs are
+  the same as the ones of load_data_from_jsons and the write functions.
+  """
+  # tokens of kbs and dialogues are counted separately so that the vocabulary
+  # has the same order as when all kbs are processed first.
+  kb_vocal_map = {}
+  data_vocal_map = {}
+  cats = [set([]), set([]), set([]), set([])]
+  min_length = None
+  sum_length = 0
+  max_length = None
+  max_diag_length = 0
+  max_turn1 = 0
+  num_records = 0
+  sent_tokenize, word_tok = get_tokenizers(tokenizer)
+  # kbs of the records that are being tokenized, possibly by workers.
+  raw_kbs = collections.deque()
+  load_stats = {}
+
+  def iter_raw_data():
+    for raw_data, raw_kb in load_and_drop_stream(
+        input_data_file,
+        input_kb_file,
+        drop_incorrect=not FLAGS.keep_incorrect,
+        verbose=FLAGS.verbose,
+        stats=load_stats):
+      raw_kbs.append(raw_kb)
+      yield raw_data
+
+  for entry, stats in tqdm(
+      iter_processed_records(
+          iter_raw_data(),
+          sent_tokenize,
+          word_tok,
+          data_vocal_map,
+          cats,
+          FLAGS.input_type,
+          num_workers=FLAGS.num_workers,
+          chunk_size=FLAGS.chunk_size,
+          cache=cache),
+      desc='processing stream'):
+    processed_kb, kb_vocal_map = process_kb([raw_kbs.popleft()],
+                                            kb_vocal_map,
+                                            stream=True)
+    entry['kb'] = processed_kb[0]
+    for writer, files in job_writers:
+      writer(entry, *files)
+    num_records += 1
+    if stats is not None:
+      length, max_turn_length, num_turns = stats
+      min_length = length if min_length is None else min(min_length, length)
+      max_length = length if max_length is None else max(max_length, length)
+      sum_length += length
+      max_diag_length = max(max_diag_length, max_turn_length)
+      max_turn1 = max(max_turn1, num_turns)
+
+  for _, files in job_writers:
+    for f in files:
+      f.close()
+  if FLAGS.verbose:
+    print(('loaded: ', load_stats['loaded'], '/', load_stats['total'], '=',
+           load_stats['loaded'] * 1.0 / max(load_stats['total'], 1)))
+  if FLAGS.input_type == 'dialogue' and num_records:
+    print_dialogue_stats(min_length, sum_length / float(num_records),
+                         max_length, max_diag_length, max_turn1)
+
+  vocal_map = kb_vocal_map
+  for word, frequency in data_vocal_map.items():
+    vocal_map[word] = vocal_map.get(word, 0) + frequency
+  frequency_cutoff = FLAGS.word_cutoff
+  # 3 is the number of special tokens
+  if FLAGS.verbose:
+    print('vocabulary before cutoff', len(vocal_map) + 3)
+  vocal_map = write_vocabulary(output_vab, output_all_vab, vocal_map,
+                               frequency_cutoff, FLAGS.keep_non_ascii)
+  if gen_cat:
+    if FLAGS.verbose:
+      print('writing category')
+    write_cat(cat_files, cats)
+  if FLAGS.verbose:
+    print(
+        'frequency_cutoff= {0}, vocabulary after cutoff'.format(
+            frequency_cutoff), len(vocal_map))
+
+
+def build_turn_cache(FLAGS):
+  """returns the TurnCache of the flags, or None if it is disabled."""
+  # cache hits would skip the comparison of verify.
+  if FLAGS.turn_cache_size <= 0 or FLAGS.tokenizer == 'verify':
+    return None
+  cache = TurnCache(FLAGS.turn_cache_size, FLAGS.tokenizer)
+  if FLAGS.turn_cache_file and file_io.Exists(FLAGS.turn_cache_file):
+    cache.load(FLAGS.turn_cache_file)
+  return cache
+
+
 def main(FLAGS):
   all_jobs = process_job_type(FLAGS.job_type, FLAGS.input_type)
   output_dir = FLAGS.output_dir
@@ -301,8 +523,8 @@ def main(FLAGS):
     print('infer_src_data_file', FLAGS.infer_src_data_file)
     print('infer_kb_file', FLAGS.infer_kb_file)
 
-  if not tf.io.gfile.isdir(output_dir):
-    gfile.MkDir(output_dir)
+  if not file_io.IsDirectory(output_dir):
+    file_io.MkDir(output_dir)
 
   input_data_file = FLAGS.data_file
   input_kb_file = FLAGS.kb_file
@@ -333,12 +555,26 @@ def main(FLAGS):
   sent_tokenize = nltk.sent_tokenize
 
   infer_flag_exists = FLAGS.infer_src_data_file or FLAGS.infer_kb_file
+  cache = build_turn_cache(FLAGS)
+  if FLAGS.tokenizer == 'verify' and FLAGS.num_workers > 1:
+    raise ValueError('--tokenizer verify requires --num_workers 1 to collect '
+                     'all mismatches.')
+  tokenizer = tokenizer_backend.get_backend(FLAGS.tokenizer)
 
   if any(j != 'infer' for j in all_jobs) or not infer_flag_exists:
     # We need to process the default json
-    data = load_data_from_jsons(FLAGS, input_data_file, input_kb_file,
-                                output_vab, output_all_vab, FLAGS.gen_cat,
-                                cat_files)
+    if FLAGS.stream:
+      job_writers = open_job_writers(FLAGS, all_jobs, output_data_pattern,
+                                     output_kb_pattern, infer_flag_exists)
+      process_jsons_stream(FLAGS, input_data_file, input_kb_file, output_vab,
+                           output_all_vab, FLAGS.gen_cat, cat_files,
+                           job_writers, cache, tokenizer)
+      # only the alternate infer json is left to be written below.
+      all_jobs = [j for j in all_jobs if j == 'infer' and infer_flag_exists]
+    else:
+      data = load_data_from_jsons(FLAGS, input_data_file, input_kb_file,
+                                  output_vab, output_all_vab, FLAGS.gen_cat,
+                                  cat_files, cache, tokenizer)
 
   if 'infer' in all_jobs and infer_flag_exists:
     # We need to process alternate infer json
@@ -346,7 +582,8 @@ def main(FLAGS):
                                                  FLAGS.infer_src_data_file,
                                                  FLAGS.infer_kb_file, None,
                                                  None, False, [],
-                                                 FLAGS.self_play_start_turn)
+                                                 FLAGS.self_play_start_turn,
+                                                 cache, tokenizer)
   if 'train' in all_jobs:
     if FLAGS.verbose:
       print('writing train data')
@@ -387,14 +624,18 @@ def main(FLAGS):
 
   if FLAGS.gen_special_token:
     # write all token file.
-    f_tokens = gfile.Open(all_token_file, 'w')
+    f_tokens = file_io.Open(all_token_file, 'w')
     for token in list(list_of_action_tokens_except_name):
       f_tokens.write(token + '\n')
     f_tokens.close()
 
-
-def run_main(unused):
-  main(FLAGS)
+  if FLAGS.tokenizer == 'verify':
+    print(tokenizer.report())
+  if cache is not None:
+    if FLAGS.verbose:
+      print('turn cache', cache.get_stats())
+    if FLAGS.turn_cache_file:
+      cache.save(FLAGS.turn_cache_file)
 
 
 if __name__ == '__main__':
@@ -402,4 +643,4 @@ if __name__ == '__main__':
   add_arguments(this_parser)
   FLAGS, unparsed = this_parser.parse_known_args()
   # print FLAGS
-  tf.app.run(main=run_main, argv=[sys.argv[0]] + unparsed)
+  main(FLAGS)
@@ -13,11 +13,12 @@
 # limitations under the License.
 """library to standardize data."""
 
-from tensorflow.compat.v1.io import gfile
 from tqdm import tqdm
 import string
 import json
 
+from airdialogue import file_io
+
 printable = set(string.printable)
 
 
@@ -64,8 +65,8 @@ def delete_non_ascii(s):
 
 def load_and_drop(data_file, kb_file, drop_incorrect=True, verbose=False):
   """ this function filter incorrect samples without standardization."""
-  fin_data = gfile.GFile(data_file)
-  fin_kb = gfile.GFile(kb_file)
+  fin_data = file_io.GFile(data_file)
+  fin_kb = file_io.GFile(kb_file)
   total_in_file = 0
   loaded_data = []
   loaded_kb = []
@@ -95,20 +96,27 @@ def load_and_drop(data_file, kb_file, drop_incorrect=True, verbose=False):
 def load_and_drop_stream(data_file,
                          kb_file,
                          drop_incorrect=True,
-                         verbose=False):
-  """ this function filter incorrect samples without standardization."""
+                         verbose=False,
+                         stats=None):
+  """ this function filter incorrect samples without standardization.
+
+  If stats is a dict, its 'total' and 'loaded' are set to the number of
+  samples in the file and the number of samples yielded, like the ratio that
+  load_and_drop prints.
+  """
+  if stats is not None:
+    stats['total'] = 0
+    stats['loaded'] = 0
   if verbose:
     print('loading stream')
-  fin_data = gfile.GFile(data_file)
-  if gfile.exists(kb_file):
-    fin_kb = gfile.GFile(kb_file)
+  fin_data = file_io.GFile(data_file)
+  if file_io.Exists(kb_file):
+    fin_kb = file_io.GFile(kb_file)
   else:
     fin_kb = None
   if verbose:
     print('gfile loaded: ', fin_data)
   for line1 in fin_data:
-    if verbose:
-      print(line1)
     if len(line1.strip()) < 10:
       continue
     line1 = delete_non_ascii(line1)
@@ -122,8 +130,12 @@ def load_and_drop_stream(data_file,
       kb_obj = json.loads(line2)
     else:
       kb_obj = None
+    if stats is not None:
+      stats['total'] += 1
     if (not drop_incorrect) or (
         'correct_sample' not in data_obj) or data_obj['correct_sample']:
+      if stats is not None:
+        stats['loaded'] += 1
       yield data_obj, kb_obj
 
 
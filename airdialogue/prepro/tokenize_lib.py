@@ -12,17 +12,24 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """library file for tokenize."""
+import collections
+import json
+import multiprocessing
 
 import nltk
 import numpy as np
-from tensorflow.compat.v1 import gfile
 from tqdm import tqdm
 
+from airdialogue import file_io
+from airdialogue import parallel
+
 start_of_turn1 = '<t1>'
 start_of_turn2 = '<t2>'
 end_of_dialogue = '<eod>'
 unk_token = '<unk>'
 list_of_action_tokens_except_name = set([])
+# state of a worker process, see init_worker.
+_worker = {}
 
 
 def tokenize_kb(kb_json):
@@ -213,94 +220,417 @@ def tokenize_action(action_json, first_name_cat, last_name_cat, flight_cat,
   return ' '.join(arr)
 
 
+def tokenize_turn(turn, sent_tok, word_tok):
+  """tokenizes the content of a turn into space separated tokens."""
+  sentences = sent_tok(turn)
+  tokenized_sents = []
+  for s in sentences:
+    words = word_tok(s)
+    tokenized_sents.append(' '.join(words))
+  return ' '.join(tokenized_sents)
+
+
+class TurnCache(object):
+  """A bounded LRU cache of tokenize_turn, keyed by the raw turn text.
+
+  Repeated turns, e.g. the templates of simulated dialogues, are tokenized
+  only once. The cache can be saved to and loaded from a file, which is only
+  valid for the same sentence and word tokenizers. tokenizer names them, and
+  is saved with the NLTK version so that files of other tokenizers are refused.
+  """
+
+  def __init__(self, max_size=100000, tokenizer='nltk'):
+    self.max_size = max_size
+    self.tokenizer = tokenizer
+    self.turns = collections.OrderedDict()
+    self.hits = 0
+    self.misses = 0
+    # turns tokenized since the last pop_updates, or None if not collected.
+    self.new_turns = None
+
+  def tokenize(self, turn, sent_tok, word_tok):
+    flat_content = self.turns.get(turn)
+    if flat_content is not None:
+      self.hits += 1
+      self.turns.move_to_end(turn)
+      return flat_content
+    self.misses += 1
+    flat_content = tokenize_turn(turn, sent_tok, word_tok)
+    self.add(turn, flat_content)
+    if self.new_turns is not None:
+      self.new_turns.append((turn, flat_content))
+    return flat_content
+
+  def add(self, turn, flat_content):
+    self.turns[turn] = flat_content
+    self.turns.move_to_end(turn)
+    if len(self.turns) > self.max_size:
+      self.turns.popitem(last=False)
+
+  def collect_updates(self):
+    """starts collecting the updates that pop_updates returns."""
+    self.new_turns = []
+
+  def pop_updates(self):
+    """returns and resets the hits, misses and new turns of a worker."""
+    updates = (self.hits, self.misses, self.new_turns)
+    self.hits = 0
+    self.misses = 0
+    self.new_turns = []
+    return updates
+
+  def merge_updates(self, updates):
+    """adds the updates of a worker cache, see pop_updates."""
+    hits, misses, new_turns = updates
+    self.hits += hits
+    self.misses += misses
+    for turn, flat_content in new_turns:
+      self.add(turn, flat_content)
+
+  def get_stats(self):
+    total = self.hits + self.misses
+    return {
+        'hits': self.hits,
+        'misses': self.misses,
+        'hit_rate': self.hits / float(total) if total else 0.0,
+        'size': len(self.turns)
+    }
+
+  def get_header(self):
+    return {'tokenizer': self.tokenizer, 'nltk_version': nltk.__version__}
+
+  def load(self, path):
+    """adds the turns of a file written by save with the same tokenizer."""
+    with file_io.Open(path, 'r') as f:
+      header = json.loads(f.readline() or 'null')
+      if header != self.get_header():
+        raise ValueError(
+            'turn cache {0} was saved with {1}, not {2}. delete it or use the '
+            'same tokenizer.'.format(path, header, self.get_header()))
+      for line in f:
+        turn, flat_content = json.loads(line)
+        self.add(turn, flat_content)
+
+  def save(self, path):
+    """writes a header and the turns as json lines, least recently used first.
+    """
+    with file_io.Open(path, 'w') as f:
+      f.write(json.dumps(self.get_header()) + '\n')
+      for turn, flat_content in self.turns.items():
+        f.write(json.dumps([turn, flat_content]) + '\n')
+
+
+def split_turn(turn):
+  """splits a raw turn into its content and its start and end of turn tokens."""
+  if turn.startswith('customer: '):
+    # agent:
+    return turn[10:].strip(), start_of_turn1, start_of_turn2
+  else:  # agent:
+    return turn[7:].strip(), start_of_turn2, start_of_turn1
+
+
+def format_turn(flat_content, sot, eot, last):
+  """adds the turn tokens to the tokenized content of a turn."""
+  if last:
+    return sot + ' ' + flat_content + ' ' + end_of_dialogue + ' ' + eot
+  else:
+    return sot + ' ' + flat_content
+
+
+def get_dialogue_boundaries(tokenized_turns):
+  """returns the boundaries of both roles of a dialogue in one pass.
+
+  tokenized_turns are the turns of a dialogue with their start/end tokens,
+  as produced by format_turn. Returns the boundaries of start_of_turn1 and
+  start_of_turn2, the length of the longest turn and the number of tokens of
+  the flat dialogue. The boundaries of a role are the token positions of its
+  turn starts followed by those of the next turn token, and the last turn
+  change of the dialogue has none.
+  """
+  # positions and tokens of the turn tokens in the flat dialogue.
+  turn_tokens = []
+  num_tokens = 0
+  max_turn_length = 0
+  for turn in tokenized_turns:
+    tokens = turn.split(' ')
+    for i, token in enumerate(tokens):
+      if token == start_of_turn1 or token == start_of_turn2:
+        turn_tokens.append((num_tokens + i, token))
+    num_tokens += len(tokens)
+    max_turn_length = max(max_turn_length, len(tokens))
+  if not tokenized_turns:
+    # the empty flat dialogue still splits into one empty token.
+    num_tokens = 1
+
+  starts = {start_of_turn1: [], start_of_turn2: []}
+  ends = {start_of_turn1: [], start_of_turn2: []}
+  for k, (position, token) in enumerate(turn_tokens):
+    # we don't find the end token for the last turn change.
+    if position >= num_tokens - 1:
+      break
+    assert k + 1 < len(turn_tokens), 'end token not found : ' + ' '.join(
+        tokenized_turns) + 'start=' + str(position + 1) + '/' + str(num_tokens)
+    end_position, end_token = turn_tokens[k + 1]
+    assert end_token != token, 'start token appeared twice: ' + ' '.join(
+        tokenized_turns)
+    starts[token].append(position)
+    ends[token].append(end_position)
+  boundaries1 = starts[start_of_turn1] + ends[start_of_turn1]
+  boundaries2 = starts[start_of_turn2] + ends[start_of_turn2]
+  return boundaries1, boundaries2, max_turn_length, num_tokens
+
+
+def get_dialogue_length(tokenized_turns):
+  """returns the number of tokens of the flat dialogue and its longest turn."""
+  turn_lengths = [len(turn.split(' ')) for turn in tokenized_turns]
+  # the empty flat dialogue still splits into one empty token.
+  return sum(turn_lengths) or 1, max(turn_lengths or [0])
+
+
+def format_boundaries(boundaries):
+  """serializes boundaries of get_dialogue_boundaries as a string of ints."""
+  return ' '.join([str(b) for b in boundaries])
+
+
+def parse_boundaries(boundaries):
+  """returns the boundaries of a serialized string as a list of ints."""
+  return [int(b) for b in boundaries.split()]
+
+
+def get_tokenized_dialogue(tokenized_turns):
+  """returns the flat dialogue and the serialized boundaries of both turns.
+
+  tokenized_turns are the turns of a dialogue with their start/end tokens,
+  as produced by format_turn.
+  """
+  flat_dialogue = ' '.join(tokenized_turns)
+  boundaries1, boundaries2, _, _ = get_dialogue_boundaries(tokenized_turns)
+  return flat_dialogue, format_boundaries(boundaries1), format_boundaries(
+      boundaries2)
+
+
+def process_dialogue(dialogue, sent_tok, word_tok, cache=None):
+  """tokenizes the turns of a raw dialogue, with a TurnCache if given."""
+  tokenized_dialogue = []
+  for i, turn in enumerate(dialogue):
+    turn, sot, eot = split_turn(turn)
+    if cache is None:
+      flat_content = tokenize_turn(turn, sent_tok, word_tok)
+    else:
+      flat_content = cache.tokenize(turn, sent_tok, word_tok)
+    tokenized_dialogue.append(
+        format_turn(flat_content, sot, eot, i == len(dialogue) - 1))
+  return tokenized_dialogue
+
+
 # Right now expected action is not used only one flight is considered.
+def process_record(loaded_json,
+                   sent_tok,
+                   word_tok,
+                   word_map,
+                   all_cat,
+                   input_type,
+                   self_play_start_turn=None,
+                   cache=None):
+  """processes one data record and counts its tokens into word_map.
+
+  all_cat are the first name, last name, flight and status category sets that
+  the actions are added to. Returns the processed record, a dict with intent,
+  action, expected_action if the record has one, and for dialogues dialogue,
+  boundaries1 and boundaries2, which are lists of ints as returned by
+  get_dialogue_boundaries. For dialogues, the (number of tokens, longest turn,
+  number of turns) of the dialogue are returned as well, else None.
+
+  Dialogues that come with a tokenized_dialogue field, e.g. from the simulator
+  with --tokenize, are not tokenized again. Otherwise their turns are looked up
+  in cache, a TurnCache, if given.
+  """
+  first_name_cat, last_name_cat, flight_cat, state_cat = all_cat
+  record = {}
+  if 'intent' in loaded_json:
+    intent = loaded_json['intent']
+    processed_intent = tokenize_intent(get_full_intent(intent))
+    record['intent'] = processed_intent
+    word_map = apply_word_map(processed_intent, word_map)
+  else:
+    record['intent'] = ''
+  if 'action' in loaded_json and loaded_json['action']:
+    action = loaded_json['action']
+    processed_action = tokenize_action(
+        action,
+        first_name_cat,
+        last_name_cat,
+        flight_cat,
+        state_cat,
+    )
+    record['action'] = processed_action
+    word_map = apply_word_map(processed_action, word_map)
+  else:
+    record['action'] = ''
+  if 'expected_action' in loaded_json:
+    expected_action = loaded_json['expected_action']
+    record['expected_action'] = tokenize_action(
+        expected_action,
+        first_name_cat,
+        last_name_cat,
+        flight_cat,
+        state_cat,
+    )
+
+  # NB for word map updates above:
+  # word map should contain everything in the supervised eval and training
+  # however, it should not contain expected_action since this is for self-play
+  # it contains tokens that has _, on flights.
+
+  # process dialogue only when input_type is dialogue
+  if input_type != 'dialogue':
+    return record, None
+  if 'tokenized_dialogue' in loaded_json:
+    tokenized_dialogue = loaded_json['tokenized_dialogue']
+  else:
+    tokenized_dialogue = process_dialogue(loaded_json['dialogue'], sent_tok,
+                                          word_tok, cache)
+  if 'boundaries1' in loaded_json and 'boundaries2' in loaded_json:
+    boundaries1 = parse_boundaries(loaded_json['boundaries1'])
+    boundaries2 = parse_boundaries(loaded_json['boundaries2'])
+    length, max_turn_length = get_dialogue_length(tokenized_dialogue)
+  else:
+    boundaries1, boundaries2, max_turn_length, length = (
+        get_dialogue_boundaries(tokenized_dialogue))
+  num_turns = (len(boundaries1) + len(boundaries2)) // 2
+  processed_dialogue = ' '.join(tokenized_dialogue)
+  record['boundaries1'] = boundaries1
+  # this is used only for inference files generation
+  record['boundaries2'] = boundaries2
+  if processed_dialogue == '' and \
+      self_play_start_turn in ['agent', 'customer']:
+    if self_play_start_turn == 'agent':
+      processed_dialogue = '<t2>'
+    else:
+      processed_dialogue = '<t1>'
+
+  record['dialogue'] = processed_dialogue
+  word_map = apply_word_map(processed_dialogue, word_map)
+  return record, (length, max_turn_length, num_turns)
+
+
+def init_worker(sent_tok,
+                word_tok,
+                input_type,
+                self_play_start_turn=None,
+                cache=None):
+  """initializes a worker process of process_chunk."""
+  _worker['sent_tok'] = sent_tok
+  _worker['word_tok'] = word_tok
+  _worker['input_type'] = input_type
+  _worker['self_play_start_turn'] = self_play_start_turn
+  if cache is not None:
+    # every worker continues from a copy of the cache of the parent.
+    cache.pop_updates()
+    cache.collect_updates()
+  _worker['cache'] = cache
+
+
+def process_chunk(raw_data):
+  """processes a chunk of records with process_record in a worker process.
+
+  Returns the processed records with their stats, and the word map, the
+  category sets, the action tokens and the cache updates of the chunk.
+  """
+  word_map = {}
+  all_cat = [set([]), set([]), set([]), set([])]
+  list_of_action_tokens_except_name.clear()
+  records = [
+      process_record(loaded_json, _worker['sent_tok'], _worker['word_tok'],
+                     word_map, all_cat, _worker['input_type'],
+                     _worker['self_play_start_turn'], _worker['cache'])
+      for loaded_json in raw_data
+  ]
+  cache = _worker['cache']
+  cache_updates = cache.pop_updates() if cache is not None else None
+  return (records, word_map, all_cat, set(list_of_action_tokens_except_name),
+          cache_updates)
+
+
+def _iter_chunks(iterable, chunk_size):
+  chunk = []
+  for item in iterable:
+    chunk.append(item)
+    if len(chunk) >= chunk_size:
+      yield chunk
+      chunk = []
+  if chunk:
+    yield chunk
+
+
+def iter_processed_records(raw_data,
+                           sent_tok,
+                           word_tok,
+                           word_map,
+                           all_cat,
+                           input_type,
+                           self_play_start_turn=None,
+                           num_workers=1,
+                           chunk_size=1000,
+                           cache=None):
+  """yields process_record of every record of raw_data, in order.
+
+  With num_workers > 1, chunks of chunk_size records are tokenized by a pool
+  of processes. The word maps, categories and action tokens of the chunks are
+  merged in order, so word_map, all_cat and list_of_action_tokens_except_name
+  end up the same as when the records are processed one after another. Each
+  worker has its own copy of cache, and their hits, misses and new turns are
+  merged into cache.
+  """
+  if num_workers <= 1:
+    for loaded_json in raw_data:
+      yield process_record(loaded_json, sent_tok, word_tok, word_map, all_cat,
+                           input_type, self_play_start_turn, cache)
+    return
+  pool = multiprocessing.Pool(
+      num_workers, init_worker,
+      (sent_tok, word_tok, input_type, self_play_start_turn, cache))
+  try:
+    for (records, chunk_word_map, chunk_cat, action_tokens,
+         cache_updates) in parallel.ordered_map(
+             pool, process_chunk, _iter_chunks(raw_data, chunk_size),
+             2 * num_workers):
+      if cache_updates is not None:
+        cache.merge_updates(cache_updates)
+      for word, frequency in chunk_word_map.items():
+        word_map[word] = word_map.get(word, 0) + frequency
+      for cat, new_cat in zip(all_cat, chunk_cat):
+        cat.update(new_cat)
+      list_of_action_tokens_except_name.update(action_tokens)
+      for record in records:
+        yield record
+  finally:
+    pool.terminate()
+    pool.join()
+
+
+def print_dialogue_stats(min_length, mean_length, max_length, max_diag_length,
+                         max_turn1):
+  print(('min_len: ${0}, mean_len: {1}, max_len: {2}'
+         'max_sent_len: {3}, max_turn: {4}').format(min_length, mean_length,
+                                                    max_length, max_diag_length,
+                                                    max_turn1))
+
+
 def process_main_data(raw_data,
                       sent_tok,
                       word_tok,
                       word_map,
                       input_type,
                       stream=False,
-                      self_play_start_turn=None):
-  """This function processes the main data."""
-
-  def process_dialogue(dialogue):
-    """This function processes dialogues."""
-
-    def do_tokenize(last, turn):
-      """This function tokenizes the diloagues of a specific turn."""
-      if turn.startswith('customer: '):
-        # agent:
-        turn = turn[10:].strip()
-        sot = start_of_turn1
-        eot = start_of_turn2
-      else:  # agent:
-        turn = turn[7:].strip()
-        sot = start_of_turn2
-        eot = start_of_turn1
-      sentences = sent_tok(turn)
-      tokenized_sents = []
-      for s in sentences:
-        words = word_tok(s)
-        tokenized_sents.append(' '.join(words))
-      flat_content = ' '.join(tokenized_sents)
-      if last:
-        return sot + ' ' + flat_content + ' ' + end_of_dialogue + ' ' + eot
-      else:
-        return sot + ' ' + flat_content
-
-    tokenized_dialogue = []
-    max_turn_length = 0
-    for i, turn in enumerate(dialogue):
-      tokenized_turn = do_tokenize(i == len(dialogue) - 1, turn)
-      max_turn_length = max(max_turn_length, len(tokenized_turn.split(' ')))
-      tokenized_dialogue.append(tokenized_turn)
-
-    return ' '.join(tokenized_dialogue), max_turn_length
-
-  def get_dialogue_boundary(start_token, flat_dialogue):
-    """This function gets the boundary array of the dialogues."""
-
-    def get_end_token(start, set_of_end_tokens, splitted_dialogues):
-      for i in range(start, len(splitted_dialogues)):
-        if splitted_dialogues[i] in set_of_end_tokens:
-          return i
-      assert False, 'end token not found : ' + ' '.join(
-          flat_dialogue) + 'start=' + str(start) + '/' + str(
-              len(splitted_dialogues))
-
-    def get_next_start_token(end_position, start_token, splitted_dialogues):
-      for i in range(end_position, len(splitted_dialogues)):
-        if splitted_dialogues[i] == start_token:
-          return i
-      return len(splitted_dialogues)
-
-    set_of_end_tokens = set([
-        start_of_turn1, start_of_turn2
-    ])  # taking out end_of_dialogue token because of dynamic rnn decoder
-    # set_of_end_tokens=set([start_of_turn1,start_of_turn2,end_of_dialogue])
-    splitted_dialogue = flat_dialogue.split(' ')
-    i = get_next_start_token(0, start_token, splitted_dialogue)
-    all_starts = []
-    all_ends = []
-    while i < len(splitted_dialogue
-                 ) - 1:  # we don't find the end token for the last turn change.
-      end_position = get_end_token(i + 1, set_of_end_tokens, splitted_dialogue)
-      err_msg = 'start token appeared twice: ' + flat_dialogue
-      assert splitted_dialogue[end_position] != start_token, err_msg
-      # all_res.append((i,end_position))
-      all_starts.append(i)
-      all_ends.append(end_position)
-      i = get_next_start_token(i + 1, start_token, splitted_dialogue)
-    return (all_starts, all_ends)
-
-  def serialize_boundary(start, end):
-    all_res = []
-    for s in start:
-      all_res.append(str(s))
-    for e in end:
-      all_res.append(str(e))
-    return ' '.join(all_res)
+                      self_play_start_turn=None,
+                      num_workers=1,
+                      chunk_size=1000,
+                      cache=None):
+  """This function processes the main data.
 
+  See process_record, and iter_processed_records for num_workers.
+  """
   intents = []
   actions = []
   expected_actions = []
@@ -314,87 +644,35 @@ def process_main_data(raw_data,
   last_name_cat = set([])
   flight_cat = set([])
   state_cat = set([])
+  all_cat = [first_name_cat, last_name_cat, flight_cat, state_cat]
 
-  d = raw_data
+  d = iter_processed_records(raw_data, sent_tok, word_tok, word_map, all_cat,
+                             input_type, self_play_start_turn, num_workers,
+                             chunk_size, cache)
   if not stream:
-    d = tqdm(raw_data, desc='process raw data')
-
-  for loaded_json in d:
-    # loaded_json = json.loads(delete_non_ascii(line))
-    # input_type
-    if 'intent' in loaded_json:
-      intent = loaded_json['intent']
-      processed_intent = tokenize_intent(get_full_intent(intent))
-      intents.append(processed_intent)
-      word_map = apply_word_map(processed_intent, word_map)
-    else:
-      intents.append('')
-    if 'action' in loaded_json and loaded_json['action']:
-      action = loaded_json['action']
-      processed_action = tokenize_action(
-          action,
-          first_name_cat,
-          last_name_cat,
-          flight_cat,
-          state_cat,
-      )
-      actions.append(processed_action)
-      word_map = apply_word_map(processed_action, word_map)
-    else:
-      actions.append('')
-    if 'expected_action' in loaded_json:
-      expected_action = loaded_json['expected_action']
-      # print "processed_intent", processed_intent
-      processed_expected_action = tokenize_action(
-          expected_action,
-          first_name_cat,
-          last_name_cat,
-          flight_cat,
-          state_cat,
-      )
-      # print "processed_action", processed_action
-      expected_actions.append(processed_expected_action)
-
-    # NB for word map updates above:
-    # word map should contain everything in the supervised eval and training
-    # however, it should not contain expected_action since this is for self-play
-    # it contains tokens that has _, on flights.
-
-    # process dialogue only when input_type is dialogue
-    if input_type == 'dialogue':
-      dialogue = loaded_json['dialogue']
-      processed_dialogue, max_diag_len_this = process_dialogue(dialogue)
-      max_diag_length = max(max_diag_length, max_diag_len_this)
-      t1_boundaries = get_dialogue_boundary(start_of_turn1, processed_dialogue)
-      t2_boundaries = get_dialogue_boundary(start_of_turn2, processed_dialogue)
-      max_turn1 = max(max_turn1, len(t1_boundaries[0]) + len(t2_boundaries[0]))
-      boundaries1.append(serialize_boundary(*t1_boundaries))
-      boundaries2.append(serialize_boundary(
-          *t2_boundaries))  # this is used only for inference files generation
-      if processed_dialogue == '' and \
-          self_play_start_turn in ['agent', 'customer']:
-        if self_play_start_turn == 'agent':
-          processed_dialogue = '<t2>'
-        else:
-          processed_dialogue = '<t1>'
-
-      dialogues.append(processed_dialogue)
-      length = len(processed_dialogue.split(' '))
+    d = tqdm(d, desc='process raw data', total=len(raw_data))
+
+  for record, stats in d:
+    intents.append(record['intent'])
+    actions.append(record['action'])
+    if 'expected_action' in record:
+      expected_actions.append(record['expected_action'])
+    if stats is not None:
+      length, max_turn_length, num_turns = stats
+      max_diag_length = max(max_diag_length, max_turn_length)
+      max_turn1 = max(max_turn1, num_turns)
+      boundaries1.append(record['boundaries1'])
+      boundaries2.append(record['boundaries2'])
+      dialogues.append(record['dialogue'])
       lengths.append(length)
-      word_map = apply_word_map(processed_dialogue, word_map)
 
   if input_type == 'dialogue' and not stream:  #  output stats only when input is dialogue
-    min_length, mean_length, max_length = np.min(lengths), np.mean(
-        lengths), np.max(lengths)
-    print(
-        ('min_len: ${0}, mean_len: {1}, max_len: {2}'
-         'max_sent_len: {3}, max_turn: {4}').format(min_length, mean_length,
-                                                    max_length, max_diag_length,
-                                                    max_turn1))
+    print_dialogue_stats(
+        np.min(lengths), np.mean(lengths), np.max(lengths), max_diag_length,
+        max_turn1)
 
   # return all the processed data. Some of them will be empty arrays when in
   # context mode.
-  all_cat = [first_name_cat, last_name_cat, flight_cat, state_cat]
   return intents, actions, expected_actions, dialogues, word_map, boundaries1, boundaries2, all_cat
 
 
@@ -411,7 +689,7 @@ def write_vocabulary(output_file, output_all_vocab_file, word_frequency,
   new_word_frequency = set([])
   # if output_filei not None, we write to file, otherwise we don't.
   if output_file:
-    f = gfile.Open(output_file, 'w')
+    f = file_io.Open(output_file, 'w')
   else:
     f = None
 
@@ -432,84 +710,100 @@ def write_vocabulary(output_file, output_all_vocab_file, word_frequency,
     f.close()
   # all vocab
   if output_all_vocab_file:
-    with gfile.Open(output_all_vocab_file, 'w') as f2:
+    with file_io.Open(output_all_vocab_file, 'w') as f2:
       f2.write(str(word_frequency))
   return new_word_frequency
 
 
 def write_cat(files, cats):
   for file, category in zip(files, cats):
-    with gfile.Open(file, 'w') as f:
+    with file_io.Open(file, 'w') as f:
       for cat in category:
         f.write(str(cat) + '\n')
 
 
+def write_data_entry(entry, f_data, f_kb, alt_infer=False):
+  """writes one entry of write_data."""
+  f_kb.write(flatten_json(entry['kb']) + '\n')
+  new_arr = []
+  if alt_infer:
+    new_arr = [entry['intent'], entry['dialogue'].replace('<eod> ', '')]
+  else:
+    new_arr = [
+        entry['intent'], entry['action'], entry['dialogue'],
+        format_boundaries(entry['boundaries1'])
+    ]
+    # only boundary1 is used but not 2 because it's not necessary.
+  f_data.write('|'.join(new_arr) + '\n')
+
+
 def write_data(data, output_file_data, output_file_kb, alt_infer=False):
   """This function writes data into a text file."""
-  f_data = gfile.Open(output_file_data, 'w')
-  f_kb = gfile.Open(output_file_kb, 'w')
+  f_data = file_io.Open(output_file_data, 'w')
+  f_kb = file_io.Open(output_file_kb, 'w')
   for entry in data:
-    f_kb.write(flatten_json(entry['kb']) + '\n')
-    new_arr = []
-    if alt_infer:
-      new_arr = [entry['intent'], entry['dialogue'].replace('<eod> ', '')]
-    else:
-      new_arr = [
-          entry['intent'], entry['action'], entry['dialogue'],
-          entry['boundaries1']
-      ]
-      # only boundary1 is used but not 2 because it's not necessary.
-    f_data.write('|'.join(new_arr) + '\n')
+    write_data_entry(entry, f_data, f_kb, alt_infer)
   f_data.close()
   f_kb.close()
 
 
 # this needs to be fixed..., turns are randomly selected right now.
+def write_completion_entry(entry, f_data_src, f_data_tar, f_kb):
+  """writes one entry of write_completion."""
+  bd1 = entry['boundaries1']
+  bd2 = entry['boundaries2']
+  start = bd1[0:len(bd1) // 2] + bd2[0:len(bd2) // 2]
+  end = bd1[len(bd1) // 2:] + bd2[len(bd2) // 2:]
+  # random_turn = random.randint(0, len(start) - 1)
+  for random_turn in range(len(start)):
+    f_kb.write(flatten_json(entry['kb']) + '\n')
+    # print len(start),len(end),len(bd),random_turn
+    turn_start = start[random_turn]
+    turn_end = end[random_turn]
+    dialogue_split = entry['dialogue'].split(' ')
+    # print turn_start,turn_end
+    dialogue_src = dialogue_split[0:turn_start + 1]
+    dialogue_tar = dialogue_split[turn_start + 1:turn_end + 1]
+    src_arr = [entry['intent'], ' '.join(dialogue_src)]
+    f_data_src.write('|'.join(src_arr) + '\n')
+    tar_arr = [entry['action'], ' '.join(dialogue_tar)]
+    f_data_tar.write('|'.join(tar_arr) + '\n')
+
+
 def write_completion(data, output_file_data_src, output_file_data_tar,
                      output_file_kb):
   """This function write both kb and main data into the files."""
-  f_data_src = gfile.Open(output_file_data_src, 'w')
-  f_data_tar = gfile.Open(output_file_data_tar, 'w')
-  f_kb = gfile.Open(output_file_kb, 'w')
+  f_data_src = file_io.Open(output_file_data_src, 'w')
+  f_data_tar = file_io.Open(output_file_data_tar, 'w')
+  f_kb = file_io.Open(output_file_kb, 'w')
   for entry in data:
-    bd1 = entry['boundaries1'].split(' ')
-    bd2 = entry['boundaries2'].split(' ')
-    start = bd1[0:len(bd1) // 2] + bd2[0:len(bd2) // 2]
-    end = bd1[len(bd1) // 2:] + bd2[len(bd2) // 2:]
-    # random_turn = random.randint(0, len(start) - 1)
-    for random_turn in range(len(start)):
-      f_kb.write(flatten_json(entry['kb']) + '\n')
-      # print len(start),len(end),len(bd),random_turn
-      turn_start = int(start[random_turn])
-      turn_end = int(end[random_turn])
-      dialogue_split = entry['dialogue'].split(' ')
-      # print turn_start,turn_end
-      dialogue_src = dialogue_split[0:turn_start + 1]
-      dialogue_tar = dialogue_split[turn_start + 1:turn_end + 1]
-      src_arr = [entry['intent'], ' '.join(dialogue_src)]
-      f_data_src.write('|'.join(src_arr) + '\n')
-      tar_arr = [entry['action'], ' '.join(dialogue_tar)]
-      f_data_tar.write('|'.join(tar_arr) + '\n')
+    write_completion_entry(entry, f_data_src, f_data_tar, f_kb)
 
   f_data_src.close()
   f_data_tar.close()
   f_kb.close()
 
 
+def write_self_play_entry(entry, f_data, f_kb):
+  """writes one entry of write_self_play."""
+  f_kb.write(flatten_json(entry['kb']) + '\n')
+  new_arr = [entry['intent'],
+             entry['expected_action']]  # intent and action are both needed
+  f_data.write('|'.join(new_arr) + '\n')
+
+
 def write_self_play(data, output_file_data, output_file_kb):
-  f_data = gfile.Open(output_file_data, 'w')
-  f_kb = gfile.Open(output_file_kb, 'w')
+  f_data = file_io.Open(output_file_data, 'w')
+  f_kb = file_io.Open(output_file_kb, 'w')
   for entry in data:
-    f_kb.write(flatten_json(entry['kb']) + '\n')
-    new_arr = [entry['intent'],
-               entry['expected_action']]  # intent and action are both needed
-    f_data.write('|'.join(new_arr) + '\n')
+    write_self_play_entry(entry, f_data, f_kb)
   f_data.close()
   f_kb.close()
 
 
+def patch_quote_tokens(tokens):
+  return [token.replace("''", '"').replace('``', '"') for token in tokens]
+
+
 def word_tokenize(tokens):
-  return [
-      token.replace("''", '"').replace('``', '"')
-      for token in nltk.word_tokenize(tokens)
-  ]
+  return patch_quote_tokens(nltk.word_tokenize(tokens))
@@ -0,0 +1,112 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests of the dialogue boundaries of tokenize_lib.
+
+Run with python -m unittest airdialogue.prepro.tokenize_lib_test.
+"""
+
+import random
+import unittest
+
+from airdialogue.prepro import tokenize_lib
+
+
+def get_dialogue_boundary(start_token, flat_dialogue):
+  """the boundaries of a role before get_dialogue_boundaries, as reference."""
+
+  def get_end_token(start, set_of_end_tokens, splitted_dialogues):
+    for i in range(start, len(splitted_dialogues)):
+      if splitted_dialogues[i] in set_of_end_tokens:
+        return i
+    assert False, 'end token not found : ' + ' '.join(
+        flat_dialogue) + 'start=' + str(start) + '/' + str(
+            len(splitted_dialogues))
+
+  def get_next_start_token(end_position, start_token, splitted_dialogues):
+    for i in range(end_position, len(splitted_dialogues)):
+      if splitted_dialogues[i] == start_token:
+        return i
+    return len(splitted_dialogues)
+
+  set_of_end_tokens = set([
+      tokenize_lib.start_of_turn1, tokenize_lib.start_of_turn2
+  ])  # taking out end_of_dialogue token because of dynamic rnn decoder
+  # set_of_end_tokens=set([start_of_turn1,start_of_turn2,end_of_dialogue])
+  splitted_dialogue = flat_dialogue.split(' ')
+  i = get_next_start_token(0, start_token, splitted_dialogue)
+  all_starts = []
+  all_ends = []
+  while i < len(splitted_dialogue
+               ) - 1:  # we don't find the end token for the last turn change.
+    end_position = get_end_token(i + 1, set_of_end_tokens, splitted_dialogue)
+    err_msg = 'start token appeared twice: ' + flat_dialogue
+    assert splitted_dialogue[end_position] != start_token, err_msg
+    # all_res.append((i,end_position))
+    all_starts.append(i)
+    all_ends.append(end_position)
+    i = get_next_start_token(i + 1, start_token, splitted_dialogue)
+  return (all_starts, all_ends)
+
+
+def _random_dialogue(rand):
+  """returns the tokenized turns of a random dialogue of alternating roles."""
+  roles = [tokenize_lib.start_of_turn1, tokenize_lib.start_of_turn2]
+  first = rand.randint(0, 1)
+  num_turns = rand.randint(0, 8)
+  tokenized_turns = []
+  for i in range(num_turns):
+    sot = roles[(first + i) % 2]
+    eot = roles[(first + i + 1) % 2]
+    content = ' '.join(
+        rand.choice(['hi', 'ok', 'flight', '.', '?']) if rand.random() < 0.9
+        else '' for _ in range(rand.randint(1, 6)))
+    tokenized_turns.append(
+        tokenize_lib.format_turn(content, sot, eot, i == num_turns - 1))
+  return tokenized_turns
+
+
+class DialogueBoundariesTest(unittest.TestCase):
+
+  def test_same_as_reference(self):
+    rand = random.Random(0)
+    for _ in range(5000):
+      tokenized_turns = _random_dialogue(rand)
+      flat_dialogue = ' '.join(tokenized_turns)
+      boundaries1, boundaries2, max_turn_length, num_tokens = (
+          tokenize_lib.get_dialogue_boundaries(tokenized_turns))
+      starts, ends = get_dialogue_boundary(tokenize_lib.start_of_turn1,
+                                           flat_dialogue)
+      self.assertEqual(boundaries1, starts + ends, flat_dialogue)
+      starts, ends = get_dialogue_boundary(tokenize_lib.start_of_turn2,
+                                           flat_dialogue)
+      self.assertEqual(boundaries2, starts + ends, flat_dialogue)
+      self.assertEqual(num_tokens, len(flat_dialogue.split(' ')))
+      self.assertEqual(
+          max_turn_length,
+          max([len(turn.split(' ')) for turn in tokenized_turns] or [0]))
+      self.assertEqual(
+          tokenize_lib.get_dialogue_length(tokenized_turns),
+          (num_tokens, max_turn_length))
+
+  def test_format_and_parse(self):
+    boundaries = [0, 5, 3, 9]
+    self.assertEqual(
+        tokenize_lib.parse_boundaries(
+            tokenize_lib.format_boundaries(boundaries)), boundaries)
+    self.assertEqual(tokenize_lib.format_boundaries([]), '')
+    self.assertEqual(tokenize_lib.parse_boundaries(''), [])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,223 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tokenizer backends of prepro and the evaluator.
+
+A backend provides sent_tokenize and word_tokenize with the same output as
+nltk.sent_tokenize and nltk.word_tokenize:
+
+  nltk    calls NLTK.
+  fast    skips the punkt model for texts without a potential sentence end,
+          and tokenizes the words of plain ascii sentences with only the
+          Treebank rules that can apply to them. Other texts go to NLTK.
+  verify  returns the output of nltk, and records where fast differs from it.
+"""
+
+import re
+
+import nltk
+from nltk.tokenize.destructive import NLTKWordTokenizer
+from nltk.tokenize.punkt import PunktLanguageVars
+
+from airdialogue.prepro.tokenize_lib import patch_quote_tokens
+
+BACKENDS = ['nltk', 'fast', 'verify']
+
+
+class NltkBackend(object):
+  """Tokenizes with NLTK."""
+
+  name = 'nltk'
+
+  def sent_tokenize(self, text):
+    return nltk.sent_tokenize(text)
+
+  def word_tokenize(self, text):
+    return nltk.word_tokenize(text)
+
+  def prepro_word_tokenize(self, text):
+    """same as tokenize_lib.word_tokenize, which patches quote tokens."""
+    return patch_quote_tokens(self.word_tokenize(text))
+
+
+# a potential sentence end of punkt, which never splits texts without one.
+_PERIOD_CONTEXT = PunktLanguageVars().period_context_re()
+# sentences that the fast path tokenizes. Quotes, brackets, non-ascii and
+# whitespace other than spaces are left to NLTK.
+_FAST_SENTENCE = re.compile(r"[A-Za-z0-9 .,?!:;'$%&@#/+=_-]*\Z")
+# the MacIntyre contractions, which are left to NLTK as well.
+_CONTRACTIONS = re.compile(
+    r"(?i)cannot|d'ye|gimme|gonna|gotta|lemme|more'n|wanna|'tis|'twas")
+
+# the rules of NLTKWordTokenizer that can match _FAST_SENTENCE, in their order,
+# as of NLTK 3.10.
+_START_QUOTE = (
+    re.compile(r"(?i)(?<!\w)(\')(?!(?:re|ve|ll|m|t|s|d|n)\b)(?=\w)"), r"\1 ")
+_FINAL_PERIOD = (re.compile(r'([^\.])(\.)([\]\)}>"\'' u'\u00bb\u201d\u2019 '
+                            r']*)\s*$'), r'\1 \2 \3 ')
+_COMMA_COLON = (re.compile(r'([:,])([^\d])'), r' \1 \2')
+_FINAL_COMMA_COLON = (re.compile(r'([:,])$'), r' \1 ')
+_ELLIPSIS = (re.compile(r'\.{2,}'), r' \g<0> ')
+_SYMBOLS = (re.compile(r'[;@#$%&]'), r' \g<0> ')
+_FINAL_PERIOD2 = (re.compile(r'([^\.])(\.)([\]\)}>"\']*)\s*$'), r'\1 \2\3 ')
+_QUESTION_EXCLAMATION = (re.compile(r'[?!]'), r' \g<0> ')
+_QUOTE = (re.compile(r"([^'])' "), r"\1 ' ")
+_DOUBLE_DASHES = (re.compile(r'--'), r' -- ')
+_SPACES = (re.compile(r'\s+'), ' ')
+_CLITICS = [(re.compile(r"([^' ])('[sS]|'[mM]|'[dD]|') "), r'\1 \2 '),
+            (re.compile(r"([^' ])('ll|'LL|'re|'RE|'ve|'VE|n't|N'T) "),
+             r'\1 \2 ')]
+
+
+def _rules_match_nltk():
+  """whether the rules above are still those of the installed NLTK."""
+  tokenizer = NLTKWordTokenizer
+  try:
+    nltk_rules = [tokenizer.STARTING_QUOTES[4]]
+    nltk_rules += [tokenizer.PUNCTUATION[i] for i in [0, 1, 2, 3, 4, 6, 7, 8]]
+    nltk_rules += [tokenizer.DOUBLE_DASHES] + tokenizer.ENDING_QUOTES[3:6]
+    num_rules = [
+        len(tokenizer.STARTING_QUOTES),
+        len(tokenizer.PUNCTUATION),
+        len(tokenizer.ENDING_QUOTES),
+        len(tokenizer.CONTRACTIONS2),
+        len(tokenizer.CONTRACTIONS3)
+    ]
+  except (AttributeError, IndexError, TypeError):
+    return False
+  rules = [
+      _START_QUOTE, _FINAL_PERIOD, _COMMA_COLON, _FINAL_COMMA_COLON, _ELLIPSIS,
+      _SYMBOLS, _FINAL_PERIOD2, _QUESTION_EXCLAMATION, _QUOTE, _DOUBLE_DASHES,
+      _SPACES
+  ] + _CLITICS
+  key = lambda rule: (rule[0].pattern, rule[0].flags, rule[1])
+  return (num_rules == [5, 10, 6, 8, 2] and
+          list(map(key, rules)) == list(map(key, nltk_rules)))
+
+
+# the fast path is only taken while the installed NLTK has the same rules.
+RULES_MATCH_NLTK = _rules_match_nltk()
+
+
+def _sub(rule, text):
+  regexp, substitution = rule
+  return regexp.sub(substitution, text)
+
+
+class FastBackend(NltkBackend):
+  """Tokenizes the common cases with precompiled regular expressions."""
+
+  name = 'fast'
+
+  def __init__(self):
+    self.treebank = NLTKWordTokenizer()
+
+  def sent_tokenize(self, text):
+    if _PERIOD_CONTEXT.search(text) is None:
+      # punkt returns such a text as one sentence, without trailing spaces.
+      text = text.rstrip()
+      return [text] if text else []
+    return nltk.sent_tokenize(text)
+
+  def word_tokenize(self, text):
+    return [
+        token for sentence in self.sent_tokenize(text)
+        for token in self.tokenize_sentence(sentence)
+    ]
+
+  def tokenize_sentence(self, sentence):
+    """same as NLTKWordTokenizer().tokenize(sentence)."""
+    if (not RULES_MATCH_NLTK or _FAST_SENTENCE.match(sentence) is None or
+        "''" in sentence or _CONTRACTIONS.search(sentence) is not None):
+      return self.treebank.tokenize(sentence)
+    # the rules are applied in the order of NLTKWordTokenizer.tokenize.
+    has_quote = "'" in sentence
+    if has_quote:
+      sentence = _sub(_START_QUOTE, sentence)
+    if '.' in sentence:
+      sentence = _sub(_FINAL_PERIOD, sentence)
+    if ',' in sentence or ':' in sentence:
+      sentence = _sub(_COMMA_COLON, sentence)
+      sentence = _sub(_FINAL_COMMA_COLON, sentence)
+    if '..' in sentence:
+      sentence = _sub(_ELLIPSIS, sentence)
+    sentence = _sub(_SYMBOLS, sentence)
+    if '.' in sentence:
+      sentence = _sub(_FINAL_PERIOD2, sentence)
+    if '?' in sentence or '!' in sentence:
+      sentence = _sub(_QUESTION_EXCLAMATION, sentence)
+    if has_quote:
+      sentence = _sub(_QUOTE, sentence)
+    if '--' in sentence:
+      sentence = _sub(_DOUBLE_DASHES, sentence)
+    if not has_quote:
+      return sentence.split()
+    sentence = _sub(_SPACES, ' ' + sentence + ' ')
+    for rule in _CLITICS:
+      sentence = _sub(rule, sentence)
+    return sentence.split()
+
+
+class VerifyBackend(NltkBackend):
+  """Tokenizes with NLTK and compares every output with FastBackend.
+
+  Mismatches are counted, and the first max_examples of them are kept as
+  (function name, text, nltk output, fast output).
+  """
+
+  name = 'verify'
+
+  def __init__(self, max_examples=10):
+    self.fast = FastBackend()
+    self.max_examples = max_examples
+    self.num_checked = 0
+    self.num_mismatches = 0
+    self.examples = []
+
+  def _check(self, name, text, expected, actual):
+    self.num_checked += 1
+    if expected != actual:
+      self.num_mismatches += 1
+      if len(self.examples) < self.max_examples:
+        self.examples.append((name, text, expected, actual))
+    return expected
+
+  def sent_tokenize(self, text):
+    return self._check('sent_tokenize', text, nltk.sent_tokenize(text),
+                       self.fast.sent_tokenize(text))
+
+  def word_tokenize(self, text):
+    return self._check('word_tokenize', text, nltk.word_tokenize(text),
+                       self.fast.word_tokenize(text))
+
+  def report(self):
+    """returns a summary of the mismatches."""
+    lines = [
+        'fast tokenizer mismatches: {0} of {1}'.format(self.num_mismatches,
+                                                       self.num_checked)
+    ]
+    for name, text, expected, actual in self.examples:
+      lines.append('{0}({1!r}):\n  nltk: {2!r}\n  fast: {3!r}'.format(
+          name, text, expected, actual))
+    return '\n'.join(lines)
+
+
+def get_backend(name):
+  """returns a new backend by its name, one of BACKENDS."""
+  if name == 'nltk':
+    return NltkBackend()
+  if name == 'fast':
+    return FastBackend()
+  if name == 'verify':
+    return VerifyBackend()
+  raise ValueError('unknown tokenizer backend: ' + str(name))
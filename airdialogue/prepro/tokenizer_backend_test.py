@@ -0,0 +1,88 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compares the fast tokenizer backend with NLTK on random texts.
+
+Run with python -m unittest airdialogue.prepro.tokenizer_backend_test. The
+sentence tests need the punkt data of NLTK and are skipped without it.
+"""
+
+import random
+import unittest
+
+import nltk
+from nltk.tokenize.destructive import NLTKWordTokenizer
+
+from airdialogue.prepro import tokenizer_backend
+
+_WORDS = [
+    'I', "i'm", "don't", "can't", 'Mar', '18', '3.5', 'e.g.', 'U.S.', "it's",
+    "dogs'", "'hello", 'ok', 'wanna', 'cannot', 'St.', "you'll", "We'VE",
+    "N'T", 'x', 'a-b', '--', '...', 'Dallas', 'DFW', '$100', '8:30', 'no,'
+]
+_CHARS = 'aB1 .,?!:;\'$%&@#/+=_-"()`*\t'
+_NUM_TEXTS = 20000
+
+
+def _random_texts(seed):
+  """yields random character strings and random sentences of _WORDS."""
+  rand = random.Random(seed)
+  for _ in range(_NUM_TEXTS):
+    if rand.random() < 0.5:
+      yield ''.join(rand.choice(_CHARS) for _ in range(rand.randint(0, 12)))
+    else:
+      words = [
+          rand.choice(_WORDS) + rand.choice(['', '', '.', ',', '?', "'", '!'])
+          for _ in range(rand.randint(0, 6))
+      ]
+      yield (rand.choice(['', ' ', "'"]) + ' '.join(words) +
+             rand.choice(['', ' ', '.', '. ', "'"]))
+
+
+def _has_punkt():
+  try:
+    nltk.sent_tokenize('Hi. Bye.')
+  except LookupError:
+    return False
+  return True
+
+
+class FastBackendTest(unittest.TestCase):
+
+  def setUp(self):
+    self.fast = tokenizer_backend.FastBackend()
+
+  def test_rules_match_nltk(self):
+    self.assertTrue(tokenizer_backend.RULES_MATCH_NLTK)
+
+  def test_tokenize_sentence(self):
+    treebank = NLTKWordTokenizer()
+    for text in _random_texts(0):
+      self.assertEqual(
+          self.fast.tokenize_sentence(text), treebank.tokenize(text), text)
+
+  @unittest.skipUnless(_has_punkt(), 'needs the punkt data of NLTK')
+  def test_sent_tokenize(self):
+    for text in _random_texts(1):
+      self.assertEqual(
+          self.fast.sent_tokenize(text), nltk.sent_tokenize(text), text)
+
+  @unittest.skipUnless(_has_punkt(), 'needs the punkt data of NLTK')
+  def test_word_tokenize(self):
+    for text in _random_texts(2):
+      self.assertEqual(
+          self.fast.word_tokenize(text), nltk.word_tokenize(text), text)
+
+
+if __name__ == '__main__':
+  unittest.main()
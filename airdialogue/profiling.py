@@ -0,0 +1,178 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Opt-in wall-clock timers and counters for the phases of a run.
+
+Code is instrumented with phase and count, which do nothing until enable is
+called:
+
+  with profiling.phase('dialogue'):
+    ...
+  profiling.count('turns', len(utterance))
+
+Phases nest, and a phase entered within another one is reported as
+'outer/inner'.
+"""
+
+import time
+
+
+class _NullPhase(object):
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase(object):
+  """times one execution of a phase of a Profiler."""
+
+  def __init__(self, profiler, name):
+    self.profiler = profiler
+    self.name = name
+
+  def __enter__(self):
+    stack = self.profiler.stack
+    if stack:
+      self.full_name = stack[-1] + '/' + self.name
+    else:
+      self.full_name = self.name
+    stack.append(self.full_name)
+    self.start = time.time()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    seconds = time.time() - self.start
+    profiler = self.profiler
+    profiler.stack.pop()
+    profiler.seconds[self.full_name] = profiler.seconds.get(self.full_name,
+                                                            0) + seconds
+    profiler.calls[self.full_name] = profiler.calls.get(self.full_name, 0) + 1
+    return False
+
+
+class Profiler(object):
+  """Accumulates the time and calls of every phase and named counters."""
+
+  def __init__(self):
+    self.start = time.time()
+    self.stack = []
+    self.seconds = {}
+    self.calls = {}
+    self.counters = {}
+    # number of profilers whose stats were merged into this one.
+    self.num_merged = 0
+
+  def phase(self, name):
+    return _Phase(self, name)
+
+  def count(self, name, n=1):
+    self.counters[name] = self.counters.get(name, 0) + n
+
+  def get_stats(self):
+    return {
+        'seconds': dict(self.seconds),
+        'calls': dict(self.calls),
+        'counters': dict(self.counters)
+    }
+
+  def merge(self, stats):
+    """adds the stats of another profiler, e.g. of a worker process."""
+    for key, target in [('seconds', self.seconds), ('calls', self.calls),
+                        ('counters', self.counters)]:
+      for name, value in stats[key].items():
+        target[name] = target.get(name, 0) + value
+    self.num_merged += 1
+
+  def report(self):
+    """returns a summary of the phases and counters as a table."""
+    wall = time.time() - self.start
+    lines = ['{0:<40}{1:>10}{2:>12}{3:>9}'.format('phase', 'calls', 'seconds',
+                                                  'share')]
+    for name in sorted(self.seconds):
+      depth = name.count('/')
+      label = '  ' * depth + name.split('/')[-1]
+      lines.append('{0:<40}{1:>10}{2:>12.3f}{3:>8.1f}%'.format(
+          label, self.calls[name], self.seconds[name],
+          100.0 * self.seconds[name] / max(wall, 1e-9)))
+    dialogues = self.counters.get('dialogues', 0)
+    lines.append('{0:<40}{1:>10}{2:>14}'.format('counter', 'total',
+                                                'per dialogue'))
+    for name in sorted(self.counters):
+      per_dialogue = self.counters[name] / float(dialogues) if dialogues else 0
+      lines.append('{0:<40}{1:>10}{2:>14.2f}'.format(name, self.counters[name],
+                                                     per_dialogue))
+    lines.append('wall time {0:.3f}s'.format(wall))
+    if self.num_merged:
+      lines.append('phases of other processes are summed, so shares can '
+                   'exceed 100%.')
+    return '\n'.join(lines)
+
+
+# the profiler that phases and counters report to, or None.
+_active = None
+
+
+def enable():
+  """starts profiling into a new Profiler and returns it."""
+  global _active
+  _active = Profiler()
+  return _active
+
+
+def disable():
+  """stops profiling and returns the Profiler, or None if it was disabled."""
+  global _active
+  profiler, _active = _active, None
+  return profiler
+
+
+def get_profiler():
+  return _active
+
+
+def phase(name):
+  """returns a context manager that times the phase name if enabled."""
+  if _active is None:
+    return _NULL_PHASE
+  return _active.phase(name)
+
+
+def count(name, n=1):
+  if _active is not None:
+    _active.count(name, n)
+
+
+def timed(iterable, name):
+  """returns an iterator over iterable that times producing items as name."""
+  if _active is None:
+    return iter(iterable)
+  return _timed(iter(iterable), name)
+
+
+_END = object()
+
+
+def _timed(iterator, name):
+  while True:
+    with phase(name):
+      item = next(iterator, _END)
+    if item is _END:
+      return
+    yield item
@@ -0,0 +1,166 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Batched writer for files of json lines."""
+import gzip
+import json
+import queue
+import threading
+
+from airdialogue import file_io
+
+COMPRESSION_SUFFIXES = {'.gz': 'gzip', '.zst': 'zstd'}
+ENCODERS = ['json', 'orjson', 'auto']
+
+
+class Encoded(str):
+  """A record that is already serialized, e.g. by Knowledgebase.get_json_str."""
+
+
+def get_compression(path):
+  """returns the compression implied by the suffix of path, or None."""
+  for suffix in COMPRESSION_SUFFIXES:
+    if str(path).endswith(suffix):
+      return COMPRESSION_SUFFIXES[suffix]
+  return None
+
+
+def get_encoder(name='json'):
+  """returns a function that serializes a record into a line of json.
+
+  json produces the same output as json.dumps. orjson is faster but drops the
+  whitespace after separators, so it is only used when asked for. auto picks
+  orjson if it is installed and json otherwise.
+  """
+  if name not in ENCODERS:
+    raise ValueError('unknown json encoder: ' + str(name))
+  if name in ['orjson', 'auto']:
+    try:
+      import orjson  # pylint: disable=g-import-not-at-top
+      return lambda record: orjson.dumps(record).decode('utf-8')
+    except ImportError:
+      if name == 'orjson':
+        raise
+  return json.dumps
+
+
+def _open_binary(path, compression):
+  f = file_io.Open(path, 'wb')
+  if compression == 'gzip':
+    # no file name and time in the header, so that outputs are reproducible.
+    return gzip.GzipFile(filename='', mode='wb', fileobj=f, mtime=0), f
+  if compression == 'zstd':
+    try:
+      import zstandard  # pylint: disable=g-import-not-at-top
+    except ImportError:
+      f.close()
+      raise ImportError('zstd compression requires the zstandard package.')
+    return zstandard.ZstdCompressor().stream_writer(f), f
+  if compression is not None:
+    raise ValueError('unknown compression: ' + str(compression))
+  return f, None
+
+
+class RecordWriter(object):
+  """Writes records as json lines, batch_size records at a time.
+
+  Batches are serialized and written on a background thread. At most
+  queue_size batches wait to be written, so a slow file blocks the producer
+  instead of using up memory. compression is gzip, zstd or None and is implied
+  by the suffix of path (.gz, .zst) by default. Records wrapped in Encoded are
+  written as they are. Blocks of lines that were serialized elsewhere, e.g. in
+  worker processes, are written with write_encoded.
+  """
+
+  def __init__(self,
+               path,
+               batch_size=1000,
+               queue_size=8,
+               encoder='json',
+               compression='infer'):
+    if compression == 'infer':
+      compression = get_compression(path)
+    self.path = path
+    self.batch_size = batch_size
+    self.encode = get_encoder(encoder)
+    self.stream, self.raw = _open_binary(path, compression)
+    self.batch = []
+    self.error = None
+    self.closed = False
+    self.queue = queue.Queue(maxsize=queue_size)
+    self.thread = threading.Thread(target=self._consume)
+    self.thread.daemon = True
+    self.thread.start()
+
+  def _encode_line(self, record):
+    if isinstance(record, Encoded):
+      return record + '\n'
+    return self.encode(record) + '\n'
+
+  def _consume(self):
+    while True:
+      batch = self.queue.get()
+      if batch is None:
+        return
+      if self.error is not None:
+        continue
+      try:
+        if isinstance(batch, list):
+          lines = ''.join([self._encode_line(record) for record in batch])
+        else:
+          lines = batch
+        self.stream.write(lines.encode('utf-8'))
+      except Exception as e:  # pylint: disable=broad-except
+        self.error = e
+
+  def _check_error(self):
+    if self.error is not None:
+      raise self.error
+
+  def flush(self):
+    """hands the pending records over to the background thread."""
+    self._check_error()
+    if self.batch:
+      self.queue.put(self.batch)
+      self.batch = []
+
+  def write(self, record):
+    self.batch.append(record)
+    if len(self.batch) >= self.batch_size:
+      self.flush()
+
+  def write_encoded(self, lines):
+    """writes a string of already serialized, newline terminated records."""
+    self.flush()
+    self.queue.put(lines)
+
+  def close(self):
+    if self.closed:
+      return
+    self.closed = True
+    try:
+      self.flush()
+    finally:
+      self.queue.put(None)
+      self.thread.join()
+      self.stream.close()
+      if self.raw is not None:
+        self.raw.close()
+    self._check_error()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
@@ -0,0 +1,355 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""This file simulates many dialogues at once, phase by phase."""
+
+import numpy as np
+from airdialogue import profiling
+from airdialogue.context_generator.src import epoch_calendar
+from airdialogue.context_generator.src import utils
+from airdialogue.simulator import interaction
+
+# keys of the customer condition that are set by fulfill_basic_requirement.
+basic_keys = [
+    'departure_airport', 'return_airport', 'departure_month', 'departure_day',
+    'return_month', 'return_day'
+]
+# keys of the customer condition that are negotiated, in the order in which
+# check_condition visits them.
+negotiated_keys = [
+    'departure_time', 'return_time', 'class', 'max_price', 'max_connections',
+    'airline_preference'
+]
+
+
+def get_column(all_flights, positions, key):
+  """returns the key of the flights at positions of all_flights as an array.
+
+  Strings are kept in object arrays, which are much faster to build than
+  arrays of unicode.
+  """
+  values = [all_flights[j][key] for j in positions]
+  profiling.count('kb_fields_read', len(values))
+  if values and isinstance(values[0], str):
+    return np.asarray(values, dtype=object)
+  return np.asarray(values)
+
+
+def _group_by(keys):
+  """maps every key to the positions at which it appears, in order."""
+  groups = {}
+  for i, key in enumerate(keys):
+    groups.setdefault(key, []).append(i)
+  return groups
+
+
+class BatchInteraction(interaction.Interaction):
+  """Simulates a batch of dialogues side by side.
+
+  The dialogues of a batch go through the phases of generate_dialogue
+  together. The random draws of a phase are made for the whole batch at once,
+  and the negotiation checks the conditions of all dialogues against all of
+  their flights with boolean arrays of shape [batch, num_flights]. Dialogues
+  follow the same distribution as the ones of generate_dialogue, but the random
+  draws are made in a different order.
+  """
+
+  def __init__(self, fact_obj, batch_size=1000, **kwargs):
+    super(BatchInteraction, self).__init__(fact_obj, **kwargs)
+    # number of contexts that are simulated together by simulator_lib.
+    self.batch_size = batch_size
+
+  def get_templates(self, list_of_templates, size):
+    """draws a template for each of size dialogues."""
+    if self.fix_resp_candidate:
+      choices = np.zeros(size, dtype=int)
+    else:
+      choices = np.random.randint(0, len(list_of_templates), size)
+    list_of_templates = [self.template(t) for t in list_of_templates]
+    return [list_of_templates[c] for c in choices]
+
+  def say(self, turn, utterances, rows, table, keys=None, args=None):
+    """appends a turn to the utterance of every row.
+
+    The template of a row is drawn from table, or from table[keys[j]] if keys
+    are given. The template is formatted with args[j] unless it is None.
+    """
+    if keys is None:
+      groups = {None: list(range(len(rows)))}
+    else:
+      groups = _group_by(keys)
+    for key, members in groups.items():
+      templates = self.get_templates(table if key is None else table[key],
+                                     len(members))
+      for j, template in zip(members, templates):
+        if args is not None and args[j] is not None:
+          template = template.format(*args[j])
+        utterances[rows[j]].append(turn(template))
+
+  def generate_dialogues(self, customers, knowledge_bases):
+    """Same as generate_dialogue for a batch of contexts."""
+    n = len(customers)
+    fact_obj = self.fact_obj
+    kb_jsons = [kb.get_json_view() for kb in knowledge_bases]
+    cus_conds = [customer.get_customer_condition() for customer in customers]
+    ag_conds = [{} for _ in range(n)]
+    utterances = [[] for _ in range(n)]
+    all_rows = list(range(n))
+    # 0. decides who speaks first 0--customer, 1--agent
+    speakers = (np.random.random(n) < 0.5).astype(int)
+    skip_greeting = np.random.random(n) < self.skip_greeting
+    # 1. greetings
+    pairs = self.get_templates(interaction.greeting_pairs, n)
+    for i in range(n):
+      if speakers[i] == 0 and not skip_greeting[i]:
+        utterances[i].append(self.customer_turn(pairs[i][0]))
+        utterances[i].append(self.agent_turn(pairs[i][1]))
+      elif speakers[i] == 1:
+        utterances[i].append(self.agent_turn(pairs[i][0]))
+        utterances[i].append(self.customer_turn(pairs[i][1]))
+    # 2. agent asks for the request if the customer finished the last turn
+    self.say(self.agent_turn, utterances,
+             np.flatnonzero(speakers == 1).tolist(), interaction.agent_ask)
+    # 3. customer request
+    goal_strs = [fact_obj.goal_str_arr[cond['goal']] for cond in cus_conds]
+    first_ask = np.random.random(n) < self.first_ask_prob
+    asks = []
+    for i in range(n):
+      cus_cond, ag_cond = cus_conds[i], ag_conds[i]
+      if first_ask[i]:
+        ag_cond['departure_airport'] = cus_cond['departure_airport']
+        ag_cond['return_airport'] = cus_cond['return_airport']
+        asks.append(('from ' + cus_cond['departure_airport'] + ' to ' +
+                     cus_cond['return_airport'],))
+      else:
+        asks.append(('',))
+      ag_cond['goal'] = cus_cond['goal']
+    self.say(self.customer_turn, utterances, all_rows,
+             interaction.customer_request, goal_strs, asks)
+    # 4. ask for name first
+    self.say(self.agent_turn, utterances, all_rows, interaction.agent_ask_name)
+    names = [(cond['name'].replace('_', ' '),) for cond in cus_conds]
+    self.say(self.customer_turn, utterances, all_rows, interaction.cutomer_name,
+             args=names)
+    # 5. book or change, no reservation, or cancel
+    statuses = [None] * n
+    flights = [None] * n
+    booking_rows, no_res_rows, cancel_rows = [], [], []
+    for i in range(n):
+      reservation = kb_jsons[i]['reservation']
+      if goal_strs[i] == 'book' or (goal_strs[i] == 'change' and
+                                    reservation != 0):
+        booking_rows.append(i)
+      elif reservation == 0:
+        no_res_rows.append(i)
+      else:
+        cancel_rows.append(i)
+    self.say(self.agent_turn, utterances, no_res_rows,
+             interaction.agent_conclusion_message['no_res'])
+    for i in no_res_rows:
+      statuses[i] = 'no_reservation'
+    self.say(self.agent_turn, utterances, cancel_rows,
+             interaction.agent_confirm_change['cancel'])
+    self.say(self.customer_turn, utterances, cancel_rows,
+             interaction.customer_confirm_change['cancel'])
+    self.say(self.agent_turn, utterances, cancel_rows,
+             interaction.agent_conclusion_message['cancel'])
+    for i in cancel_rows:
+      statuses[i] = 'cancel'
+    # all flights of the negotiation are compared at once, so knowledge bases
+    # are grouped by their number of flights.
+    groups = _group_by([len(kb_jsons[i]['kb']) for i in booking_rows])
+    for members in groups.values():
+      with profiling.phase('negotiation'):
+        self.continue_bookings([booking_rows[j] for j in members], cus_conds,
+                               ag_conds, kb_jsons, goal_strs, utterances,
+                               statuses, flights)
+    all_dialogues = []
+    for i in range(n):
+      flight_arr = [flights[i]] if flights[i] else []
+      name = cus_conds[i]['name'].replace('_', ' ')
+      action = utils.generate_action(flight_arr, name, statuses[i])
+      all_dialogues.append((utterances[i], action, statuses[i]))
+    return all_dialogues
+
+  def fulfill_basic_requirements(self, rows, cus_conds, ag_conds, goal_strs,
+                                 utterances):
+    """Same as fulfill_basic_requirement for the dialogues of rows."""
+    # templates of the agent are keyed by goal and then by c1c2 or d1d2.
+    ask_cities = {}
+    ask_date = {}
+    for goal, templates in interaction.agent_first_respond.items():
+      ask_cities[goal] = templates['c1c2']
+      ask_date[goal] = templates['d1d2']
+    ask_rows = [i for i in rows if 'departure_airport' not in ag_conds[i]]
+    self.say(self.agent_turn, utterances, ask_rows, ask_cities,
+             [goal_strs[i] for i in ask_rows])
+    self.say(self.customer_turn, utterances, ask_rows,
+             interaction.customer_first_respond['c1c2'],
+             args=[(cus_conds[i]['departure_airport'],
+                    cus_conds[i]['return_airport']) for i in ask_rows])
+    self.say(self.agent_turn, utterances, rows, ask_date,
+             [goal_strs[i] for i in rows])
+    dates = []
+    for i in rows:
+      cus_cond = cus_conds[i]
+      dates.append((cus_cond['departure_month'] + ' ' +
+                    str(cus_cond['departure_day']),
+                    cus_cond['return_month'] + ' ' +
+                    str(cus_cond['return_day'])))
+    self.say(self.customer_turn, utterances, rows,
+             interaction.customer_first_respond['d1d2'], args=dates)
+    for i in rows:
+      for key in basic_keys:
+        ag_conds[i][key] = cus_conds[i][key]
+
+  def condition_masks(self, rows, cus_conds, all_flights, positions):
+    """returns which flights satisfy each negotiated key of their dialogue.
+
+    all_flights are the flights of the knowledge bases of rows, one knowledge
+    base after the other, and only the flights at positions are checked. The
+    result has shape [len(negotiated_keys), len(all_flights)]. The other
+    flights, and keys that are not in the condition of a dialogue, count as
+    satisfied.
+    """
+    num_flights = len(all_flights) // len(rows)
+    airline_list = self.fact_obj.airline_list
+    all_masks = np.ones((len(negotiated_keys), len(all_flights)), dtype=bool)
+    for k, key in enumerate(negotiated_keys):
+      present = np.asarray([key in cus_conds[i] for i in rows])
+      checked = positions[present[positions // num_flights]]
+      if not checked.size:
+        continue
+      row_of = checked // num_flights
+      if key in ['max_price', 'max_connections']:
+        values = np.asarray([cus_conds[i].get(key, 0) for i in rows])[row_of]
+        if key == 'max_price':
+          mask = get_column(all_flights, checked, 'price') <= values
+        else:
+          mask = get_column(all_flights, checked, 'num_connections') <= values
+      else:
+        values = np.asarray([cus_conds[i].get(key, '') for i in rows],
+                            dtype=object)[row_of]
+        if key in ['departure_time', 'return_time']:
+          hours = get_column(all_flights, checked, key + '_num')
+          mask = epoch_calendar.get_day_segments(hours).astype(object) == values
+        elif key == 'airline_preference':
+          preferences = [
+              airline_list[all_flights[j]['airline']] for j in checked
+          ]
+          profiling.count('kb_fields_read', len(preferences))
+          mask = np.asarray(preferences, dtype=object) == values
+        else:
+          mask = get_column(all_flights, checked, key) == values
+      all_masks[k, checked] = mask
+    return all_masks
+
+  def continue_bookings(self, rows, cus_conds, ag_conds, kb_jsons, goal_strs,
+                        utterances, statuses, flights):
+    """Same as continue_booking for the dialogues of rows.
+
+    All knowledge bases of rows need to have the same number of flights.
+    """
+    self.fulfill_basic_requirements(rows, cus_conds, ag_conds, goal_strs,
+                                    utterances)
+    all_flights = [flight for i in rows for flight in kb_jsons[i]['kb']]
+    num_flights = len(all_flights) // len(rows)
+    # flights that satisfy the agent condition, starting with the basic keys.
+    # every key is only looked up for the flights that are still live.
+    live = np.ones(len(all_flights), dtype=bool)
+    for key in basic_keys:
+      positions = np.flatnonzero(live)
+      values = np.asarray([cus_conds[i][key] for i in rows], dtype=object)
+      live[positions] = get_column(all_flights, positions,
+                                   key) == values[positions // num_flights]
+    positions = np.flatnonzero(live)
+    key_masks = self.condition_masks(rows, cus_conds, all_flights, positions)
+    key_masks = key_masks.reshape(len(negotiated_keys), len(rows), num_flights)
+    price = np.full(len(all_flights), np.inf)
+    price[positions] = get_column(all_flights, positions, 'price')
+    price = price.reshape(len(rows), num_flights)
+    live = live.reshape(len(rows), num_flights)
+    errors = ['basic'] * len(rows)
+    # positions in rows of the dialogues that are still negotiating
+    active = np.arange(len(rows))
+    first_time = True
+    satisfied = []
+    while active.size:
+      profiling.count('negotiation_rounds', active.size)
+      # first cheapest flight, which is the one airflight_selector returns.
+      chosen = np.where(live[active], price[active], np.inf).argmin(axis=1)
+      has_flight = live[active, chosen]
+      no_flight = active[~has_flight]
+      self.say(self.agent_turn, utterances, [rows[p] for p in no_flight],
+               interaction.agent_conclusion_message['no_flight'])
+      for p in no_flight:
+        flights[rows[p]] = None
+        if interaction.secondary_error:
+          statuses[rows[p]] = 'no_flight_' + errors[p]
+        else:
+          statuses[rows[p]] = 'no_flight'
+      active, chosen = active[has_flight], chosen[has_flight]
+      if not active.size:
+        break
+      suggestion = 'full' if first_time else 'without_cd'
+      templates = self.get_templates(interaction.agent_suggestion[suggestion],
+                                     active.size)
+      first_time = False
+      for p, f, template in zip(active, chosen, templates):
+        flights[rows[p]] = kb_jsons[rows[p]]['kb'][f]
+        utterances[rows[p]].append(
+            self.agent_turn(
+                self.generate_confirmation(flights[rows[p]],
+                                           suggestion == 'full', template)))
+      # check_condition stops at the first key that is not satisfied, so there
+      # is only one error to respond to even with random_respond_error.
+      violated = ~key_masks[:, active, chosen]
+      unsatisfied = violated.any(axis=0)
+      first_error = violated.argmax(axis=0)
+      messages = []
+      args = []
+      for p, is_unsatisfied, k in zip(active, unsatisfied, first_error):
+        if not is_unsatisfied:
+          satisfied.append(p)
+          messages.append('satisfied')
+          args.append(None)
+          continue
+        error = negotiated_keys[k]
+        errors[p] = error
+        ag_conds[rows[p]][error] = cus_conds[rows[p]][error]
+        live[p] &= key_masks[k, p]
+        messages.append(error)
+        if error == 'airline_preference':
+          args.append(None)
+        else:
+          args.append((cus_conds[rows[p]][error],))
+      self.say(self.customer_turn, utterances, [rows[p] for p in active],
+               interaction.customer_recurring_respond, messages, args)
+      active = active[unsatisfied]
+    # status is either book, change, or potenitally abort
+    done_rows = [rows[p] for p in satisfied]
+    done_statuses = [goal_strs[i] for i in done_rows]
+    self.say(self.agent_turn, utterances, done_rows,
+             interaction.agent_confirm_change, done_statuses,
+             [(flights[i]['flight_number'],) for i in done_rows])
+    regret = np.random.random(len(done_rows)) < self.regret_prob
+    done_statuses = [
+        'abort' if r else status for r, status in zip(regret, done_statuses)
+    ]
+    self.say(self.customer_turn, utterances, done_rows,
+             interaction.customer_confirm_change, done_statuses)
+    self.say(self.agent_turn, utterances, done_rows,
+             interaction.agent_conclusion_message, done_statuses)
+    for i, status in zip(done_rows, done_statuses):
+      statuses[i] = status
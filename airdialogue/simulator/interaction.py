@@ -14,7 +14,9 @@
 
 """This file contains the main dialogue logic."""
 
+import string
 import numpy as np
+from airdialogue import profiling
 from airdialogue.context_generator.src import utils
 greeting_pairs = [('Hello.', 'Hi.'), ('Hey, how are you.',
                                       'I am fine. Thanks for asking.'),
@@ -221,6 +223,64 @@ customer_turn_prefix = 'customer:'
 agent_turn_prefix = 'agent:'
 secondary_error = True
 
+template_tables = [
+    greeting_pairs, agent_ask, customer_request, agent_first_respond,
+    customer_first_respond, customer_recurring_respond, agent_suggestion,
+    agent_ask_name, cutomer_name, agent_confirm_change, customer_confirm_change,
+    agent_conclusion_message
+]
+
+
+def _iter_texts(table):
+  """yields the templates of a nested table. pairs are yielded as tuples."""
+  if isinstance(table, (str, tuple)):
+    yield table
+  elif isinstance(table, dict):
+    for value in table.values():
+      for text in _iter_texts(value):
+        yield text
+  else:
+    for value in table:
+      for text in _iter_texts(value):
+        yield text
+
+
+class CompiledTemplate(str):
+  """A template that is pre-split into literal fragments and slots.
+
+  format puts the slot values into a copy of the fragments and joins them,
+  which is cheaper than parsing the template in every str.format. Only the
+  positional {i} slots that the templates above use are supported.
+  """
+
+  def __new__(cls, text):
+    template = super(CompiledTemplate, cls).__new__(cls, text)
+    template.fragments = []
+    # (position in fragments, index of the argument)
+    template.slots = []
+    for literal, field, spec, conversion in string.Formatter().parse(text):
+      if literal:
+        template.fragments.append(literal)
+      if field is not None:
+        if spec or conversion or not field.isdigit():
+          raise ValueError('unsupported slot in template: ' + text)
+        template.slots.append((len(template.fragments), int(field)))
+        template.fragments.append(None)
+    return template
+
+  def format(self, *args):
+    fragments = self.fragments[:]
+    for position, index in self.slots:
+      fragments[position] = str(args[index])
+    return ''.join(fragments)
+
+
+def compile_template(text):
+  """returns the CompiledTemplate of text, or a tuple of them for a pair."""
+  if isinstance(text, tuple):
+    return tuple(CompiledTemplate(t) for t in text)
+  return CompiledTemplate(text)
+
 
 class Interaction(object):
   """This class contains the dialogue interaction between the two agents."""
@@ -231,7 +291,8 @@ class Interaction(object):
                fix_response_candidate=True,
                first_ask_prob=0,
                regret_prob=0,
-               random_respond_error=False):
+               random_respond_error=False,
+               tokenizer=None):
     # probability then customer will skip always greeting if he/she speaks first
     self.skip_greeting = skip_greeting
     # if true then only the first response candidate will be used.
@@ -246,43 +307,76 @@ class Interaction(object):
     self.random_respond_error = random_respond_error
     # fact object
     self.fact_obj = fact_obj
-
-  def get_template(self, list_of_templates):
+    # optional template_tokenizer.TemplateTokenizer. if set, every turn carries
+    # the tokens that prepro would produce for it.
+    self.tokenizer = tokenizer
+    # the templates of all tables, compiled once.
+    self.compiled_templates = {}
+    for table in template_tables:
+      for text in _iter_texts(table):
+        self.compiled_templates[text] = compile_template(text)
+
+  def template(self, text):
+    """returns the template of text that utterances are formatted with."""
+    if self.tokenizer is not None:
+      return self.tokenizer.template(text)
+    if text not in self.compiled_templates:
+      self.compiled_templates[text] = compile_template(text)
+    return self.compiled_templates[text]
+
+  def get_template(self, list_of_templates, rng=None):
     if self.fix_resp_candidate:
       choice = 0
     else:
-      choice = utils.choice(len(list_of_templates))
-    return list_of_templates[choice]
+      choice = utils.choice(list(range(len(list_of_templates))), rng=rng)
+    return self.template(list_of_templates[choice])
 
   def customer_turn(self, utterance):
-    return customer_turn_prefix + ' ' + utterance
+    turn = customer_turn_prefix + ' ' + utterance
+    if self.tokenizer is not None:
+      return self.tokenizer.turn(turn, utterance)
+    return turn
 
   def agent_turn(self, utterance):
-    return agent_turn_prefix + ' ' + utterance
+    turn = agent_turn_prefix + ' ' + utterance
+    if self.tokenizer is not None:
+      return self.tokenizer.turn(turn, utterance)
+    return turn
 
-  def generate_confirmation(self, flight, full=True):
+  def generate_confirmation(self, flight, full=True, tmp=None, rng=None):
     if full:
-      tmp = self.get_template(agent_suggestion['full'])
+      if tmp is None:
+        tmp = self.get_template(agent_suggestion['full'], rng)
       return tmp.format(
           flight['flight_number'], flight['departure_airport'],
           flight['departure_month'] + ' ' + str(flight['departure_day']),
-          utils.format_time(
-              flight['departure_time_num']), flight['return_airport'],
+          utils.TIME_PHRASES[flight['departure_time_num']],
+          flight['return_airport'],
           flight['return_month'] + ' ' + str(flight['return_day']),
-          utils.format_time(flight['return_time_num']), flight['class'],
-          utils.get_connection(flight['num_connections']), flight['price'])
+          utils.TIME_PHRASES[flight['return_time_num']], flight['class'],
+          utils.CONNECTION_PHRASES[min(flight['num_connections'], 2)],
+          flight['price'])
     else:
-      tmp = self.get_template(agent_suggestion['without_cd'])
+      if tmp is None:
+        tmp = self.get_template(agent_suggestion['without_cd'], rng)
       return tmp.format(
           flight['flight_number'],
-          utils.format_time(flight['departure_time_num']),
-          utils.format_time(flight['return_time_num']), flight['class'],
-          utils.get_connection(flight['num_connections']), flight['price'])
+          utils.TIME_PHRASES[flight['departure_time_num']],
+          utils.TIME_PHRASES[flight['return_time_num']], flight['class'],
+          utils.CONNECTION_PHRASES[min(flight['num_connections'], 2)],
+          flight['price'])
 
   # this is wrong because we will need to compare all flights. use the one in
   # context generator
   def airflight_selector(self, condition, airfare_database):
-    """This function selects a flight based on the condition."""
+    """This function selects a flight based on the condition.
+
+    airfare_database is either a list of flight jsons or a
+    utils.ColumnarKnowledgebase.
+    """
+    if isinstance(airfare_database, utils.ColumnarKnowledgebase):
+      flights = airfare_database.select(condition)
+      return flights[0] if flights else None
     candidates = []
     for i, flight in enumerate(airfare_database):
       cond = utils.check_condition(
@@ -301,17 +395,17 @@ class Interaction(object):
         return airfare_database[i]
     return None
 
-  def get_message(self, ag_condition, cus_condition, erro_state):
+  def get_message(self, ag_condition, cus_condition, erro_state, rng=None):
     """This function geenrates the message based on errors."""
     if erro_state == 'satisfied':
       error = erro_state
     else:
       if self.random_respond_error:
-        error_to_handle = utils.choice(list(range(len(erro_state))))
+        error_to_handle = utils.choice(list(range(len(erro_state))), rng=rng)
       else:
         error_to_handle = 0
       error = erro_state[error_to_handle]
-    msg = self.get_template(customer_recurring_respond[error])
+    msg = self.get_template(customer_recurring_respond[error], rng)
     if error != 'satisfied':
       ag_condition[error] = cus_condition[error]
 
@@ -320,12 +414,13 @@ class Interaction(object):
     else:
       return msg, ag_condition, error
 
-  def generate_greetings(self, utterance, speaker):
+  def generate_greetings(self, utterance, speaker, rng=None):
     """This function generates greets."""
     # skip greeting
-    if speaker == 0 and np.random.random() < self.skip_greeting:
+    rand = np.random if rng is None else rng
+    if speaker == 0 and rand.random() < self.skip_greeting:
       return utterance
-    pair = self.get_template(greeting_pairs)
+    pair = self.get_template(greeting_pairs, rng)
     if speaker == 0:
       utterance.append(self.customer_turn(pair[0]))
       utterance.append(self.agent_turn(pair[1]))
@@ -334,21 +429,22 @@ class Interaction(object):
       utterance.append(self.customer_turn(pair[1]))
     return utterance
 
-  def generate_agent_ask(self, utterance):
-    utterance.append(self.agent_turn(self.get_template(agent_ask)))
+  def generate_agent_ask(self, utterance, rng=None):
+    utterance.append(self.agent_turn(self.get_template(agent_ask, rng)))
     return utterance
 
   def generate_customer_request(self, customer_condition, agent_condition,
-                                utterance):
+                                utterance, rng=None):
     """This function generates customer requests."""
     # first get the goal index (buy, cancel, change)
     goal_index = customer_condition['goal']
     goal_str = self.fact_obj.goal_str_arr[goal_index]
     # get the template
-    template = self.get_template(customer_request[goal_str])
+    template = self.get_template(customer_request[goal_str], rng)
     # by some probability customer will say departure and return
     # city in the request statement
-    first_ask = np.random.random() < self.first_ask_prob
+    rand = np.random if rng is None else rng
+    first_ask = rand.random() < self.first_ask_prob
     if first_ask:
       deprture_city, return_city = customer_condition[
           'departure_airport'], customer_condition['return_airport']
@@ -365,32 +461,35 @@ class Interaction(object):
     agent_condition['goal'] = customer_condition['goal']
     return utterance, agent_condition, goal_str
 
-  def no_reservation(self, utterance):
-    agent_confirm_utt = self.get_template(agent_conclusion_message['no_res'])
+  def no_reservation(self, utterance, rng=None):
+    agent_confirm_utt = self.get_template(agent_conclusion_message['no_res'],
+                                          rng)
     utterance.append(self.agent_turn(agent_confirm_utt))
     return utterance
 
-  def cancel_reservation(self, utterance):
-    agent_utt = self.get_template(agent_confirm_change['cancel'])
+  def cancel_reservation(self, utterance, rng=None):
+    agent_utt = self.get_template(agent_confirm_change['cancel'], rng)
     utterance.append(self.agent_turn(agent_utt))
-    customer_utt = self.get_template(customer_confirm_change['cancel'])
+    customer_utt = self.get_template(customer_confirm_change['cancel'], rng)
     utterance.append(self.customer_turn(customer_utt))
-    agent_confirm_utt = self.get_template(agent_conclusion_message['cancel'])
+    agent_confirm_utt = self.get_template(agent_conclusion_message['cancel'],
+                                          rng)
     utterance.append(self.agent_turn(agent_confirm_utt))
     return utterance
 
-  def fulfill_basic_requirement(self, goal, cus_cond, ag_cond, utterance):
+  def fulfill_basic_requirement(self, goal, cus_cond, ag_cond, utterance,
+                                rng=None):
     """This function fulfill bsic requirements."""
     # check departure and return city
     if 'departure_airport' not in ag_cond:
       assert 'return_airport' not in ag_cond
       # print ('goal',goal)
-      ask_cities = self.get_template(agent_first_respond[goal]['c1c2'])
+      ask_cities = self.get_template(agent_first_respond[goal]['c1c2'], rng)
       utterance.append(self.agent_turn(ask_cities))
       depart = cus_cond['departure_airport']
       ret = cus_cond['return_airport']
-      respond_cities = self.get_template(customer_first_respond['c1c2']).format(
-          depart, ret)
+      respond_cities = self.get_template(customer_first_respond['c1c2'],
+                                         rng).format(depart, ret)
       utterance.append(self.customer_turn(respond_cities))
       ag_cond['departure_airport'] = depart
       ag_cond['return_airport'] = ret
@@ -398,14 +497,14 @@ class Interaction(object):
       assert 'departure_day' not in ag_cond
       assert 'return_month' not in ag_cond
       assert 'return_day' not in ag_cond
-      ask_date = self.get_template(agent_first_respond[goal]['d1d2'])
+      ask_date = self.get_template(agent_first_respond[goal]['d1d2'], rng)
       utterance.append(self.agent_turn(ask_date))
       d_m, d_d = cus_cond['departure_month'], cus_cond['departure_day']
       a_m, a_d = cus_cond['return_month'], cus_cond['return_day']
       dep = d_m + ' ' + str(d_d)
       ar = a_m + ' ' + str(a_d)
-      respond_date = self.get_template(customer_first_respond['d1d2']).format(
-          dep, ar)
+      respond_date = self.get_template(customer_first_respond['d1d2'],
+                                       rng).format(dep, ar)
       utterance.append(self.customer_turn(respond_date))
       ag_cond['departure_month'] = d_m
       ag_cond['departure_day'] = d_d
@@ -413,21 +512,28 @@ class Interaction(object):
       ag_cond['return_day'] = a_d
     return ag_cond, utterance
 
-  def continue_booking(self, cus_cond, ag_cond, kb, utterance):
+  def continue_booking(self, cus_cond, ag_cond, kb, utterance, rng=None):
     """This function books the flight."""
     goal = ag_cond['goal']
     goal_str = self.fact_obj.goal_str_arr[goal]
     ag_cond, utterance = self.fulfill_basic_requirement(goal_str, cus_cond,
-                                                        ag_cond, utterance)
+                                                        ag_cond, utterance, rng)
     status = None
     first_time = True
     error = 'basic'
+    # candidates are narrowed as ag_cond grows instead of rescanning kb with
+    # airflight_selector in every round.
+    if not isinstance(kb, utils.ColumnarKnowledgebase):
+      kb = utils.ColumnarKnowledgebase(self.fact_obj, kb)
+    candidates = utils.CandidateFlights(kb)
     while not status:
-      flight = self.airflight_selector(ag_cond, kb)
+      profiling.count('negotiation_rounds')
+      candidates.update(ag_cond)
+      flight = candidates.cheapest()
       if not flight:  # terminal condition
         utterance.append(
             self.agent_turn(
-                self.get_template(agent_conclusion_message['no_flight'])))
+                self.get_template(agent_conclusion_message['no_flight'], rng)))
         if secondary_error:
           status = 'no_flight' '_' + error
         else:
@@ -436,52 +542,59 @@ class Interaction(object):
         return utterance, status, flight
       else:
         utterance.append(
-            self.agent_turn(self.generate_confirmation(flight, first_time)))
+            self.agent_turn(
+                self.generate_confirmation(flight, first_time, rng=rng)))
         first_time = False
         condition = utils.check_condition(self.fact_obj, flight, cus_cond)
         msg, ag_cond, error = self.get_message(
-            ag_cond, cus_cond, condition)  # will do merge condition within
+            ag_cond, cus_cond, condition, rng)  # will do merge condition within
         utterance.append(self.customer_turn(msg))
         if condition == 'satisfied':
           goal_int = cus_cond['goal']
           status = self.fact_obj.goal_str_arr[goal_int]  # either book or change
     # status is either book, change, or potenitally abort
-    ask_confirm = self.get_template(agent_confirm_change[status]).format(
+    ask_confirm = self.get_template(agent_confirm_change[status], rng).format(
         flight['flight_number'])
     utterance.append(self.agent_turn(ask_confirm))
-    regret = np.random.random() < self.regret_prob
+    rand = np.random if rng is None else rng
+    regret = rand.random() < self.regret_prob
     if regret:
       status = 'abort'
-    cus_re_conrim = self.get_template(customer_confirm_change[status])
+    cus_re_conrim = self.get_template(customer_confirm_change[status], rng)
     utterance.append(self.customer_turn(cus_re_conrim))
-    agent_conclusion = self.get_template(agent_conclusion_message[status])
+    agent_conclusion = self.get_template(agent_conclusion_message[status], rng)
     utterance.append(self.agent_turn(agent_conclusion))
     return utterance, status, flight
 
-  def generate_dialogue(self, customer, knowledge_base):
-    """This function is the main entry of the dialogue generation logic."""
-    airfare_database = knowledge_base.get_json()['kb']
-    reservation = knowledge_base.get_json()['reservation']
+  def generate_dialogue(self, customer, knowledge_base, rng=None):
+    """This function is the main entry of the dialogue generation logic.
+
+    Random numbers are drawn from rng, a np.random.Generator, if it is given and
+    from the global random state otherwise.
+    """
+    knowledge_base_json = knowledge_base.get_json_view()
+    airfare_database = knowledge_base_json['kb']
+    reservation = knowledge_base_json['reservation']
     utterance = []
     # 0a. decides who speaks first 0--customer, 1--agent
-    speaker = int(np.random.random() < 0.5)
+    speaker = int((np.random if rng is None else rng).random() < 0.5)
     # 0b. generate customer's full condition and agent_condition
     customer_condition = customer.get_customer_condition()
     agent_condition = {}
     # 1. greetings
-    utterance = self.generate_greetings(utterance, speaker)
+    utterance = self.generate_greetings(utterance, speaker, rng)
     # 2. generate agent's utterance to ask for request if
     # customer finished the last turn
     if speaker == 1:
-      utterance = self.generate_agent_ask(utterance)
+      utterance = self.generate_agent_ask(utterance, rng)
     # 3. generate customer request
     utterance, agent_condition, goal_str = self.generate_customer_request(
-        customer_condition, agent_condition, utterance)
+        customer_condition, agent_condition, utterance, rng)
 
     # 4 ask for name first
-    ask_name_utt = self.get_template(agent_ask_name)
+    ask_name_utt = self.get_template(agent_ask_name, rng)
     utterance.append(self.agent_turn(ask_name_utt))
-    answer_name_utt = self.get_template(cutomer_name).format(
+    answer_name_utt = self.get_template(cutomer_name, rng).format(
         customer_condition['name'].replace('_', ' '))
     utterance.append(self.customer_turn(answer_name_utt))
 
@@ -490,14 +603,16 @@ class Interaction(object):
 
     if goal_str == 'book' or (goal_str == 'change' and reservation != 0):
       # status can be book, change, no_flight, abort
-      utterance, status, flight = self.continue_booking(
-          customer_condition, agent_condition, airfare_database, utterance)
+      with profiling.phase('negotiation'):
+        utterance, status, flight = self.continue_booking(
+            customer_condition, agent_condition, airfare_database, utterance,
+            rng)
     elif goal_str in ['change', 'cancel'] and reservation == 0:
-      utterance = self.no_reservation(utterance)
+      utterance = self.no_reservation(utterance, rng)
       status = 'no_reservation'
       flight = None
     elif goal_str == 'cancel':
-      utterance = self.cancel_reservation(utterance)
+      utterance = self.cancel_reservation(utterance, rng)
       status = 'cancel'
       flight = None
 
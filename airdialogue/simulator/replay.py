@@ -0,0 +1,88 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Regenerates the samples of a random access simulation from its manifest.
+
+  replay = SimulationReplay("sim_manifest.json")
+  data, kb = replay[i]  # the i-th records of the data and kb files of sim
+"""
+
+import argparse
+import json
+
+from airdialogue import file_io
+from airdialogue.simulator import simulator_lib
+from airdialogue.simulator import simulator_main
+
+
+def load_manifest(path):
+  with file_io.Open(path, "r") as f:
+    return json.load(f)
+
+
+class SimulationReplay(object):
+  """Simulates the samples of a manifest on demand.
+
+  manifest is the path of a manifest written by sim with --output_manifest, or
+  the loaded manifest. flags override the flags of the manifest, e.g. the paths
+  of the name and airport files if they moved.
+  """
+
+  def __init__(self, manifest, **flags):
+    if isinstance(manifest, str):
+      manifest = load_manifest(manifest)
+    if manifest.get("version") != simulator_main.MANIFEST_VERSION:
+      raise ValueError("unsupported manifest version: " +
+                       str(manifest.get("version")))
+    parser = argparse.ArgumentParser()
+    simulator_main.add_arguments(parser)
+    FLAGS = parser.parse_args([])  # pylint: disable=invalid-name
+    for key, value in manifest["flags"].items():
+      setattr(FLAGS, key, value)
+    for key, value in flags.items():
+      setattr(FLAGS, key, value)
+    FLAGS.seed = manifest["seed"]
+    FLAGS.random_access = True
+    self.seed = manifest["seed"]
+    self.num_samples = manifest["num_samples"]
+    self.cg, self.inter = simulator_main.build_simulator(FLAGS)
+
+  def __len__(self):
+    return self.num_samples
+
+  def __getitem__(self, index):
+    """returns the data record and the kb json of the sample at index."""
+    if index < 0:
+      index += self.num_samples
+    if index < 0 or index >= self.num_samples:
+      raise IndexError("sample index out of range.")
+    return next(self.iter_samples(index, index + 1))
+
+  def iter_samples(self, start=0, stop=None):
+    """yields the data records and kb jsons of the samples in [start, stop).
+
+    They are round-tripped through json, so they are equal to the json loaded
+    from the lines of the data and kb files.
+    """
+    if stop is None:
+      stop = self.num_samples
+    stop = min(stop, self.num_samples)
+    if start >= stop:
+      return
+    for data, kb in simulator_lib.iter_samples(
+        self.cg, self.inter, stop - start, start=start):
+      yield json.loads(json.dumps(data)), json.loads(kb.get_json_str())
+
+  def __iter__(self):
+    return self.iter_samples()
@@ -0,0 +1,68 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Client of simulator_server.
+
+  with SimulatorClient(("localhost", 8765)) as client:
+    for sample in client.get(32):
+      intent = sample["data"]["intent"]
+      kb = sample["kb"]["kb"]
+"""
+
+import json
+import socket
+
+
+class SimulatorClient(object):
+  """Fetches simulated samples from a simulator server.
+
+  address is the path of a unix socket, or a (host, port) tuple for tcp.
+  """
+
+  def __init__(self, address, timeout=None):
+    if isinstance(address, str):
+      self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+      self.sock.settimeout(timeout)
+      self.sock.connect(address)
+    else:
+      self.sock = socket.create_connection(tuple(address), timeout)
+    self.file = self.sock.makefile("rwb")
+
+  def _request(self, request):
+    self.file.write((json.dumps(request) + "\n").encode("utf-8"))
+    self.file.flush()
+    line = self.file.readline()
+    if not line:
+      raise ConnectionError("the simulator server closed the connection.")
+    response = json.loads(line.decode("utf-8"))
+    if "error" in response:
+      raise RuntimeError(response["error"])
+    return response
+
+  def get(self, num_samples=1):
+    """returns num_samples samples, each a dict with a data and a kb record."""
+    return self._request({"op": "get", "num_samples": num_samples})["samples"]
+
+  def get_stats(self):
+    return self._request({"op": "stats"})["stats"]
+
+  def close(self):
+    self.file.close()
+    self.sock.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
@@ -0,0 +1,239 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""This is the library that simulates dialogues on generated contexts."""
+
+import itertools
+import multiprocessing
+import random
+import numpy as np
+
+from airdialogue import parallel
+from airdialogue import profiling
+from airdialogue import record_writer
+from airdialogue.context_generator.src import utils
+from airdialogue.simulator import batch_interaction
+
+# state of a worker process, see init_worker.
+_worker = {}
+
+
+def get_dialogue_rng(seed, index):
+  """returns the generator of the dialogue of sample index.
+
+  It is independent of the generator that the context generator derives from
+  (seed, index), so a dialogue does not depend on how its context was drawn.
+  """
+  return np.random.default_rng([seed, index, 1])
+
+
+def simulate_sample(inter, cus, kb, expected_action, rng=None):
+  """simulates the dialogue of one context.
+
+  Returns the data record of the sample. The kb record is kb.get_json_view().
+  """
+  # action has been standarlized in inter
+  with profiling.phase("dialogue"):
+    utterance, action, _ = inter.generate_dialogue(cus, kb, rng)
+  return get_sample(inter, cus, utterance, action, expected_action)
+
+
+def get_sample(inter, cus, utterance, action, expected_action):
+  """returns the data record of a simulated dialogue.
+
+  If inter has a tokenizer, the record also contains the tokenized dialogue and
+  the turn boundaries that prepro would produce.
+  """
+  profiling.count("dialogues")
+  profiling.count("turns", len(utterance))
+  standarlized_intent = utils.standardize_intent(cus.get_json())
+  standarlized_action = utils.standardize_action(action)
+  standarlized_expected_action = utils.standardize_action(expected_action)
+  # syntherized data is 100% correct. However, action contains at most one
+  # flight. expected_action may contain more than one flight.
+  data = {
+      "intent": standarlized_intent,
+      "dialogue": utterance,
+      "action": standarlized_action,
+      "expected_action": standarlized_expected_action
+  }
+  if inter.tokenizer is not None:
+    with profiling.phase("tokenize"):
+      tokenized_dialogue, boundaries1, boundaries2 = (
+          inter.tokenizer.tokenize_dialogue(utterance))
+    data["dialogue"] = [str(turn) for turn in utterance]
+    data["tokenized_dialogue"] = tokenized_dialogue
+    data["boundaries1"] = boundaries1
+    data["boundaries2"] = boundaries2
+  return data
+
+
+def iter_samples(cg, inter, num_samples, status_stats=None, start=0):
+  """yields the data records and knowledge bases of simulated dialogues.
+
+  If cg is seed addressable, sample i only depends on cg.seed and start + i,
+  and start may be positive. If inter is a batch_interaction.BatchInteraction,
+  dialogues are simulated inter.batch_size contexts at a time from the global
+  random state.
+  """
+  all_contexts = profiling.timed(
+      cg.iter_contexts(
+          num_samples,
+          output_object=True,
+          status_stats=status_stats,
+          start=start), "context")
+  if not isinstance(inter, batch_interaction.BatchInteraction):
+    for i, (cus, kb, expected_action) in enumerate(all_contexts, start):
+      rng = None
+      if cg.seed is not None:
+        rng = get_dialogue_rng(cg.seed, i)
+      yield simulate_sample(inter, cus, kb, expected_action, rng), kb
+    return
+  while True:
+    batch = list(itertools.islice(all_contexts, inter.batch_size))
+    if not batch:
+      return
+    all_customers, all_kb, _ = zip(*batch)
+    with profiling.phase("dialogue"):
+      all_dialogues = inter.generate_dialogues(all_customers, all_kb)
+    for (cus, kb, expected_action), (utterance, action, _) in zip(
+        batch, all_dialogues):
+      yield get_sample(inter, cus, utterance, action, expected_action), kb
+
+
+def get_chunk_seed(seed, chunk_index):
+  """derives the seed of a chunk of samples from the global seed."""
+  seed_sequence = np.random.SeedSequence([seed, chunk_index])
+  return int(seed_sequence.generate_state(1)[0])
+
+
+def init_worker(cg, inter, json_encoder, profile=False):
+  """sets up a worker process. profile enables profiling in the worker."""
+  _worker["cg"] = cg
+  _worker["inter"] = inter
+  _worker["encode"] = record_writer.get_encoder(json_encoder)
+  _worker["profile"] = profile
+  if profile:
+    profiling.enable()
+
+
+def simulate_chunk(args):
+  """simulates a chunk of samples and returns them serialized.
+
+  args are (seed, chunk_index, start, chunk_size). The global random states are
+  seeded from (seed, chunk_index), and a seed addressable context generator
+  simulates the samples from start on.
+
+  Returns the data lines, the kb lines, the status counts and the profiling
+  stats of the chunk if the worker profiles, or None.
+  """
+  seed, chunk_index, start, chunk_size = args
+  chunk_seed = get_chunk_seed(seed, chunk_index)
+  random.seed(chunk_seed)
+  np.random.seed(chunk_seed)
+  cg = _worker["cg"]
+  if cg.seed is None:
+    start = 0
+  encode = _worker["encode"]
+  status_stats = {}
+  data_lines = []
+  kb_lines = []
+  for data, kb in iter_samples(cg, _worker["inter"], chunk_size, status_stats,
+                               start):
+    with profiling.phase("serialize"):
+      data_lines.append(encode(data) + "\n")
+      kb_lines.append(kb.get_json_str(encode) + "\n")
+  profile_stats = None
+  if _worker["profile"]:
+    profile_stats = profiling.disable().get_stats()
+    profiling.enable()
+  return "".join(data_lines), "".join(kb_lines), status_stats, profile_stats
+
+
+def simulate(cg,
+             inter,
+             num_samples,
+             output_data,
+             output_kb,
+             num_workers=1,
+             seed=None,
+             chunk_size=1000,
+             json_encoder="json",
+             verbose=False,
+             display_freq=5000):
+  """simulates num_samples dialogues and writes them into the output files.
+
+  Without a seed, samples are simulated one after another from the global
+  random states. With a seed, samples are simulated in chunks of chunk_size
+  that draw from seeds derived from (seed, chunk index), and num_workers
+  processes simulate and serialize chunks in parallel. Chunks are written in
+  order, so the output only depends on the seed and chunk_size. If cg is seed
+  addressable and inter simulates one dialogue at a time, sample i only
+  depends on cg.seed and i.
+
+  If profiling is enabled, the workers profile their chunks and their stats
+  are merged into the profiler of this process.
+
+  Returns the raw counts of the expected statuses.
+  """
+  status_stats = {}
+  profiler = profiling.get_profiler()
+  with record_writer.RecordWriter(
+      output_data, encoder=json_encoder) as f_data, record_writer.RecordWriter(
+          output_kb, encoder=json_encoder) as f_kb:
+    if seed is None and num_workers <= 1:
+      all_samples = iter_samples(cg, inter, num_samples, status_stats)
+      for i, (data, kb) in enumerate(all_samples):
+        if verbose and i % display_freq == 0:
+          print((i, "/", num_samples))
+        with profiling.phase("write"):
+          f_data.write(data)
+          f_kb.write(record_writer.Encoded(kb.get_json_str(f_kb.encode)))
+      return status_stats
+
+    if seed is None:
+      seed = np.random.randint(0, 2**31 - 1)
+    all_args = [(seed, chunk_index, start,
+                 min(chunk_size, num_samples - start))
+                for chunk_index, start in enumerate(
+                    range(0, num_samples, chunk_size))]
+    if num_workers <= 1:
+      init_worker(cg, inter, json_encoder)
+      all_chunks = map(simulate_chunk, all_args)
+      pool = None
+    else:
+      pool = multiprocessing.Pool(
+          num_workers, init_worker,
+          (cg, inter, json_encoder, profiler is not None))
+      all_chunks = parallel.ordered_map(pool, simulate_chunk, all_args,
+                                        2 * num_workers)
+    try:
+      for args, chunk in zip(all_args, all_chunks):
+        _, chunk_index, _, size = args
+        if verbose and (chunk_index * chunk_size) % display_freq < size:
+          print((chunk_index * chunk_size, "/", num_samples))
+        data_lines, kb_lines, chunk_stats, profile_stats = chunk
+        with profiling.phase("write"):
+          f_data.write_encoded(data_lines)
+          f_kb.write_encoded(kb_lines)
+        if profile_stats is not None:
+          profiler.merge(profile_stats)
+        for status in chunk_stats:
+          status_stats[status] = status_stats.get(status,
+                                                  0) + chunk_stats[status]
+    finally:
+      if pool is not None:
+        pool.terminate()
+        pool.join()
+  return status_stats
@@ -16,17 +16,25 @@
 
 import argparse
 import json
-from tensorflow.compat.v1 import gfile as gfile
-import tensorflow.compat.v1 as tf
-import sys
 
+from airdialogue import file_io
+from airdialogue import profiling
+from airdialogue import record_writer
 from airdialogue.context_generator import context_generator_lib
-from airdialogue.context_generator.src import utils
 
+from airdialogue.simulator import batch_interaction
 from airdialogue.simulator import interaction
+from airdialogue.simulator import simulator_lib
 
 FLAGS=None
 
+MANIFEST_VERSION = 1
+# flags that determine the samples of a random access simulation.
+MANIFEST_FLAGS = [
+    "num_candidate_airports", "book_window", "num_db_record", "firstname_file",
+    "lastname_file", "airportcode_file", "tokenize"
+]
+
 def add_arguments(parser):
   """Build ArgumentParser."""
   parser.register("type", "bool", lambda v: v.lower() == "true")
@@ -67,65 +75,135 @@ def add_arguments(parser):
                       help="path of the output kb file.")
   parser.add_argument("--display_freq", type=int, default=50000,
                       help="display frequency for information.")
+  parser.add_argument("--json_encoder", type=str, default="json",
+                      choices=record_writer.ENCODERS,
+                      help="json encoder of the output files. output files "
+                      "ending with .gz or .zst are compressed.")
+  parser.add_argument("--num_workers", type=int, default=1,
+                      help="number of processes that simulate dialogues.")
+  parser.add_argument("--seed", type=int, default=None,
+                      help="random seed. output is reproducible for a given "
+                      "seed and chunk_size, whatever num_workers is.")
+  parser.add_argument("--random_access", type="bool", nargs="?", const=True,
+                      default=False,
+                      help="if enabled, every sample is derived from (seed, "
+                      "sample index), so the output does not depend on "
+                      "chunk_size and any sample can be replayed on demand.")
+  parser.add_argument("--output_manifest", type=str, default=None,
+                      help="path of a manifest of a random access simulation, "
+                      "from which replay.SimulationReplay regenerates the "
+                      "samples. output_data and output_kb are optional.")
+  parser.add_argument("--chunk_size", type=int, default=1000,
+                      help="number of samples that a worker simulates at a "
+                      "time.")
+  parser.add_argument("--batch_size", type=int, default=0,
+                      help="if positive, dialogues are simulated batch_size "
+                      "contexts at a time. batches follow the same "
+                      "distribution, but draw random numbers in a different "
+                      "order than dialogues simulated one at a time.")
+  parser.add_argument("--tokenize", type="bool", nargs="?", const=True,
+                      default=False,
+                      help="if enabled, the tokenized dialogue and the turn "
+                      "boundaries are written as well, so that prepro does not "
+                      "have to tokenize the dialogues again.")
+  parser.add_argument("--nltk_data", type=str, default=None,
+                      help="path to NLTK data. only used with --tokenize.")
+  parser.add_argument("--profile", type="bool", nargs="?", const=True,
+                      default=False,
+                      help="if enabled, the time spent in every phase of the "
+                      "simulation and counts of dialogues, turns, negotiation "
+                      "rounds and flight fields read are reported.")
   parser.add_argument("--verbose", type="bool", nargs="?", const=True,
                       default=False,
                       help="if enabled, debug info will be printed out.")
 
 
-def main(FLAGS):
-  if FLAGS.verbose:
-    print("Number of samples to generate: ", FLAGS.num_samples)
-    print("Output_kb: ", FLAGS.output_kb)
-    print("Output_data: ", FLAGS.output_data)
-
-  num_samples = FLAGS.num_samples
+def build_simulator(FLAGS):
+  """returns the context generator and the interaction configured by FLAGS."""
   cg = context_generator_lib.ContextGenerator(
       num_candidate_airports=FLAGS.num_candidate_airports,
       book_window=FLAGS.book_window,
       num_db_record=FLAGS.num_db_record,
       firstname_file=FLAGS.firstname_file,
       lastname_file=FLAGS.lastname_file,
-      airportcode_file=FLAGS.airportcode_file)
-  inter = interaction.Interaction(
-      cg.fact_obj,
+      airportcode_file=FLAGS.airportcode_file,
+      seed=FLAGS.seed if FLAGS.random_access else None)
+  tokenizer = None
+  if FLAGS.tokenize:
+    # nltk is only imported when the dialogues are tokenized.
+    import nltk  # pylint: disable=g-import-not-at-top
+    from airdialogue.simulator import template_tokenizer  # pylint: disable=g-import-not-at-top
+    if FLAGS.nltk_data:
+      nltk.data.path.append(FLAGS.nltk_data)
+    tokenizer = template_tokenizer.TemplateTokenizer()
+  inter_kwargs = dict(
       skip_greeting=0,
       fix_response_candidate=True,
       first_ask_prob=0,
-      random_respond_error=True)
-  ct, stats = cg.generate_context(num_samples, output_object=True)
+      random_respond_error=True,
+      tokenizer=tokenizer)
+  if FLAGS.batch_size > 0:
+    inter = batch_interaction.BatchInteraction(
+        cg.fact_obj, batch_size=FLAGS.batch_size, **inter_kwargs)
+  else:
+    inter = interaction.Interaction(cg.fact_obj, **inter_kwargs)
+  return cg, inter
+
+
+def get_manifest(FLAGS):
+  """returns the manifest of a random access simulation configured by FLAGS."""
+  return {
+      "version": MANIFEST_VERSION,
+      "seed": FLAGS.seed,
+      "num_samples": FLAGS.num_samples,
+      "flags": {key: getattr(FLAGS, key) for key in MANIFEST_FLAGS}
+  }
+
+
+def main(FLAGS):
   if FLAGS.verbose:
+    print("Number of samples to generate: ", FLAGS.num_samples)
+    print("Output_kb: ", FLAGS.output_kb)
+    print("Output_data: ", FLAGS.output_data)
+
+  if FLAGS.output_manifest and not FLAGS.random_access:
+    raise ValueError("--output_manifest requires --random_access.")
+  if FLAGS.random_access and FLAGS.seed is None:
+    raise ValueError("--random_access requires --seed.")
+  if FLAGS.random_access and FLAGS.batch_size > 0:
+    raise ValueError("--random_access requires --batch_size 0.")
+  if FLAGS.output_manifest:
+    with file_io.Open(FLAGS.output_manifest, "w") as f:
+      f.write(json.dumps(get_manifest(FLAGS), indent=2) + "\n")
+    if not FLAGS.output_data and not FLAGS.output_kb:
+      return
+
+  if FLAGS.profile:
+    profiling.enable()
+  num_samples = FLAGS.num_samples
+  with profiling.phase("setup"):
+    cg, inter = build_simulator(FLAGS)
+  stats = simulator_lib.simulate(cg, inter, num_samples,
+                                 FLAGS.output_data, FLAGS.output_kb,
+                                 num_workers=FLAGS.num_workers,
+                                 seed=FLAGS.seed,
+                                 chunk_size=FLAGS.chunk_size,
+                                 json_encoder=FLAGS.json_encoder,
+                                 verbose=FLAGS.verbose,
+                                 display_freq=FLAGS.display_freq)
+  if FLAGS.profile:
+    print(profiling.disable().report())
+  if FLAGS.verbose:
+    for key in stats:
+      stats[key] /= 1.0 * num_samples
     print(stats)
-  with gfile.Open(FLAGS.output_data,
-                  "w") as f_data, gfile.Open(FLAGS.output_kb, "w") as f_kb:
-    for i in range(len(ct)):
-      if FLAGS.verbose and i % 5000 == 0:
-        print((i, "/", len(ct)))
-      cus, kb, expected_action = ct[i]
-      # action has been standarlized in inter
-      utterance, action, _ = inter.generate_dialogue(cus, kb)
-      standarlized_intent = utils.standardize_intent(cus.get_json())
-      standarlized_action = utils.standardize_action(action)
-      standarlized_expected_action = utils.standardize_action(expected_action)
-      # syntherized data is 100% correct. However, action contains at most one
-      # flight. expected_action may contain more than one flight.
-      f_data.write(
-          json.dumps({"intent": standarlized_intent,"dialogue": utterance,
-                      "action": standarlized_action,
-                      "expected_action": standarlized_expected_action}) + "\n")
-      dumped_kb = kb.get_json()
-      f_kb.write(json.dumps(dumped_kb) + "\n")
-
-
-def run_main(unused):
-  main(FLAGS)
 
 
 if __name__ == "__main__":
   this_parser = argparse.ArgumentParser()
   add_arguments(this_parser)
   FLAGS, unparsed = this_parser.parse_known_args()
-  # main(FLAGS)
-  tf.app.run(main=run_main, argv=[sys.argv[0]] + unparsed)
+  main(FLAGS)
 
 
 
@@ -0,0 +1,243 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A long-lived server that hands out simulated samples on demand.
+
+Clients connect over a unix socket or localhost tcp and send one json request
+per line. Every request is answered with one json line:
+
+  {"op": "get", "num_samples": 32} -> {"samples": [{"data": ..., "kb": ...}]}
+  {"op": "stats"} -> {"stats": {...}}
+
+Failed requests are answered with {"error": message}. See simulator_client for
+a client.
+"""
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import numpy as np
+
+from airdialogue.simulator import simulator_lib
+from airdialogue.simulator import simulator_main
+
+FLAGS = None
+
+
+def _split_lines(text):
+  """splits newline terminated lines at "\\n" only.
+
+  Unlike str.splitlines, separators such as U+2028 that json encoders may leave
+  unescaped in a sample do not split it.
+  """
+  lines = text.split("\n")
+  if lines and not lines[-1]:
+    lines.pop()
+  return lines
+
+
+class SimulatorServer(object):
+  """Simulates samples ahead of time and serves them to concurrent clients.
+
+  num_workers processes simulate chunks of chunk_size samples in the same way
+  as simulator_lib.simulate with a seed, and chunks are buffered in order. At
+  most about prefetch samples are kept, and the workers pause while the buffer
+  is full. The samples are serialized in the workers, so a request only joins
+  strings.
+  """
+
+  def __init__(self,
+               cg,
+               inter,
+               num_workers=1,
+               seed=None,
+               chunk_size=100,
+               prefetch=10000,
+               json_encoder="json"):
+    self.cg = cg
+    self.inter = inter
+    self.num_workers = max(1, num_workers)
+    if seed is None:
+      seed = np.random.randint(0, 2**31 - 1)
+    self.seed = seed
+    self.chunk_size = chunk_size
+    self.prefetch = prefetch
+    self.json_encoder = json_encoder
+    self.buffer = collections.deque()
+    self.condition = None
+    self.error = None
+    self.stats = {"produced": 0, "served": 0, "requests": 0, "clients": 0}
+
+  def get_stats(self):
+    stats = dict(self.stats)
+    stats["buffered"] = len(self.buffer)
+    return stats
+
+  def _buffer_full(self):
+    return len(self.buffer) >= self.prefetch
+
+  async def _fill(self, executor):
+    """keeps the buffer filled with the chunks of the workers, in order."""
+    loop = asyncio.get_running_loop()
+    pending = collections.deque()
+    chunk_index = 0
+    try:
+      while True:
+        while (len(pending) < 2 * self.num_workers and
+               len(self.buffer) + len(pending) * self.chunk_size <
+               self.prefetch):
+          pending.append(
+              loop.run_in_executor(executor, simulator_lib.simulate_chunk,
+                                   (self.seed, chunk_index,
+                                    chunk_index * self.chunk_size,
+                                    self.chunk_size)))
+          chunk_index += 1
+        if not pending:
+          async with self.condition:
+            await self.condition.wait_for(lambda: not self._buffer_full())
+          continue
+        data_lines, kb_lines, _, _ = await pending.popleft()
+        samples = [
+            "{\"data\": " + data + ", \"kb\": " + kb + "}" for data, kb in
+            zip(_split_lines(data_lines), _split_lines(kb_lines))
+        ]
+        async with self.condition:
+          self.buffer.extend(samples)
+          self.stats["produced"] += len(samples)
+          self.condition.notify_all()
+    except Exception as e:  # pylint: disable=broad-except
+      async with self.condition:
+        self.error = e
+        self.condition.notify_all()
+      raise
+
+  async def get_samples(self, num_samples):
+    """waits for num_samples serialized samples and takes them."""
+    if num_samples < 1 or num_samples > self.prefetch:
+      raise ValueError("num_samples has to be between 1 and " +
+                       str(self.prefetch))
+    async with self.condition:
+      await self.condition.wait_for(
+          lambda: len(self.buffer) >= num_samples or self.error is not None)
+      if self.error is not None:
+        raise RuntimeError("simulation failed: " + repr(self.error))
+      samples = [self.buffer.popleft() for _ in range(num_samples)]
+      self.stats["served"] += num_samples
+      self.condition.notify_all()
+    return samples
+
+  async def _respond(self, line):
+    """returns the response line of a request line."""
+    try:
+      request = json.loads(line)
+      op = request.get("op")
+      if op == "get":
+        samples = await self.get_samples(int(request.get("num_samples", 1)))
+        return "{\"samples\": [" + ", ".join(samples) + "]}\n"
+      elif op == "stats":
+        return json.dumps({"stats": self.get_stats()}) + "\n"
+      raise ValueError("unknown op: " + str(op))
+    except (ValueError, TypeError, AttributeError, RuntimeError) as e:
+      return json.dumps({"error": str(e)}) + "\n"
+
+  async def _handle(self, reader, writer):
+    self.stats["clients"] += 1
+    try:
+      while True:
+        line = await reader.readline()
+        if not line:
+          break
+        self.stats["requests"] += 1
+        response = await self._respond(line)
+        writer.write(response.encode("utf-8"))
+        await writer.drain()
+    except ConnectionError:
+      pass
+    finally:
+      self.stats["clients"] -= 1
+      writer.close()
+
+  async def serve(self, socket_path=None, host="localhost", port=8765,
+                  ready=None):
+    """serves until cancelled, on socket_path if given and host:port if not.
+
+    ready is called with the listening asyncio server once it accepts clients.
+    """
+    self.condition = asyncio.Condition()
+    executor = concurrent.futures.ProcessPoolExecutor(
+        self.num_workers,
+        initializer=simulator_lib.init_worker,
+        initargs=(self.cg, self.inter, self.json_encoder))
+    fill = asyncio.ensure_future(self._fill(executor))
+    try:
+      if socket_path:
+        server = await asyncio.start_unix_server(self._handle, path=socket_path)
+      else:
+        server = await asyncio.start_server(self._handle, host, port)
+      async with server:
+        if ready is not None:
+          ready(server)
+        await server.serve_forever()
+    finally:
+      if fill.done() and not fill.cancelled():
+        # the error has been passed to the clients, mark it as retrieved.
+        fill.exception()
+      fill.cancel()
+      executor.shutdown(wait=False)
+
+
+def add_arguments(parser):
+  """Build ArgumentParser."""
+  simulator_main.add_arguments(parser)
+  parser.add_argument("--socket", type=str, default=None,
+                      help="path of the unix socket to listen on. localhost "
+                      "tcp is used if it is not given.")
+  parser.add_argument("--host", type=str, default="localhost",
+                      help="host to listen on.")
+  parser.add_argument("--port", type=int, default=8765,
+                      help="port to listen on.")
+  parser.add_argument("--prefetch", type=int, default=10000,
+                      help="number of samples that are simulated ahead of "
+                      "requests.")
+
+
+def main(FLAGS):
+  cg, inter = simulator_main.build_simulator(FLAGS)
+  server = SimulatorServer(
+      cg,
+      inter,
+      num_workers=FLAGS.num_workers,
+      seed=FLAGS.seed,
+      chunk_size=min(FLAGS.chunk_size, FLAGS.prefetch),
+      prefetch=FLAGS.prefetch,
+      json_encoder=FLAGS.json_encoder)
+
+  def ready(listening_server):
+    if FLAGS.verbose:
+      for sock in listening_server.sockets:
+        print("serving simulated samples on", sock.getsockname())
+
+  try:
+    asyncio.run(server.serve(FLAGS.socket, FLAGS.host, FLAGS.port, ready))
+  except KeyboardInterrupt:
+    pass
+
+
+if __name__ == "__main__":
+  this_parser = argparse.ArgumentParser()
+  add_arguments(this_parser)
+  FLAGS, unparsed = this_parser.parse_known_args()
+  main(FLAGS)
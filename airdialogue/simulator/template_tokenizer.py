@@ -0,0 +1,195 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tokenizes simulated utterances from cached template and slot tokens.
+
+Every template is tokenized once with a placeholder in each of its slots, and
+every slot value is tokenized once on its own. The tokens of an utterance are
+then put together from the two caches instead of running the tokenizers of
+prepro on every turn. The first time a template is filled with a new value in
+one of its slots the result is checked against the tokenizers of prepro, and
+templates that do not tokenize the same way are always tokenized directly.
+Values are checked one slot at a time, not in every combination with the
+values of the other slots, so an utterance whose tokens depend on the values
+of two slots together may differ from prepro; verify_all checks every one.
+"""
+
+import collections
+
+import nltk
+
+from airdialogue.prepro import tokenize_lib
+
+_PLACEHOLDER = 'xxslot{0}xx'
+
+
+class Template(str):
+  """A template whose format also returns the tokens of the utterance."""
+
+  def format(self, *args):
+    return self.tokenizer.fill(self, args)
+
+
+class Utterance(str):
+  """An utterance with its tokenized content."""
+
+
+def _lru_get(cache, key):
+  """returns whether key is in the OrderedDict cache, and marks it as used."""
+  if key not in cache:
+    return False
+  cache.move_to_end(key)
+  return True
+
+
+def _lru_put(cache, key, value, max_size):
+  """adds key to the OrderedDict cache, dropping the least recently used."""
+  cache[key] = value
+  if len(cache) > max_size:
+    cache.popitem(last=False)
+
+
+class TemplateTokenizer(object):
+  """Tokenizes utterances from templates like prepro does.
+
+  sent_tok and word_tok are the tokenizers that prepro uses. With verify_all,
+  every utterance is checked against them, which is only useful for debugging.
+  The slot values, texts and verified values are kept for the max_cache_size
+  most recently used of each; templates are the fixed texts of the simulator.
+  """
+
+  def __init__(self,
+               sent_tok=None,
+               word_tok=None,
+               verify_all=False,
+               max_cache_size=100000):
+    self.sent_tok = sent_tok or nltk.sent_tokenize
+    self.word_tok = word_tok or tokenize_lib.word_tokenize
+    self.verify_all = verify_all
+    self.max_cache_size = max_cache_size
+    self.templates = {}
+    # tokens of a template with placeholders, or None if it can not be composed
+    self.template_tokens = {}
+    self.slot_tokens = collections.OrderedDict()
+    self.text_tokens = collections.OrderedDict()
+    # (template, slot index, value) that have been verified, as keys
+    self.verified = collections.OrderedDict()
+    self.stats = {'composed': 0, 'direct': 0, 'verified': 0, 'mismatch': 0}
+
+  def tokenize(self, text):
+    """returns the space separated tokens of the content of a turn."""
+    return tokenize_lib.tokenize_turn(text.strip(), self.sent_tok,
+                                      self.word_tok)
+
+  def tokenize_text(self, text):
+    """same as tokenize, but cached. only used for texts without slots."""
+    if not _lru_get(self.text_tokens, text):
+      _lru_put(self.text_tokens, text, self.tokenize(text),
+               self.max_cache_size)
+    return self.text_tokens[text]
+
+  def template(self, text):
+    """returns the Template of text. tuples of texts are converted as well."""
+    if isinstance(text, tuple):
+      return tuple(self.template(t) for t in text)
+    if text not in self.templates:
+      template = Template(text)
+      template.tokenizer = self
+      self.templates[text] = template
+    return self.templates[text]
+
+  def _get_template_tokens(self, template, num_slots):
+    if template not in self.template_tokens:
+      placeholders = [_PLACEHOLDER.format(i) for i in range(num_slots)]
+      tokens = self.tokenize(str.format(template, *placeholders)).split(' ')
+      slots = []
+      for token in tokens:
+        if token in placeholders:
+          slots.append(placeholders.index(token))
+        elif 'xxslot' in token:
+          # a placeholder that is merged with its neighbours
+          tokens = None
+          break
+        else:
+          slots.append(None)
+      self.template_tokens[template] = tokens and list(zip(tokens, slots))
+    return self.template_tokens[template]
+
+  def _get_slot_tokens(self, value):
+    if not _lru_get(self.slot_tokens, value):
+      _lru_put(self.slot_tokens, value, self.word_tok(value),
+               self.max_cache_size)
+    return self.slot_tokens[value]
+
+  def _compose(self, template_tokens, values):
+    tokens = []
+    for token, slot in template_tokens:
+      if slot is None:
+        tokens.append(token)
+      else:
+        tokens.extend(self._get_slot_tokens(values[slot]))
+    return ' '.join(tokens)
+
+  def fill(self, template, args):
+    """formats template with args and returns it as an Utterance."""
+    utterance = Utterance(str.format(template, *args))
+    values = [str(arg) for arg in args]
+    template_tokens = self._get_template_tokens(template, len(values))
+    if template_tokens is None:
+      self.stats['direct'] += 1
+      utterance.tokens = self.tokenize(utterance)
+      return utterance
+    utterance.tokens = self._compose(template_tokens, values)
+    self.stats['composed'] += 1
+    new_keys = [(template, i, v)
+                for i, v in enumerate(values)
+                if not _lru_get(self.verified, (template, i, v))]
+    if new_keys or self.verify_all:
+      self.stats['verified'] += 1
+      expected = self.tokenize(utterance)
+      if expected != utterance.tokens:
+        # this template depends on its context, stop composing it.
+        self.stats['mismatch'] += 1
+        self.template_tokens[template] = None
+        utterance.tokens = expected
+      else:
+        for key in new_keys:
+          _lru_put(self.verified, key, None, self.max_cache_size)
+    return utterance
+
+  def turn(self, turn, utterance):
+    """returns turn as an Utterance with the tokens of its utterance."""
+    turn = Utterance(turn)
+    turn.tokens = getattr(utterance, 'tokens', None)
+    if turn.tokens is None:
+      turn.tokens = self.tokenize_text(utterance)
+    return turn
+
+  def tokenize_dialogue(self, turns):
+    """returns the tokenized turns and boundaries of a dialogue like prepro.
+
+    turns are the turns of the dialogue with their speaker prefix, as returned
+    by turn.
+    """
+    tokenized_turns = []
+    for i, turn in enumerate(turns):
+      content, sot, eot = tokenize_lib.split_turn(turn)
+      tokens = getattr(turn, 'tokens', None)
+      if tokens is None:
+        tokens = self.tokenize(content)
+      tokenized_turns.append(
+          tokenize_lib.format_turn(tokens, sot, eot, i == len(turns) - 1))
+    _, boundaries1, boundaries2 = tokenize_lib.get_tokenized_dialogue(
+        tokenized_turns)
+    return tokenized_turns, boundaries1, boundaries2
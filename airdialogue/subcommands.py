@@ -0,0 +1,30 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""The subcommands of the airdialogue script and their modules.
+
+Each module provides add_arguments and main. Only the module of the requested
+subcommand is imported, so that subcommands do not pay for the dependencies of
+the others (e.g. flask, nltk). This module must stay free of such imports.
+"""
+
+SUBCOMMANDS = {
+    'contextgen': 'airdialogue.context_generator.context_generator_main',
+    'prepro': 'airdialogue.prepro.prepro_main',
+    'sim': 'airdialogue.simulator.simulator_main',
+    'sim_server': 'airdialogue.simulator.simulator_server',
+    'vis': 'airdialogue.visualizer.visualizer_main',
+    'score': 'airdialogue.evaluator.evaluator_main',
+    'generate_infer': 'airdialogue.generate_infer.generate_infer_main',
+}
@@ -14,7 +14,7 @@
 
 """Utility function for the visualizer."""
 import json
-from tensorflow.compat.v1 import gfile
+from airdialogue import file_io
 
 
 def generate_kv_nested_html(nested_kv, space):
@@ -152,5 +152,5 @@ def generate_html(sample,
 
 
 def make_path(path):
-  if not gfile.Exists(path):
-    gfile.MkDir(path)
+  if not file_io.Exists(path):
+    file_io.MkDir(path)
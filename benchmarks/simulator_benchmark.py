@@ -0,0 +1,156 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures the throughput of context generation and dialogue simulation.
+
+For every combination of num_db_record and num_candidate_airports, contexts
+are generated with ContextGenerator.iter_contexts and their dialogues are
+simulated with Interaction.generate_dialogue, and with
+BatchInteraction.generate_dialogues if --batch_size is given. The best samples
+per second of --repeats runs are reported, and appended to --output_json as
+json lines to compare runs over time.
+
+  python benchmarks/simulator_benchmark.py --num_db_records 10,30,100 \\
+      --num_candidate_airports 3,5 --firstname_file first_names.txt \\
+      --lastname_file last_names.txt --airportcode_file airport.txt
+"""
+
+import argparse
+import json
+import random
+import time
+import numpy as np
+
+from airdialogue.context_generator import context_generator_lib
+from airdialogue.simulator import batch_interaction
+from airdialogue.simulator import interaction
+
+
+def add_arguments(parser):
+  """Build ArgumentParser."""
+  parser.add_argument(
+      '--num_samples', type=int, default=2000, help='samples per run.')
+  parser.add_argument(
+      '--repeats', type=int, default=3, help='runs per setting.')
+  parser.add_argument(
+      '--num_db_records',
+      type=str,
+      default='10,30,100',
+      help='comma separated values of num_db_record.')
+  parser.add_argument(
+      '--num_candidate_airports',
+      type=str,
+      default='3,5',
+      help='comma separated values of num_candidate_airports.')
+  parser.add_argument(
+      '--batch_size',
+      type=int,
+      default=0,
+      help='if positive, batched dialogue simulation is measured as well.')
+  parser.add_argument(
+      '--output_json',
+      type=str,
+      default=None,
+      help='file that the results are appended to as json lines.')
+  parser.add_argument(
+      '--firstname_file',
+      type=str,
+      default='./data/resources/meta_context/first_names.txt',
+      help='text file that contains a list of first names.')
+  parser.add_argument(
+      '--lastname_file',
+      type=str,
+      default='./data/resources/meta_context/last_names.txt',
+      help='text file that contains a list of last names.')
+  parser.add_argument(
+      '--airportcode_file',
+      type=str,
+      default='./data/resources/meta_context/airport.txt',
+      help='text file that contains a list of airport codes.')
+
+
+def best_rate(func, num_samples, repeats):
+  """returns the best samples per second of func and its last result."""
+  best = 0
+  result = None
+  for i in range(repeats):
+    random.seed(i)
+    np.random.seed(i)
+    start = time.time()
+    result = func()
+    best = max(best, num_samples / max(time.time() - start, 1e-9))
+  return best, result
+
+
+def measure(flags, num_db_record, num_candidate_airports):
+  """returns the samples per second of every stage for one setting."""
+  cg = context_generator_lib.ContextGenerator(
+      num_candidate_airports=num_candidate_airports,
+      book_window=2,
+      num_db_record=num_db_record,
+      firstname_file=flags.firstname_file,
+      lastname_file=flags.lastname_file,
+      airportcode_file=flags.airportcode_file)
+  n = flags.num_samples
+  result = {
+      'num_db_record': num_db_record,
+      'num_candidate_airports': num_candidate_airports,
+      'num_samples': n
+  }
+  result['contexts_per_second'], contexts = best_rate(
+      lambda: list(cg.iter_contexts(n, output_object=True)), n, flags.repeats)
+  customers = [cus for cus, _, _ in contexts]
+  kbs = [kb for _, kb, _ in contexts]
+  kwargs = dict(random_respond_error=True)
+  inter = interaction.Interaction(cg.fact_obj, **kwargs)
+  result['dialogues_per_second'], _ = best_rate(
+      lambda: [inter.generate_dialogue(c, k) for c, k in zip(customers, kbs)],
+      n, flags.repeats)
+  if flags.batch_size > 0:
+    batch_inter = batch_interaction.BatchInteraction(
+        cg.fact_obj, batch_size=flags.batch_size, **kwargs)
+
+    def simulate_batches():
+      for start in range(0, n, flags.batch_size):
+        end = start + flags.batch_size
+        batch_inter.generate_dialogues(customers[start:end], kbs[start:end])
+
+    result['batch_dialogues_per_second'], _ = best_rate(
+        simulate_batches, n, flags.repeats)
+  return result
+
+
+def main(flags):
+  columns = ['contexts_per_second', 'dialogues_per_second']
+  if flags.batch_size > 0:
+    columns.append('batch_dialogues_per_second')
+  print('{0:>14}{1:>10}'.format('num_db_record', 'airports') +
+        ''.join('{0:>18}'.format(c.replace('_per_second', '/s'))
+                for c in columns))
+  for num_db_record in flags.num_db_records.split(','):
+    for num_airports in flags.num_candidate_airports.split(','):
+      result = measure(flags, int(num_db_record), int(num_airports))
+      print('{0:>14}{1:>10}'.format(num_db_record, num_airports) +
+            ''.join('{0:>18.1f}'.format(result[c]) for c in columns))
+      if flags.output_json:
+        result['time'] = time.time()
+        with open(flags.output_json, 'a') as f:
+          f.write(json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+  this_parser = argparse.ArgumentParser()
+  add_arguments(this_parser)
+  FLAGS, _ = this_parser.parse_known_args()
+  main(FLAGS)
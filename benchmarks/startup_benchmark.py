@@ -0,0 +1,118 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures the startup cost of the airdialogue subcommands.
+
+Every subcommand module is imported in a fresh interpreter, the same way the
+airdialogue script dispatches to it. The wall time of the import and the peak
+resident memory of the interpreter are reported. For comparison, the eager
+baseline imports the modules of all subcommands, as the script did before it
+dispatched lazily, with and without tensorflow, through which all file access
+used to go. Modules that are not installed are left out of a baseline and
+listed next to it. The speedup of a subcommand is relative to eager.
+
+  python benchmarks/startup_benchmark.py --repeats 5
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+from airdialogue.subcommands import SUBCOMMANDS
+
+
+_PROBE = """
+import importlib, json, resource, time
+missing = []
+start = time.time()
+for module in {modules!r}:
+  try:
+    importlib.import_module(module)
+  except ImportError:
+    missing.append(module)
+seconds = time.time() - start
+rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+result = {{"seconds": seconds, "rss_mb": rss_mb, "missing": missing}}
+print(json.dumps(result))
+"""
+
+
+def add_arguments(parser):
+  """Build ArgumentParser."""
+  parser.add_argument(
+      '--subcommands',
+      type=str,
+      default=','.join(SUBCOMMANDS),
+      help='comma separated subcommands to measure.')
+  parser.add_argument(
+      '--repeats', type=int, default=3, help='interpreters per subcommand.')
+
+
+def measure(modules, repeats):
+  """returns the median import time, peak rss and missing modules, or None."""
+  all_seconds = []
+  all_rss = []
+  for _ in range(repeats):
+    proc = subprocess.run([sys.executable, '-c', _PROBE.format(modules=modules)],
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    if proc.returncode != 0:
+      return None
+    result = json.loads(proc.stdout.strip().split('\n')[-1])
+    all_seconds.append(result['seconds'])
+    all_rss.append(result['rss_mb'])
+  return (sorted(all_seconds)[len(all_seconds) // 2], max(all_rss),
+          result['missing'])
+
+
+def main(flags):
+  eager = list(SUBCOMMANDS.values())
+  baselines = [('eager', eager),
+               ('eager+tf', eager + ['tensorflow.compat.v1'])]
+  eager_seconds = None
+  print('{0:<16}{1:>12}{2:>12}{3:>12}'.format('subcommand', 'import (s)',
+                                              'rss (MB)', 'speedup'))
+  for name, modules in baselines:
+    result = measure(modules, flags.repeats)
+    if result is None:
+      print('{0:<16}{1:>24}'.format(name, 'import failed'))
+      continue
+    seconds, rss_mb, missing = result
+    if eager_seconds is None:
+      eager_seconds = seconds
+    line = '{0:<16}{1:>12.3f}{2:>12.1f}{3:>12}'.format(name, seconds, rss_mb,
+                                                       '')
+    if missing:
+      line += '  without ' + ', '.join(missing)
+    print(line)
+  for name in flags.subcommands.split(','):
+    result = measure([SUBCOMMANDS[name]], flags.repeats)
+    if result is None or result[2]:
+      print('{0:<16}{1:>24}'.format(name, 'import failed'))
+      continue
+    seconds, rss_mb, _ = result
+    speedup = ''
+    if eager_seconds is not None:
+      speedup = '{0:.1f}x'.format(eager_seconds / seconds)
+    print('{0:<16}{1:>12.3f}{2:>12.1f}{3:>12}'.format(name, seconds, rss_mb,
+                                                     speedup))
+
+
+if __name__ == '__main__':
+  this_parser = argparse.ArgumentParser()
+  add_arguments(this_parser)
+  FLAGS, _ = this_parser.parse_known_args()
+  main(FLAGS)
@@ -0,0 +1,151 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures the rendering of utterances from compiled templates.
+
+The utterances with slots of a dialogue (the name, the cities, a full and a
+short flight suggestion and the confirmation) are rendered for every context,
+once with Interaction and once with a variant that formats the raw templates
+with str.format, utils.format_time and utils.get_connection. The best time
+per dialogue of each is reported, next to the time of a whole dialogue.
+
+  python benchmarks/template_benchmark.py --num_dialogues 5000 \\
+      --firstname_file first_names.txt --lastname_file last_names.txt \\
+      --airportcode_file airport.txt
+"""
+
+import argparse
+import random
+import time
+import numpy as np
+
+from airdialogue.context_generator import context_generator_lib
+from airdialogue.context_generator.src import utils
+from airdialogue.simulator import interaction
+
+
+class UncompiledInteraction(interaction.Interaction):
+  """Interaction that formats the raw templates for every utterance."""
+
+  def template(self, text):
+    return text
+
+  def generate_confirmation(self, flight, full=True, tmp=None, rng=None):
+    if full:
+      if tmp is None:
+        tmp = self.get_template(interaction.agent_suggestion['full'], rng)
+      return tmp.format(
+          flight['flight_number'], flight['departure_airport'],
+          flight['departure_month'] + ' ' + str(flight['departure_day']),
+          utils.format_time(flight['departure_time_num']),
+          flight['return_airport'],
+          flight['return_month'] + ' ' + str(flight['return_day']),
+          utils.format_time(flight['return_time_num']), flight['class'],
+          utils.get_connection(flight['num_connections']), flight['price'])
+    if tmp is None:
+      tmp = self.get_template(interaction.agent_suggestion['without_cd'], rng)
+    return tmp.format(flight['flight_number'],
+                      utils.format_time(flight['departure_time_num']),
+                      utils.format_time(flight['return_time_num']),
+                      flight['class'],
+                      utils.get_connection(flight['num_connections']),
+                      flight['price'])
+
+
+def add_arguments(parser):
+  """Build ArgumentParser."""
+  parser.add_argument(
+      '--num_dialogues', type=int, default=5000, help='dialogues to simulate.')
+  parser.add_argument(
+      '--repeats', type=int, default=5, help='runs per interaction.')
+  parser.add_argument(
+      '--firstname_file',
+      type=str,
+      default='./data/resources/meta_context/first_names.txt',
+      help='text file that contains a list of first names.')
+  parser.add_argument(
+      '--lastname_file',
+      type=str,
+      default='./data/resources/meta_context/last_names.txt',
+      help='text file that contains a list of last names.')
+  parser.add_argument(
+      '--airportcode_file',
+      type=str,
+      default='./data/resources/meta_context/airport.txt',
+      help='text file that contains a list of airport codes.')
+
+
+def render(inter, slots):
+  """renders the utterances with slots of every dialogue."""
+  for name, depart, ret, flight in slots:
+    inter.get_template(interaction.cutomer_name).format(name)
+    inter.get_template(interaction.customer_first_respond['c1c2']).format(
+        depart, ret)
+    inter.generate_confirmation(flight, True)
+    inter.generate_confirmation(flight, False)
+    inter.get_template(interaction.agent_confirm_change['book']).format(
+        flight['flight_number'])
+
+
+def simulate(inter, contexts):
+  for cus, kb, _ in contexts:
+    inter.generate_dialogue(cus, kb)
+
+
+def measure(func, inter, items, repeats):
+  """returns the best time of func(inter, items) per item."""
+  best = None
+  for _ in range(repeats):
+    start = time.time()
+    func(inter, items)
+    seconds = (time.time() - start) / len(items)
+    best = seconds if best is None else min(best, seconds)
+  return best
+
+
+def main(flags):
+  random.seed(0)
+  np.random.seed(0)
+  cg = context_generator_lib.ContextGenerator(
+      num_candidate_airports=3,
+      book_window=2,
+      num_db_record=30,
+      firstname_file=flags.firstname_file,
+      lastname_file=flags.lastname_file,
+      airportcode_file=flags.airportcode_file)
+  contexts = list(cg.iter_contexts(flags.num_dialogues, output_object=True))
+  slots = []
+  for cus, kb, _ in contexts:
+    condition = cus.get_customer_condition()
+    slots.append((condition['name'], condition['departure_airport'],
+                  condition['return_airport'], kb.get_json()['kb'][0]))
+  compiled = interaction.Interaction(cg.fact_obj)
+  uncompiled = UncompiledInteraction(cg.fact_obj)
+  if [compiled.generate_confirmation(s[-1]) for s in slots] != [
+      uncompiled.generate_confirmation(s[-1]) for s in slots
+  ]:
+    raise ValueError('compiled templates render different utterances.')
+  dialogue = measure(simulate, compiled, contexts, 1)
+  print('{0:<16}{1:>16}'.format('templates', 'us / dialogue'))
+  for name, inter in [('str.format', uncompiled), ('compiled', compiled)]:
+    seconds = measure(render, inter, slots, flags.repeats)
+    print('{0:<16}{1:>16.1f}'.format(name, seconds * 1e6))
+  print('{0:<16}{1:>16.1f}'.format('whole dialogue', dialogue * 1e6))
+
+
+if __name__ == '__main__':
+  this_parser = argparse.ArgumentParser()
+  add_arguments(this_parser)
+  FLAGS, _ = this_parser.parse_known_args()
+  main(FLAGS)